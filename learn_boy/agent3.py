@@ -1,13 +1,20 @@
+import time
 import asyncio
+import weakref
+import threading
 from typing import Literal, TypedDict, Annotated, List, Dict, Any
-from langchain_core.tools import tool
-from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage
+from langchain_core.tools import tool, InjectedToolCallId
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage, ToolMessage
 from langgraph.graph import StateGraph
 from langgraph.graph.message import add_messages
 # 修正 ToolNode 的导入路径
-from langchain.agents.tool_node import ToolNode
+from langchain.agents.tool_node import ToolNode, InjectedState
+from langgraph.types import Command
+from pydantic import BaseModel, Field, ValidationError
+from langchain_core.exceptions import OutputParserException
 from langchain_core.runnables import RunnableConfig
-from langchain_openai import ChatOpenAI # 从 langchain_openai 导入
+from model_registry import get_chat_model, aclose_http_clients
+from metrics import TurnMetrics, agent_run_name, format_turn_summary, record_queue_time
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.utils.function_calling import convert_to_openai_tool
 from dotenv import load_dotenv
@@ -28,16 +35,13 @@ class State(TypedDict):
 # --- 2. 定义工具 ---
 
 @tool
-def get_user_background_tool(query: str) -> Dict[str, str]:
+async def get_user_background_tool(query: str) -> Dict[str, str]:
     """
     从用户输入中分析并提取其专业水平和职业背景。
     这个工具会分析消息历史和当前输入，更新状态中的 user_profile。
     """
-    # 从环境变量获取 DeepSeek API 密钥
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if not api_key:
-        raise ValueError("DEEPSEEK_API_KEY 环境变量未设置")
-    llm = ChatOpenAI(model="deepseek-chat", temperature=0.0, base_url="https://api.deepseek.com", api_key=api_key)
+    # 复用进程级共享的模型实例（连接池 + keep-alive），不再每次调用都新建客户端
+    llm = get_chat_model(temperature=0.0)
     prompt = f"""
     请从以下用户输入中分析并提取出其专业水平和职业背景。
     专业水平选项: ['0基础', '有基础', '进阶', '专家']
@@ -46,7 +50,7 @@ def get_user_background_tool(query: str) -> Dict[str, str]:
     用户输入: {query}
     请以 JSON 格式返回结果。
     """
-    response = llm.invoke([HumanMessage(content=prompt)])
+    response = await llm.ainvoke([HumanMessage(content=prompt)])
     try:
         result = json.loads(response.content.strip())
         return result
@@ -54,30 +58,24 @@ def get_user_background_tool(query: str) -> Dict[str, str]:
         return {"level": "unknown", "career": "unknown"}
 
 @tool
-def identify_topic_tool(query: str) -> str:
+async def identify_topic_tool(query: str) -> str:
     """
     从用户查询中识别出核心知识点。
     """
-    # 从环境变量获取 DeepSeek API 密钥
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if not api_key:
-        raise ValueError("DEEPSEEK_API_KEY 环境变量未设置")
-    llm = ChatOpenAI(model="deepseek-chat", temperature=0.0, base_url="https://api.deepseek.com", api_key=api_key)
+    # 复用进程级共享的模型实例（连接池 + keep-alive），不再每次调用都新建客户端
+    llm = get_chat_model(temperature=0.0)
     prompt = f"请从以下用户问题中提取出核心学习知识点，只返回知识点名称，不要其他内容。用户问题: {query}"
-    response = llm.invoke([HumanMessage(content=prompt)])
+    response = await llm.ainvoke([HumanMessage(content=prompt)])
     topic = response.content.strip()
     return topic
 
 @tool
-def adjust_explanation_depth_tool(topic: str, level: str) -> str:
+async def adjust_explanation_depth_tool(topic: str, level: str) -> str:
     """
     根据用户水平生成不同深度的解释。
     """
-    # 从环境变量获取 DeepSeek API 密钥
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if not api_key:
-        raise ValueError("DEEPSEEK_API_KEY 环境变量未设置")
-    llm = ChatOpenAI(model="deepseek-chat", temperature=0.3, base_url="https://api.deepseek.com", api_key=api_key)
+    # 复用进程级共享的模型实例（连接池 + keep-alive），不再每次调用都新建客户端
+    llm = get_chat_model(temperature=0.3)
     prompt = f"""
     请为 '{topic}' 提供解释，要求如下：
     - 用户水平: {level}
@@ -86,19 +84,16 @@ def adjust_explanation_depth_tool(topic: str, level: str) -> str:
     - 如果是 '进阶' 或 '专家'，请提供更深入的技术细节。
     - 如果水平是 'unknown'，请提供中等深度的解释。
     """
-    response = llm.invoke([HumanMessage(content=prompt)])
+    response = await llm.ainvoke([HumanMessage(content=prompt)])
     return response.content
 
 @tool
-def provide_contextual_examples_tool(topic: str, career: str) -> str:
+async def provide_contextual_examples_tool(topic: str, career: str) -> str:
     """
     根据用户职业提供相关例子。
     """
-    # 从环境变量获取 DeepSeek API 密钥
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if not api_key:
-        raise ValueError("DEEPSEEK_API_KEY 环境变量未设置")
-    llm = ChatOpenAI(model="deepseek-chat", temperature=0.3, base_url="https://api.deepseek.com", api_key=api_key)
+    # 复用进程级共享的模型实例（连接池 + keep-alive），不再每次调用都新建客户端
+    llm = get_chat_model(temperature=0.3)
     prompt = f"""
     请为 '{topic}' 提供例子，要求如下：
     - 用户职业: {career}
@@ -107,19 +102,16 @@ def provide_contextual_examples_tool(topic: str, career: str) -> str:
     - 如果职业是 '学生'，请提供校园生活或学习场景应用。
     - 如果职业是 '其他' 或 'unknown'，请提供通用例子。
     """
-    response = llm.invoke([HumanMessage(content=prompt)])
+    response = await llm.ainvoke([HumanMessage(content=prompt)])
     return response.content
 
 @tool
-def make_knowledge_connections_tool(topic: str, previous_topics: List[str]) -> List[str]:
+async def make_knowledge_connections_tool(topic: str, previous_topics: List[str]) -> List[str]:
     """
     生成知识连接信息。这里使用 LLM 来模拟知识连接的生成。
     """
-    # 从环境变量获取 DeepSeek API 密钥
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if not api_key:
-        raise ValueError("DEEPSEEK_API_KEY 环境变量未设置")
-    llm = ChatOpenAI(model="deepseek-chat", temperature=0.1, base_url="https://api.deepseek.com", api_key=api_key)
+    # 复用进程级共享的模型实例（连接池 + keep-alive），不再每次调用都新建客户端
+    llm = get_chat_model(temperature=0.1)
     previous_topics_str = ", ".join(previous_topics)
     prompt = f"""
     请为知识点 '{topic}' 提供知识连接分析，基于以下信息：
@@ -133,7 +125,7 @@ def make_knowledge_connections_tool(topic: str, previous_topics: List[str]) -> L
     请返回一个包含连接信息的列表，例如 ["联系1", "建议1", "历史/前沿1"]。
     如果无法找到联系或建议，请返回一个包含通用信息的列表。
     """
-    response = llm.invoke([HumanMessage(content=prompt)])
+    response = await llm.ainvoke([HumanMessage(content=prompt)])
     try:
         connections = json.loads(response.content.strip())
         return connections
@@ -149,36 +141,123 @@ def update_user_profile_tool(new_info: Dict[str, Any]) -> str:
     print(f"模拟更新用户画像到数据库: {new_info}")
     return f"用户画像更新完成: {new_info}"
 
-# --- 3. 定义 Agent 逻辑节点 ---
-async def agent_node(state: State, config: RunnableConfig):
+# 一次性查询分析的结构化输出格式，模型返回后由 pydantic 校验
+class QueryAnalysis(BaseModel):
+    """用户输入的分析结果"""
+    level: Literal['0基础', '有基础', '进阶', '专家', 'unknown'] = Field(description="用户的专业水平，不明确时为 unknown")
+    career: Literal['学生', '程序员', '商业人士', '设计师', '教师', '其他', 'unknown'] = Field(description="用户的职业背景，不明确时为 unknown")
+    topic: str = Field(description="用户本轮想学习的核心知识点名称，没有时为空字符串")
+    previous_topics: List[str] = Field(default_factory=list, description="用户在之前的对话中问过的知识点")
+
+@tool
+async def analyze_query_tool(
+    query: str,
+    state: Annotated[dict, InjectedState],
+    tool_call_id: Annotated[str, InjectedToolCallId],
+) -> Command:
     """
-    Agent 的核心逻辑节点。
-    它根据当前状态和消息，决定下一步是生成 AI 回复还是调用工具。
+    一次性分析用户输入：提取专业水平、职业背景、核心知识点以及之前问过的知识点。
+    结果会写入状态，本轮对话中只需调用一次。
+    """
+    llm = get_chat_model(temperature=0.0)
+    # DeepSeek 不支持 json_schema 模式，使用函数调用返回结构化结果
+    structured_llm = llm.with_structured_output(QueryAnalysis, method="function_calling")
+    known_profile = state.get("user_profile") or {}
+    previous_questions = [m.content for m in state["messages"][:-1] if isinstance(m, HumanMessage)][-5:]
+    prompt = f"""
+    请分析用户输入，提取以下信息：
+    - level: 专业水平，选项 ['0基础', '有基础', '进阶', '专家']，不明确时为 'unknown'
+    - career: 职业背景，选项 ['学生', '程序员', '商业人士', '设计师', '教师', '其他']，不明确时为 'unknown'
+    - topic: 本轮想学习的核心知识点名称
+    - previous_topics: 之前的用户问题中涉及的知识点
+    已知用户画像: {json.dumps(known_profile, ensure_ascii=False)}
+    之前的用户问题: {json.dumps(previous_questions, ensure_ascii=False)}
+    当前用户输入: {query}
+    """
+    try:
+        analysis = await structured_llm.ainvoke([HumanMessage(content=prompt)])
+    except (OutputParserException, ValidationError, ValueError, KeyError) as e:
+        # 只有结构化结果解析/校验失败时退化为全部未知，由 Agent 向用户追问；
+        # 网络、鉴权、限流等错误照常抛出，交给 ToolNode 的错误处理，不能当成"用户背景未知"
+        print(f"查询分析结果解析失败，按未知处理: {e}")
+        analysis = None
+    if analysis is None:
+        # 模型没有调用结构化输出的函数时解析结果为 None
+        analysis = QueryAnalysis(level="unknown", career="unknown", topic="")
+
+    # 本轮没有提到的信息沿用已知画像
+    user_profile = {
+        "level": analysis.level if analysis.level != "unknown" else known_profile.get("level", "unknown"),
+        "career": analysis.career if analysis.career != "unknown" else known_profile.get("career", "unknown"),
+    }
+    result = {**user_profile, "topic": analysis.topic, "previous_topics": analysis.previous_topics}
+    return Command(update={
+        "user_profile": user_profile,
+        "current_topic": analysis.topic,
+        "messages": [ToolMessage(content=json.dumps(result, ensure_ascii=False),
+                                 name="analyze_query_tool", tool_call_id=tool_call_id)],
+    })
+
+# 是否使用一次性查询分析代替"背景分析 + 知识点识别"两次模型调用
+FUSED_QUERY_ANALYSIS = os.getenv("AGENT3_FUSED_QUERY_ANALYSIS", "1") == "1"
+
+# 分别调用背景分析与知识点识别的工具列表
+SEPARATE_ANALYSIS_TOOLS = [
+    get_user_background_tool,
+    identify_topic_tool,
+    adjust_explanation_depth_tool,
+    provide_contextual_examples_tool,
+    make_knowledge_connections_tool,
+    update_user_profile_tool,
+]
+
+# 使用一次性查询分析的工具列表
+FUSED_ANALYSIS_TOOLS = [
+    analyze_query_tool,
+    adjust_explanation_depth_tool,
+    provide_contextual_examples_tool,
+    make_knowledge_connections_tool,
+    update_user_profile_tool,
+]
+
+# 图中可用的工具列表
+TOOLS = FUSED_ANALYSIS_TOOLS if FUSED_QUERY_ANALYSIS else SEPARATE_ANALYSIS_TOOLS
+
+# 同一条 AI 消息中的多个工具调用会并发执行，这里限制同时执行的工具数量
+TOOL_MAX_CONCURRENCY = int(os.getenv("AGENT3_TOOL_MAX_CONCURRENCY", "3"))
+
+def limit_tool_concurrency(tools, max_concurrency: int = TOOL_MAX_CONCURRENCY):
+    """
+    为异步工具加上共享的并发上限。
+    ToolNode 会用 asyncio.gather 同时执行一条消息中的所有工具调用，本身没有并发限制。
+    信号量只能在创建它的事件循环中使用，而编译好的图可能被多个事件循环复用，
+    因此按运行中的事件循环分别创建（同一循环内的调用共用一个上限）
     """
-    messages = state["messages"]
-    user_profile = state.get("user_profile", {})
-    current_topic = state.get("current_topic", "")
-
-    # 从环境变量获取 DeepSeek API 密钥
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if not api_key:
-        raise ValueError("DEEPSEEK_API_KEY 环境变量未设置")
-    # 初始化 LLM - 使用 DeepSeek
-    llm = ChatOpenAI(model="deepseek-chat", temperature=0.3, base_url="https://api.deepseek.com", api_key=api_key)
-
-    # 定义工具
-    tools = [
-        get_user_background_tool,
-        identify_topic_tool,
-        adjust_explanation_depth_tool,
-        provide_contextual_examples_tool,
-        make_knowledge_connections_tool,
-        update_user_profile_tool,
-    ]
+    semaphores = weakref.WeakKeyDictionary()
+    semaphores_lock = threading.Lock()
+
+    def loop_semaphore() -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with semaphores_lock:
+            if loop not in semaphores:
+                semaphores[loop] = asyncio.Semaphore(max_concurrency)
+            return semaphores[loop]
+
+    limited_tools = []
+    for t in tools:
+        if t.coroutine is None:
+            limited_tools.append(t)
+            continue
+        async def limited(*args, _coroutine=t.coroutine, **kwargs):
+            start = time.perf_counter()
+            async with loop_semaphore():
+                record_queue_time("agent3_tool", time.perf_counter() - start)
+                return await _coroutine(*args, **kwargs)
+        limited_tools.append(t.model_copy(update={"coroutine": limited}))
+    return limited_tools
 
-    # 定义提示模板
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """
+# --- 3. 定义 Agent 逻辑节点 ---
+AGENT_SYSTEM_PROMPT = """
         你是一个智能学习助手。你的任务是帮助用户学习。请遵循以下步骤：
         1.  如果用户尚未提供其专业水平和职业背景，请先询问并获取这些信息。
         2.  识别用户想了解的知识点。
@@ -187,7 +266,32 @@ async def agent_node(state: State, config: RunnableConfig):
         5.  进行知识连接，提及与之前知识的联系、前置知识或前沿动态。
 
         请使用提供的工具来完成这些任务。
-        """),
+        第 3、4、5 步互不依赖，识别出知识点后请在同一次回复中同时调用这三个工具，它们会并发执行。
+        """
+
+FUSED_AGENT_SYSTEM_PROMPT = """
+        你是一个智能学习助手。你的任务是帮助用户学习。请遵循以下步骤：
+        1.  先调用一次 analyze_query_tool，它会同时返回用户的专业水平、职业背景、知识点和之前问过的知识点。
+            如果水平和职业都是 unknown，请先询问用户的背景信息。
+        2.  根据用户的水平调整解释深度。
+        3.  结合用户的背景提供适配的例子。
+        4.  进行知识连接，提及与之前知识的联系、前置知识或前沿动态。
+
+        请使用提供的工具来完成这些任务，analyze_query_tool 的结果在本轮中直接复用，不要重复分析。
+        第 2、3、4 步互不依赖，请在同一次回复中同时调用这三个工具，它们会并发执行。
+        """
+
+def build_agent_chain(tools, fused_analysis: bool = FUSED_QUERY_ANALYSIS):
+    """
+    构建 Agent 使用的 提示模板 | 绑定工具的 LLM 链。
+    只在构建图时调用一次，每轮对话直接复用，不再重复创建模型和绑定工具。
+    """
+    # 初始化 LLM - 使用 DeepSeek（共享实例）
+    llm = get_chat_model(temperature=0.3)
+
+    # 定义提示模板
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", FUSED_AGENT_SYSTEM_PROMPT if fused_analysis else AGENT_SYSTEM_PROMPT),
         MessagesPlaceholder(variable_name="messages"),
     ])
 
@@ -195,34 +299,32 @@ async def agent_node(state: State, config: RunnableConfig):
     llm_with_tools = llm.bind_tools([convert_to_openai_tool(t) for t in tools])
 
     # 构建链
-    chain = prompt | llm_with_tools
+    return prompt | llm_with_tools
 
-    # 调用链
-    response = await chain.ainvoke(state, config)
-
-    return {"messages": [response]}
+def make_agent_node(chain):
+    """
+    生成 Agent 的核心逻辑节点。
+    它根据当前状态和消息，决定下一步是生成 AI 回复还是调用工具。
+    """
+    async def agent_node(state: State, config: RunnableConfig):
+        # 调用链
+        response = await chain.ainvoke(state, config)
+        return {"messages": [response]}
+    return agent_node
 
 
 # --- 4. 构建图 ---
-def build_graph():
-    # 工具列表
-    tools = [
-        get_user_background_tool,
-        identify_topic_tool,
-        adjust_explanation_depth_tool,
-        provide_contextual_examples_tool,
-        make_knowledge_connections_tool,
-        update_user_profile_tool,
-    ]
-
-    # 创建 ToolNode - 使用修正后的导入路径
-    tool_node = ToolNode(tools, handle_tool_errors=True)
+def build_graph(max_tool_concurrency: int = TOOL_MAX_CONCURRENCY, fused_analysis: bool = FUSED_QUERY_ANALYSIS):
+    tools = FUSED_ANALYSIS_TOOLS if fused_analysis else SEPARATE_ANALYSIS_TOOLS
+
+    # 创建 ToolNode - 使用修正后的导入路径；独立的工具调用并发执行，受并发上限约束
+    tool_node = ToolNode(limit_tool_concurrency(tools, max_tool_concurrency), handle_tool_errors=True)
 
     # 创建状态图
     workflow = StateGraph(State)
 
-    # 添加节点
-    workflow.add_node("agent", agent_node)
+    # 添加节点（Agent 链在这里构建一次）
+    workflow.add_node("agent", make_agent_node(build_agent_chain(tools, fused_analysis)))
     workflow.add_node("tools", tool_node)
 
     # 定义条件边：决定下一步是调用工具还是结束
@@ -295,14 +397,18 @@ async def main():
             # 向图发送用户输入和当前状态
             # astream 会持续输出直到图结束
             final_state = None
-            async for event in app.astream({"messages": [HumanMessage(content=user_input)]}, stream_mode="values"):
-                 final_state = event # 获取最终状态
+            # 记录本轮各节点、工具与模型调用的耗时和 token
+            with TurnMetrics() as turn_metrics:
+                config = {"callbacks": [turn_metrics], "run_name": agent_run_name("agent3")}
+                async for event in app.astream({"messages": [HumanMessage(content=user_input)]}, config, stream_mode="values"):
+                     final_state = event # 获取最终状态
 
             # 从最终状态中获取并打印助手的最终回复
             if final_state and final_state["messages"]:
                 last_message = final_state["messages"][-1]
                 if isinstance(last_message, AIMessage) and not last_message.tool_calls: # 确保是最终回复，而非工具调用
                     print(f"\n助手: {last_message.content}")
+                print(format_turn_summary(turn_metrics.summary()))
                 # 如果最后是工具调用，说明 agent 逻辑可能有问题，或者工具执行失败
 
         except KeyboardInterrupt:
@@ -314,5 +420,8 @@ async def main():
             traceback.print_exc()
             break
 
+    # 退出前关闭共享的 HTTP 连接池
+    await aclose_http_clients()
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+from data_dir import data_path
+
+# 批量运行入口：把 JSONL 文件中的学习需求逐条交给主控智能体（multi_agents_pro）或 agent3 图处理
+# - 输入按行流式读取，每行一个 JSON：{"id": ..., "query": ...}（也接受 request_id / message / body 字段）
+# - 并发上限 + 每秒请求数限制
+# - 每完成一条立即追加写入输出 JSONL；输出文件同时作为断点记录，重跑时跳过已成功的条目
+# - 结束时输出吞吐量与延迟统计
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_RATE_LIMIT = float(os.getenv("BATCH_RATE_LIMIT", "2"))  # 每秒最多发起的请求数，0 表示不限制
+
+class RateLimiter:
+    """按固定间隔放行请求，平滑地把请求速率限制在 rate 次/秒以内"""
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+def parse_request(line: str, line_number: int) -> Optional[Tuple[str, str]]:
+    """解析一行输入，返回 (请求ID, 查询内容)，空行或无法解析时返回 None"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError:
+        print(f"⚠️ 第 {line_number} 行不是合法的 JSON，已跳过")
+        return None
+    if isinstance(record, str):
+        return str(line_number), record
+    query = record.get("query") or record.get("message") or record.get("body")
+    if not query:
+        print(f"⚠️ 第 {line_number} 行缺少 query 字段，已跳过")
+        return None
+    request_id = record.get("id") or record.get("request_id") or line_number
+    return str(request_id), query
+
+def load_completed(output_path: str) -> Set[str]:
+    """从已有输出中读取处理成功的请求ID（断点续跑），写了一半的最后一行会被忽略"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("ok"):
+                completed.add(record["id"])
+    return completed
+
+async def iter_requests(input_path: str, completed: Set[str]) -> AsyncIterator[Tuple[str, str]]:
+    """逐行读取输入文件，跳过已完成的请求"""
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            request = parse_request(line, line_number)
+            if request and request[0] not in completed:
+                yield request
+
+def make_master_runner(fake_latency: Optional[float]):
+    """主控智能体：每条请求使用独立的空白对话记忆"""
+    import multi_agents_pro
+    if fake_latency is not None:
+        from fake_models import install_fake_master_agents
+        install_fake_master_agents(multi_agents_pro, fake_latency)
+
+    async def run(query: str) -> str:
+        messages = multi_agents_pro.build_master_messages(query, multi_agents_pro.ConversationMemory())
+        result = await multi_agents_pro.get_async_master_agent().ainvoke({"messages": messages})
+        # 直通模式下子智能体的完整结果不在主控的最终回复中，需要按句柄取回
+        return multi_agents_pro.collect_master_response(result["messages"])
+    return run
+
+def make_agent3_runner(fake_latency: Optional[float]):
+    """agent3 图：每条请求从空白的用户档案开始"""
+    from langchain_core.messages import HumanMessage
+    import agent3
+    if fake_latency is not None:
+        from fake_models import install_fake_agent3
+        install_fake_agent3(agent3, fake_latency)
+    app = agent3.build_graph()
+
+    async def run(query: str) -> str:
+        result = await app.ainvoke({
+            "messages": [HumanMessage(content=query)],
+            "user_profile": {},
+            "current_topic": "",
+            "knowledge_links": [],
+        })
+        return result["messages"][-1].content
+    return run
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+async def run_batch(input_path: str, output_path: str, target: str = "master", concurrency: int = BATCH_CONCURRENCY,
+                    rate: float = BATCH_RATE_LIMIT, fake_latency: Optional[float] = None) -> Dict[str, Any]:
+    """
+    批量处理输入文件中的请求
+
+    Args:
+        input_path (str): 输入 JSONL 路径
+        output_path (str): 输出 JSONL 路径（也是断点记录）
+        target (str): master 或 agent3
+        concurrency (int): 同时处理的请求数上限
+        rate (float): 每秒最多发起的请求数，0 表示不限制
+        fake_latency (float): 设置后使用离线模拟模型，值为每次模型调用的延迟
+
+    Returns:
+        Dict[str, Any]: 吞吐量与延迟统计
+    """
+    run = make_master_runner(fake_latency) if target == "master" else make_agent3_runner(fake_latency)
+    completed = load_completed(output_path)
+    if completed:
+        print(f"♻️ 从断点继续：已完成 {len(completed)} 条，将跳过")
+    limiter = RateLimiter(rate)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    latencies = []
+    failed = 0
+    output = open(output_path, "a", encoding="utf-8")
+    # 上次中断时可能留下写了一半的最后一行，新结果从新的一行开始写
+    if output.tell() > 0:
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                output.write("\n")
+
+    async def produce():
+        async for request in iter_requests(input_path, completed):
+            await queue.put(request)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def worker():
+        nonlocal failed
+        while (request := await queue.get()) is not None:
+            request_id, query = request
+            await limiter.acquire()
+            start = time.perf_counter()
+            record = {"id": request_id, "query": query}
+            try:
+                record.update(ok=True, response=await run(query))
+            except Exception as e:
+                record.update(ok=False, error=f"{type(e).__name__}: {e}")
+                failed += 1
+            record["latency"] = round(time.perf_counter() - start, 3)
+            if record["ok"]:
+                latencies.append(record["latency"])
+            # 每条结果立即写入并刷新，进程中断后可从这里续跑
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            print(f"{'✅' if record['ok'] else '❌'} [{request_id}] {record['latency']:.2f}s")
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(produce(), *(worker() for _ in range(concurrency)))
+    finally:
+        output.close()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    processed = len(latencies) + failed
+    return {
+        "processed": processed,
+        "succeeded": len(latencies),
+        "failed": failed,
+        "skipped": len(completed),
+        "elapsed": round(elapsed, 2),
+        "throughput": round(processed / elapsed, 2) if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_max": latencies[-1] if latencies else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="批量运行学习需求")
+    parser.add_argument("input", help="输入 JSONL 文件，每行包含 query 字段")
+    parser.add_argument("-o", "--output", default=data_path("batch_results.jsonl"), help="输出 JSONL 文件（同时用于断点续跑）")
+    parser.add_argument("--target", choices=["master", "agent3"], default="master", help="处理请求的智能体")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="并发上限")
+    parser.add_argument("--rate", type=float, default=BATCH_RATE_LIMIT, help="每秒最多发起的请求数，0 表示不限制")
+    parser.add_argument("--fake", type=float, default=None, metavar="LATENCY",
+                        help="使用离线模拟模型，参数为每次模型调用的延迟（秒）")
+    args = parser.parse_args()
+
+    if args.fake is not None:
+        # 模拟模式不访问真实服务，但模块导入时会构造客户端，需要占位的密钥
+        os.environ.setdefault("DEEPSEEK_API_KEY", "fake")
+        os.environ.setdefault("TAVILY_API_KEY", "fake")
+    summary = asyncio.run(run_batch(args.input, args.output, args.target, args.concurrency, args.rate, args.fake))
+    print("\n📊 批量运行统计")
+    print(f"处理 {summary['processed']} 条（成功 {summary['succeeded']}，失败 {summary['failed']}，"
+          f"断点跳过 {summary['skipped']}），耗时 {summary['elapsed']:.2f}s")
+    print(f"吞吐量：{summary['throughput']:.2f} 条/秒")
+    print(f"延迟 p50：{summary['latency_p50']:.2f}s，p95：{summary['latency_p95']:.2f}s，"
+          f"最大：{summary['latency_max']:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import getpass
 import os
 from langchain_deepseek import ChatDeepSeek
+from model_registry import deepseek_client_kwargs
 
 if not os.getenv("DEEPSEEK_API_KEY"):
     os.environ["DEEPSEEK_API_KEY"] = "***"
@@ -10,7 +11,7 @@ llm = ChatDeepSeek(
     temperature=0,
     max_tokens=1024,
     timeout=None,
-    max_retries=2,
+    **deepseek_client_kwargs(),  # 共享连接池，经过进程级限流，429 由限流器退避重试
     # other params...
 )
 
@@ -0,0 +1,38 @@
+import os
+import time
+import asyncio
+import argparse
+
+# 基准测试使用离线模拟模型，但导入 agent3 时需要占位的密钥
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+
+from langchain_core.messages import HumanMessage
+from fake_models import install_fake_agent3
+import agent3
+
+# 基准测试：一轮对话中"背景分析 + 知识点识别"分开调用与一次性查询分析的模型调用次数和耗时对比
+
+async def run_turn(fused: bool, latency: float):
+    fake_model = install_fake_agent3(agent3, latency)
+    app = agent3.build_graph(fused_analysis=fused)
+    start = time.perf_counter()
+    await app.ainvoke({
+        "messages": [HumanMessage(content="我是学生，0基础，想学习神经网络")],
+        "user_profile": {},
+        "current_topic": "",
+        "knowledge_links": [],
+    })
+    return fake_model.call_stats["calls"], time.perf_counter() - start
+
+async def main(latency: float):
+    print(f"📊 模拟模型延迟：{latency:.2f}s/次")
+    for fused in (False, True):
+        calls, elapsed = await run_turn(fused, latency)
+        label = "一次性查询分析" if fused else "分开分析背景与知识点"
+        print(f"{label}：每轮模型调用 {calls} 次，耗时 {elapsed:.2f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="agent3 查询分析调用次数基准测试")
+    parser.add_argument("--latency", type=float, default=0.5, help="模拟模型每次调用的延迟（秒）")
+    args = parser.parse_args()
+    asyncio.run(main(args.latency))
@@ -0,0 +1,80 @@
+import os
+import time
+import argparse
+import statistics
+
+# 离线模式下只测量对象构建开销，不访问网络，需要占位的密钥
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import HumanMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+import model_registry
+import agent3
+
+# 基准测试：agent3 每轮对话中"每次调用都新建客户端"与"共享模型注册表"的开销对比
+# 一轮典型对话：agent 节点 5 次（4 次工具调用之间 + 最终回复）+ 4 次工具内的 LLM 调用
+AGENT_STEPS_PER_TURN = 5
+TOOL_CALLS_PER_TURN = 4
+
+def per_call_setup():
+    """旧实现：每次调用都新建 ChatOpenAI、提示模板并重新绑定工具"""
+    api_key = os.getenv("DEEPSEEK_API_KEY")
+    for _ in range(AGENT_STEPS_PER_TURN):
+        llm = ChatOpenAI(model="deepseek-chat", temperature=0.3, base_url="https://api.deepseek.com", api_key=api_key)
+        llm.bind_tools([convert_to_openai_tool(t) for t in agent3.TOOLS])
+    for _ in range(TOOL_CALLS_PER_TURN):
+        ChatOpenAI(model="deepseek-chat", temperature=0.0, base_url="https://api.deepseek.com", api_key=api_key)
+
+def shared_setup(chain):
+    """新实现：链在构建图时创建一次，工具内从注册表获取共享实例"""
+    for _ in range(AGENT_STEPS_PER_TURN):
+        _ = chain
+    for _ in range(TOOL_CALLS_PER_TURN):
+        model_registry.get_chat_model(temperature=0.0)
+
+def measure(func, *args, repeats: int = 50) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def measure_live(requests: int):
+    """真实请求：每次新建客户端（新连接 + TLS 握手）与共享连接池的单次请求延迟"""
+    api_key = os.getenv("DEEPSEEK_API_KEY")
+    message = [HumanMessage(content="只回复：好")]
+    fresh, pooled = [], []
+    shared_llm = model_registry.get_chat_model(temperature=0.0).bind(max_tokens=1)
+    shared_llm.invoke(message)  # 预热连接
+    for _ in range(requests):
+        start = time.perf_counter()
+        ChatOpenAI(model="deepseek-chat", temperature=0.0, base_url="https://api.deepseek.com",
+                   api_key=api_key, max_tokens=1).invoke(message)
+        fresh.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        shared_llm.invoke(message)
+        pooled.append(time.perf_counter() - start)
+    return statistics.median(fresh), statistics.median(pooled)
+
+def main(live: bool, requests: int):
+    chain = agent3.build_agent_chain(agent3.TOOLS)
+    old_cost = measure(per_call_setup)
+    new_cost = measure(shared_setup, chain)
+    print("📊 每轮对话的客户端/链构建开销（不含网络）")
+    print(f"每次新建：{old_cost * 1000:.2f}ms/轮")
+    print(f"共享注册表：{new_cost * 1000:.3f}ms/轮")
+    print(f"节省：{(old_cost - new_cost) * 1000:.2f}ms/轮")
+    if live:
+        fresh, pooled = measure_live(requests)
+        calls = AGENT_STEPS_PER_TURN + TOOL_CALLS_PER_TURN
+        print(f"📡 单次请求延迟中位数：新建客户端 {fresh * 1000:.0f}ms，共享连接池 {pooled * 1000:.0f}ms")
+        print(f"按每轮 {calls} 次模型调用估算，每轮节省约 {(fresh - pooled) * calls * 1000:.0f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="agent3 共享模型客户端基准测试")
+    parser.add_argument("--live", action="store_true", help="发送真实请求，测量连接复用节省的延迟（需要真实的 DEEPSEEK_API_KEY）")
+    parser.add_argument("--requests", type=int, default=10, help="真实请求的次数")
+    args = parser.parse_args()
+    main(args.live, args.requests)
@@ -0,0 +1,52 @@
+import os
+import io
+import time
+import asyncio
+import argparse
+import contextlib
+
+# 基准测试不访问真实服务，但模块导入时会构造客户端，需要占位的密钥
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+from fake_models import install_fake_master_agents
+import multi_agents_pro
+
+# 基准测试：N 个会话串行执行 vs 在同一个事件循环中并发执行
+# 并发时总耗时应接近单个会话的耗时
+
+async def run_session(index: int):
+    """运行一个独立会话的一轮对话"""
+    memory = multi_agents_pro.ConversationMemory()
+    writer = multi_agents_pro.BufferedStreamWriter(stream=io.StringIO())
+    return await multi_agents_pro.arun_master_agent_stream(f"我想学习Python（会话{index}）", memory, writer)
+
+async def run_sequential(sessions: int) -> float:
+    start = time.perf_counter()
+    for i in range(sessions):
+        await run_session(i)
+    return time.perf_counter() - start
+
+async def run_concurrent(sessions: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(i) for i in range(sessions)))
+    return time.perf_counter() - start
+
+async def main(sessions: int, latency: float):
+    install_fake_master_agents(multi_agents_pro, latency)
+    # 屏蔽各会话的状态输出，只保留测试结果
+    with contextlib.redirect_stdout(io.StringIO()):
+        single = await run_sequential(1)
+        sequential = await run_sequential(sessions)
+        concurrent = await run_concurrent(sessions)
+    print(f"📊 会话数：{sessions}，模拟模型延迟：{latency:.2f}s/次")
+    print(f"单个会话耗时：{single:.2f}s")
+    print(f"{sessions} 个会话串行耗时：{sequential:.2f}s")
+    print(f"{sessions} 个会话并发耗时：{concurrent:.2f}s（约为单个会话的 {concurrent / single:.2f} 倍）")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="异步多会话并发基准测试")
+    parser.add_argument("--sessions", type=int, default=20, help="并发会话数")
+    parser.add_argument("--latency", type=float, default=0.2, help="模拟模型每次调用的延迟（秒）")
+    args = parser.parse_args()
+    asyncio.run(main(args.sessions, args.latency))
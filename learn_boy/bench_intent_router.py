@@ -0,0 +1,127 @@
+import os
+import io
+import time
+import argparse
+import contextlib
+from statistics import mean
+
+# 基准测试不访问真实服务，但模块导入时会构造客户端，需要占位的密钥
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+from intent_router import route_query
+from fake_models import FakeLearningChatModel, FakeTavilySearch, LatencyDistribution, install_fake_master_agents
+from bench_suite import FirstTokenWriter
+import multi_agents_pro
+
+# 本地意图路由基准测试：
+# 1. 路由准确率：在标注好的请求上统计覆盖率（绕过主控的比例）、路由正确率与误路由
+# 2. 路由本身的耗时
+# 3. 使用模拟模型对比开启/关闭路由时每轮的模型调用次数、首个 token 延迟与总耗时
+
+PLAN, DATA, EXPLAIN, FULL = ["plan"], ["data"], ["explain"], ["plan", "data"]
+MASTER = None  # 应交给主控智能体判断
+
+# (请求, 期望的路由)
+LABELED_QUERIES = [
+    ("帮我制定一个Python学习计划", PLAN),
+    ("给我一份三个月的机器学习学习路线", PLAN),
+    ("零基础怎么学深度学习？", PLAN),
+    ("请规划一下我学习React的时间表", PLAN),
+    ("学习Rust应该先学什么", PLAN),
+    ("Python和Java有什么区别，我该先学哪个", PLAN),
+    ("前端框架Vue和React选哪个", PLAN),
+    ("数据分析的学习路径是怎样的", PLAN),
+    ("如何学好英语口语？推荐点方法", PLAN),
+    ("推荐几本机器学习的书", DATA),
+    ("有哪些好的Python教程", DATA),
+    ("给我一些深度学习的学习资料", DATA),
+    ("推荐一些学习Go语言的视频课程", DATA),
+    ("Transformer 相关的论文和文档有哪些", DATA),
+    ("分享一些适合新手的开源项目", DATA),
+    ("什么是最好的Python学习资料", DATA),
+    ("什么是梯度下降", EXPLAIN),
+    ("用通俗的例子解释一下注意力机制", EXPLAIN),
+    ("卷积神经网络的原理是什么", EXPLAIN),
+    ("进程和线程的区别", EXPLAIN),
+    ("为什么神经网络需要激活函数", EXPLAIN),
+    ("用比喻讲讲区块链", EXPLAIN),
+    ("我想要一份Python学习计划和配套资料", FULL),
+    ("帮我规划学习路线并推荐教程", FULL),
+    ("给我一个完整的学习方案，我想学前端开发", FULL),
+    ("学习Kubernetes的路线图和学习资源", FULL),
+    ("我想学习Python", MASTER),
+    ("继续", MASTER),
+    ("上面那个计划太难了，能简单一点吗", MASTER),
+    ("不需要资料，只要计划", MASTER),
+    ("谢谢", MASTER),
+    ("我是程序员，想转行做AI", MASTER),
+    ("解释一下这个计划的第二阶段", MASTER),
+    ("帮我制定计划，并解释什么是反向传播", MASTER),
+    ("我想系统地学习机器学习，有什么建议", MASTER),
+    ("Java和Go有什么区别，能举例说明吗，先学哪个", MASTER),
+]
+
+def evaluate_accuracy():
+    routed = correct = 0
+    misroutes = []
+    for query, expected in LABELED_QUERIES:
+        route = route_query(query)
+        if route is None:
+            continue
+        routed += 1
+        if route == expected:
+            correct += 1
+        else:
+            misroutes.append((query, route, expected))
+    total = len(LABELED_QUERIES)
+    routable = sum(1 for _, expected in LABELED_QUERIES if expected is not None)
+    print(f"📊 标注请求 {total} 条（其中意图明确 {routable} 条）")
+    print(f"绕过主控智能体：{routed} 条（覆盖率 {routed / total:.0%}，占意图明确请求的 {correct / routable:.0%}）")
+    print(f"路由正确率：{correct}/{routed}（{correct / routed:.0%}）" if routed else "没有请求被路由")
+    for query, route, expected in misroutes:
+        print(f"  ❌ 误路由：「{query}」-> {route}，期望 {expected or '主控智能体'}")
+
+def evaluate_latency(repeats: int):
+    samples = []
+    for _ in range(repeats):
+        for query, _ in LABELED_QUERIES:
+            start = time.perf_counter()
+            route_query(query)
+            samples.append(time.perf_counter() - start)
+    samples.sort()
+    print(f"路由耗时：p50 {samples[len(samples) // 2] * 1e6:.1f}µs，"
+          f"p99 {samples[int(len(samples) * 0.99)] * 1e6:.1f}µs")
+
+def evaluate_turns(latency: str, search_latency: str):
+    """用模拟模型对比开启/关闭本地路由时，可路由请求的每轮耗时"""
+    model = FakeLearningChatModel(latency_distribution=LatencyDistribution.parse(latency), answer_chars=200)
+    search = FakeTavilySearch(max_results=3, latency_distribution=LatencyDistribution.parse(search_latency))
+    install_fake_master_agents(multi_agents_pro, model=model, search_tool=search)
+    queries = [query for query, expected in LABELED_QUERIES if route_query(query)]
+    print(f"\n📊 模拟模型延迟 {latency}，搜索延迟 {search_latency}，可路由请求 {len(queries)} 条")
+    for enabled in (False, True):
+        multi_agents_pro.INTENT_ROUTER_ENABLED = enabled
+        calls, ttfts, totals = [], [], []
+        for query in queries:
+            before = model.call_stats["calls"]
+            writer = FirstTokenWriter()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                multi_agents_pro.run_master_agent_stream(query, multi_agents_pro.ConversationMemory(), writer)
+            totals.append(time.perf_counter() - start)
+            ttfts.append(writer.first_token_time - start)
+            calls.append(model.call_stats["calls"] - before)
+        label = "开启本地路由" if enabled else "全部经过主控智能体"
+        print(f"{label}：平均每轮模型调用 {mean(calls):.1f} 次，首个 token 延迟 {mean(ttfts):.2f}s，"
+              f"每轮耗时 {mean(totals):.2f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地意图路由准确率与耗时基准测试")
+    parser.add_argument("--repeats", type=int, default=200, help="测量路由耗时的重复次数")
+    parser.add_argument("--latency", default="0.3", help="模拟模型延迟分布，如 0.3、lognormal:0.3,0.4")
+    parser.add_argument("--search-latency", default="0.5", help="模拟搜索延迟分布")
+    args = parser.parse_args()
+    evaluate_accuracy()
+    evaluate_latency(args.repeats)
+    evaluate_turns(args.latency, args.search_latency)
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime
+from memory_journal import MemoryJournal
+from session_store import SessionJournal, SessionStore
+
+# 对话记忆存储基准测试：整体重写 JSON 与追加式日志在不同历史长度下的保存/加载开销
+# 为了体现历史增长的影响，JSON 方案保留完整历史（等价于把 max_history 调大）
+# 开始前先检查三种存储重新加载后能恢复滚动摘要（history_summary / summary_until），日志的待压缩记录数正确，以及会话库批量写入失败后不丢数据
+
+WINDOW = 20  # 加载时需要的最近消息条数（max_history * 2）
+
+def make_message(i: int) -> dict:
+    return {
+        "role": "user" if i % 2 == 0 else "assistant",
+        "content": f"第{i}条消息：我想系统学习 Python 数据分析，请给出学习路线和练习建议。" * 3,
+        "timestamp": datetime.now().isoformat(),
+        "metadata": {},
+    }
+
+def file_size(*paths) -> int:
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+def bench_json(workdir: str, messages: list) -> dict:
+    filename = os.path.join(workdir, "conversation_memory.json")
+    data = {"conversation_history": messages, "user_profile": {"learning_goals": []},
+            "session_start_time": datetime.now().isoformat()}
+    # 旧实现每轮对话后都整体重写一次文件
+    start = time.perf_counter()
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    save = time.perf_counter() - start
+    start = time.perf_counter()
+    with open(filename, "r", encoding="utf-8") as f:
+        history = json.load(f)["conversation_history"][-WINDOW:]
+    load = time.perf_counter() - start
+    assert history == messages[-WINDOW:]
+    return {"save_ms": save * 1000, "load_ms": load * 1000, "bytes": file_size(filename)}
+
+def bench_journal(workdir: str, messages: list, compress: bool) -> dict:
+    prefix = os.path.join(workdir, "conversation_memory")
+    journal = MemoryJournal(prefix, compress=compress, compact_every=len(messages) + 1)
+    journal.compact({"conversation_history": [], "user_profile": {"learning_goals": []},
+                     "session_start_time": datetime.now().isoformat()})
+    for message in messages[:-1]:
+        journal.append_message(message)
+    # 已有 n-1 条记录时再追加一条的耗时，即每轮对话的保存开销
+    start = time.perf_counter()
+    journal.append_message(messages[-1])
+    save = time.perf_counter() - start
+    journal.close()
+    size = file_size(journal.snapshot_path, journal.journal_path)
+
+    start = time.perf_counter()
+    loaded = MemoryJournal(prefix, compress=compress).load(WINDOW)
+    load = time.perf_counter() - start
+    assert loaded["conversation_history"] == messages[-WINDOW:]
+
+    start = time.perf_counter()
+    journal.compact({"conversation_history": messages[-WINDOW:], "user_profile": {"learning_goals": []},
+                     "session_start_time": datetime.now().isoformat()})
+    compact = time.perf_counter() - start
+    return {"save_ms": save * 1000, "load_ms": load * 1000, "compact_ms": compact * 1000, "bytes": size}
+
+def check_summary_reload(workdir: str):
+    """按 ConversationMemory 的写入方式（压缩快照、单独更新摘要）保存，再用新实例加载，检查滚动摘要"""
+    messages = [make_message(i) for i in range(6)]
+    state = {"conversation_history": messages, "user_profile": {"learning_goals": ["Python"]},
+             "session_start_time": datetime.now().isoformat(),
+             "history_summary": "快照中的摘要", "summary_until": messages[1]["timestamp"]}
+    updated = ("更新后的摘要", messages[3]["timestamp"])
+
+    filename = os.path.join(workdir, "conversation_memory.json")
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(dict(state, history_summary=updated[0], summary_until=updated[1]), f, ensure_ascii=False)
+    with open(filename, "r", encoding="utf-8") as f:
+        loaded = {"JSON": json.load(f)}
+
+    prefix = os.path.join(workdir, "journal", "conversation_memory")
+    os.makedirs(os.path.dirname(prefix))
+    journal = MemoryJournal(prefix)
+    journal.compact(state)
+    journal.append_summary(*updated)
+    journal.close()
+    loaded["追加日志"] = MemoryJournal(prefix).load(WINDOW)
+
+    store = SessionStore(db_path=os.path.join(workdir, "sessions.sqlite3"))
+    session = SessionJournal(store, "user")
+    session.compact(state)
+    session.append_summary(*updated)
+    store.close()
+    # 新的存储实例模拟重启后的会话重新加载
+    store = SessionStore(db_path=os.path.join(workdir, "sessions.sqlite3"))
+    loaded["SQLite会话库"] = SessionJournal(store, "user").load(WINDOW)
+    store.close()
+
+    for name, data in loaded.items():
+        assert (data["history_summary"], data["summary_until"]) == updated, f"{name} 未恢复滚动摘要：{data}"
+        print(f"✅ {name}：重新加载后滚动摘要一致")
+
+def check_compaction_count(workdir: str):
+    """重新加载后，日志的待压缩记录数应为日志中的实际条数，而不是只读到的最近 WINDOW 条"""
+    prefix = os.path.join(workdir, "count", "conversation_memory")
+    os.makedirs(os.path.dirname(prefix))
+    for compress in (False, True):
+        journal = MemoryJournal(prefix, compress=compress, compact_every=1000)
+        for i in range(WINDOW * 3):
+            journal.append_message(make_message(i))
+        journal.close()
+        reloaded = MemoryJournal(prefix, compress=compress)
+        reloaded.load(WINDOW)
+        assert reloaded.records_since_compaction == WINDOW * 3, \
+            f"重新加载后待压缩记录数为 {reloaded.records_since_compaction}，应为 {WINDOW * 3}"
+    print("✅ 追加日志：重新加载后待压缩记录数与日志一致")
+
+def check_flush_retry(workdir: str):
+    """批量写入失败时这批操作应留在队列中，下次 flush 写入，不丢消息"""
+    store = SessionStore(db_path=os.path.join(workdir, "retry.sqlite3"), flush_interval=60)
+    session = SessionJournal(store, "user")
+    messages = [make_message(i) for i in range(3)]
+    for message in messages:
+        session.append_message(message)
+    apply = store._apply
+    def failing_apply(*args):
+        raise sqlite3.OperationalError("database is locked")
+    store._apply = failing_apply
+    try:
+        store.flush()
+    except sqlite3.OperationalError:
+        pass
+    assert store.pending() == len(messages), f"写入失败后队列中剩 {store.pending()} 条，应为 {len(messages)}"
+    store._apply = apply
+    loaded = session.load(WINDOW)
+    store.close()
+    assert loaded and loaded["conversation_history"] == messages, "重试写入后消息不完整"
+    print("✅ SQLite会话库：批量写入失败后重新入队，重试后消息完整")
+
+def main(sizes):
+    workdir = tempfile.mkdtemp(prefix="memory_bench_")
+    try:
+        check_summary_reload(workdir)
+        check_compaction_count(workdir)
+        check_flush_retry(workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f"📊 对话记忆存储基准（加载最近 {WINDOW} 条消息）")
+    print(f"{'消息数':>8} | {'方案':<12} | {'保存一条(ms)':>12} | {'加载(ms)':>10} | {'压缩(ms)':>10} | {'文件大小':>10}")
+    for size in sizes:
+        messages = [make_message(i) for i in range(size)]
+        for name, runner in [
+            ("JSON整体重写", lambda d: bench_json(d, messages)),
+            ("追加日志", lambda d: bench_journal(d, messages, compress=False)),
+            ("追加日志+gzip", lambda d: bench_journal(d, messages, compress=True)),
+        ]:
+            workdir = tempfile.mkdtemp(prefix="memory_bench_")
+            try:
+                result = runner(workdir)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            compact = f"{result['compact_ms']:.2f}" if "compact_ms" in result else "-"
+            print(f"{size:>8} | {name:<12} | {result['save_ms']:>12.3f} | {result['load_ms']:>10.2f} | "
+                  f"{compact:>10} | {result['bytes'] / 1024 / 1024:>8.1f}MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对话记忆存储基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000], help="历史消息条数")
+    args = parser.parse_args()
+    main(args.sizes)
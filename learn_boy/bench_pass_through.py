@@ -0,0 +1,123 @@
+import os
+import io
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from statistics import mean
+
+# 基准测试不访问真实服务，但模块导入时会构造客户端，需要占位的密钥
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+from metrics import TurnMetrics
+from fake_models import FakeLearningChatModel, FakeTavilySearch, LatencyDistribution, install_fake_master_agents
+from bench_suite import FirstTokenWriter
+import plan_library
+from plan_library import PlanLibrary
+import multi_agents_pro
+
+# 子智能体结果直通基准测试：主控智能体调用子智能体生成长篇回答，对比
+# - 关闭直通：完整结果作为工具消息返回主控，主控按提示词"直接输出"，再生成一遍
+# - 开启直通：完整结果直接展示给用户，主控只看到摘要并给出简短收尾
+# 统计每轮模型的输入/输出 token、首个 token 延迟、每轮耗时与展示给用户的字符数（含重复部分）。
+# 两种模式各用一个空的计划库，避免后一种模式命中前一种模式写入的结果；
+# 另外检查计划库命中时（子智能体不再逐 token 输出）直通模式仍把完整结果展示给用户
+
+QUERIES = [
+    "我想系统地学习机器学习，有什么建议",
+    "我是程序员，想转行做AI",
+    "帮我看看怎么准备数据分析岗位",
+    "我想学习Python",
+    "零基础想做前端，给点建议",
+]
+
+def run_turns(model: FakeLearningChatModel, pass_through: bool):
+    multi_agents_pro.PASS_THROUGH_SUB_AGENTS = pass_through
+    with tempfile.TemporaryDirectory() as tmp:
+        plan_library._plan_library = PlanLibrary(db_path=os.path.join(tmp, "plan_library.sqlite3"))
+        try:
+            return _run_turns()
+        finally:
+            plan_library._plan_library = None
+
+def _run_turns():
+    rows = []
+    for query in QUERIES:
+        writer = FirstTokenWriter()
+        turn_metrics = TurnMetrics()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = multi_agents_pro.run_master_agent_stream(
+                query, multi_agents_pro.ConversationMemory(), writer, turn_metrics)
+        totals = turn_metrics.summary()["totals"]
+        rows.append({
+            "input_tokens": totals["input_tokens"],
+            "output_tokens": totals["output_tokens"],
+            "ttft": writer.first_token_time - start,
+            "total": time.perf_counter() - start,
+            "response_chars": len(response),
+        })
+    return rows
+
+def check_library_hit() -> bool:
+    """计划库命中时，同步与异步的流式回复都应包含库中的完整结果，而不只是主控的收尾语"""
+    multi_agents_pro.PASS_THROUGH_SUB_AGENTS = True
+    query = "我想学习Python"
+    stored = "## 第一阶段：Python 基础\n" + "每天练习 30 分钟基础语法。" * 40
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        library = PlanLibrary(db_path=os.path.join(tmp, "plan_library.sqlite3"))
+        library.store(query, stored, kind="plan", version=multi_agents_pro.library_version("plan"))
+        plan_library._plan_library = library
+        try:
+            for label, run in (("同步", multi_agents_pro.run_master_agent_stream),
+                               ("异步", lambda *args: asyncio.run(multi_agents_pro.arun_master_agent_stream(*args)))):
+                hits = library.stats()["hits"]
+                with contextlib.redirect_stdout(io.StringIO()):
+                    response = run(query, multi_agents_pro.ConversationMemory(), FirstTokenWriter())
+                hit = library.stats()["hits"] > hits
+                passed = hit and stored in response
+                ok = ok and passed
+                print(f"{'✅' if passed else '❌'} 计划库命中 + 直通（{label}）：命中 {hit}，展示 {len(response)} 字，"
+                      f"{'包含' if stored in response else '缺少'}库中的完整结果")
+        finally:
+            plan_library._plan_library = None
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="子智能体结果直通基准测试")
+    parser.add_argument("--latency", default="0.3", help="模拟模型首个 token 延迟分布")
+    parser.add_argument("--token-latency", type=float, default=0.004, help="相邻流式片段之间的延迟（秒）")
+    parser.add_argument("--answer-chars", type=int, default=1500, help="子智能体回答的长度（字符）")
+    args = parser.parse_args()
+
+    model = FakeLearningChatModel(latency_distribution=LatencyDistribution.parse(args.latency),
+                                  token_latency=args.token_latency, answer_chars=args.answer_chars,
+                                  echo_tool_results=True)
+    install_fake_master_agents(multi_agents_pro, model=model, search_tool=FakeTavilySearch(max_results=3))
+    # 本地路由会绕过主控智能体，这里只测量经过主控编排的请求
+    multi_agents_pro.INTENT_ROUTER_ENABLED = False
+
+    print(f"📊 {len(QUERIES)} 轮经过主控智能体的请求，子智能体回答约 {args.answer_chars} 字，"
+          f"模型延迟 {args.latency}，片段间隔 {args.token_latency * 1000:.0f}ms")
+    results = {}
+    for pass_through in (False, True):
+        rows = run_turns(model, pass_through)
+        results[pass_through] = {key: mean(row[key] for row in rows) for key in rows[0]}
+        r = results[pass_through]
+        label = "开启直通" if pass_through else "关闭直通"
+        print(f"{label}：输入 {r['input_tokens']:.0f} / 输出 {r['output_tokens']:.0f} tokens，"
+              f"首个 token {r['ttft']:.2f}s，每轮耗时 {r['total']:.2f}s，展示 {r['response_chars']:.0f} 字")
+    before, after = results[False], results[True]
+    print(f"✅ 每轮节省输出 {before['output_tokens'] - after['output_tokens']:.0f} tokens"
+          f"（{1 - after['output_tokens'] / before['output_tokens']:.0%}），"
+          f"输入 {before['input_tokens'] - after['input_tokens']:.0f} tokens，"
+          f"耗时 {before['total'] - after['total']:.2f}s（{1 - after['total'] / before['total']:.0%}）")
+    print()
+    if not check_library_hit():
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
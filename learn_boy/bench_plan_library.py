@@ -0,0 +1,143 @@
+import os
+import io
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+from statistics import mean
+
+# 基准测试不访问真实服务，但模块导入时会构造客户端，需要占位的密钥
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+import plan_library
+from plan_library import PlanLibrary, parse_plan_request
+from fake_models import FakeLearningChatModel, FakeTavilySearch, LatencyDistribution, install_fake_master_agents
+import multi_agents_pro
+
+# 本地计划库基准测试：
+# 1. 索引键解析：在标注好的请求上检查技术名称、用户水平与应用场景
+# 2. 模拟流量：少数热门技术占据大部分请求（Zipf 分布），同一技术使用不同的说法，
+#    统计计划库命中率、计划智能体的模型调用次数与每次请求的耗时
+# 3. 查找本身的耗时
+
+# (请求, (技术, 水平, 场景))
+LABELED_QUERIES = [
+    ("帮我制定一个三个月的Python学习计划", ("python", "beginner", "")),
+    ("Python学习计划", ("python", "beginner", "")),
+    ("学习 Python 用于数据分析", ("python", "beginner", "数据分析")),
+    ("我想学习Python，目标是转行做数据分析", ("python", "intermediate", "数据分析")),
+    ("零基础怎么学深度学习？", ("深度学习", "beginner", "")),
+    ("给我一份机器学习学习路线", ("机器学习", "beginner", "")),
+    ("请规划一下我学习React的时间表", ("react", "beginner", "")),
+    ("学习Rust应该先学什么", ("rust", "beginner", "")),
+    ("精通Linux内核的路线", ("linux内核", "advanced", "")),
+    ("有编程基础，想进阶学习 Kubernetes", ("kubernetes", "intermediate", "")),
+    # 以"学"结尾的学科名不能被当作动词去掉；已有的背景技术不计入技术名称
+    ("数学学习计划", ("数学", "beginner", "")),
+    ("我想学化学", ("化学", "beginner", "")),
+    ("大学物理怎么学", ("大学物理", "beginner", "")),
+    ("零基础学Python", ("python", "beginner", "")),
+    ("有 Java 基础，想学 Spring Boot", ("springboot", "intermediate", "")),
+    ("中级水平，Go 的进阶路线", ("go", "intermediate", "")),
+]
+# 资料类型也是索引键的一部分：同一技术的书、视频与学习计划不能共用一条记录
+RESOURCE_QUERIES = [
+    ("推荐一些 Python 视频课程", "视频"),
+    ("推荐 Python 书籍", "书籍"),
+    ("Python 学习计划", ""),
+    ("推荐几本机器学习的书", "书籍"),
+    ("Python 官方文档", "文档"),
+    ("有哪些适合练手的 Python 项目", "项目"),
+]
+
+TECHNOLOGIES = [
+    "Python", "Java", "React", "Vue", "机器学习", "深度学习", "数据分析", "Go", "Rust", "Docker",
+    "Kubernetes", "Linux", "SQL", "TypeScript", "Spring Boot", "C++", "PyTorch", "前端开发", "网络安全", "算法",
+]
+TEMPLATES = [
+    "帮我制定一个{tech}学习计划", "{tech}学习路线", "我想学习{tech}", "零基础怎么学{tech}",
+    "给我一份{tech}的学习规划", "请帮我规划一下{tech}的学习", "{tech}应该先学什么", "三个月学会{tech}的计划",
+]
+
+def evaluate_parsing():
+    correct = 0
+    for query, expected in LABELED_QUERIES:
+        request = parse_plan_request(query)
+        actual = (request.technology, request.level, request.scenario) if request else None
+        if actual == expected:
+            correct += 1
+        else:
+            print(f"  ❌ 「{query}」解析为 {actual}，期望 {expected}")
+    print(f"📊 索引键解析正确 {correct}/{len(LABELED_QUERIES)}")
+    correct = 0
+    for query, expected in RESOURCE_QUERIES:
+        request = parse_plan_request(query)
+        actual = request.resource if request else None
+        if actual == expected:
+            correct += 1
+        else:
+            print(f"  ❌ 「{query}」的资料类型解析为 {actual!r}，期望 {expected!r}")
+    print(f"📊 资料类型解析正确 {correct}/{len(RESOURCE_QUERIES)}")
+
+def make_traffic(requests: int, seed: int):
+    """按 Zipf 分布生成请求：排名第 k 的技术出现的概率正比于 1/k"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(TECHNOLOGIES))]
+    return [rng.choice(TEMPLATES).format(tech=rng.choices(TECHNOLOGIES, weights)[0]) for _ in range(requests)]
+
+def evaluate_traffic(requests: int, latency: str, seed: int):
+    model = FakeLearningChatModel(latency_distribution=LatencyDistribution.parse(latency), answer_chars=1500)
+    install_fake_master_agents(multi_agents_pro, model=model, search_tool=FakeTavilySearch(max_results=3))
+    traffic = make_traffic(requests, seed)
+    print(f"\n📊 模拟 {requests} 次计划请求（{len(TECHNOLOGIES)} 个技术，{len(TEMPLATES)} 种说法），模型延迟 {latency}")
+    for enabled in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            library = PlanLibrary(db_path=os.path.join(tmp, "plan_library.sqlite3"))
+            plan_library.PLAN_LIBRARY_ENABLED = enabled
+            plan_library._plan_library = library
+            before = model.call_stats["calls"]
+            hit_times, miss_times = [], []
+            for query in traffic:
+                hits_before = library.stats()["hits"]
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    multi_agents_pro.run_sub_agent("plan", query)
+                elapsed = time.perf_counter() - start
+                (hit_times if library.stats()["hits"] > hits_before else miss_times).append(elapsed)
+            stats = library.stats()
+        calls = model.call_stats["calls"] - before
+        if enabled:
+            print(f"开启计划库：命中率 {stats['hit_rate']:.0%}（精确 {stats['exact']} / 全文 {stats['text']}），"
+                  f"库中 {stats['entries']} 条，模型调用 {calls} 次，"
+                  f"平均耗时 {mean(hit_times + miss_times):.3f}s（命中 {mean(hit_times) * 1000:.1f}ms，"
+                  f"未命中 {mean(miss_times):.2f}s）")
+        else:
+            print(f"关闭计划库：模型调用 {calls} 次，平均耗时 {mean(miss_times):.3f}s")
+    plan_library.PLAN_LIBRARY_ENABLED = True
+    plan_library._plan_library = None
+
+def evaluate_lookup_latency(repeats: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        library = PlanLibrary(db_path=os.path.join(tmp, "plan_library.sqlite3"))
+        for tech in TECHNOLOGIES:
+            library.store(f"{tech}学习计划", "模拟学习计划" * 100)
+        queries = make_traffic(repeats, 1)
+        samples = []
+        for query in queries:
+            start = time.perf_counter()
+            library.lookup(query)
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+        print(f"查找耗时：p50 {samples[len(samples) // 2] * 1000:.2f}ms，p99 {samples[int(len(samples) * 0.99)] * 1000:.2f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地计划库基准测试")
+    parser.add_argument("--requests", type=int, default=200, help="模拟的计划请求数")
+    parser.add_argument("--latency", default="0.2", help="模拟模型延迟分布")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    evaluate_parsing()
+    evaluate_traffic(args.requests, args.latency, args.seed)
+    evaluate_lookup_latency(500)
@@ -0,0 +1,93 @@
+import os
+import io
+import time
+import argparse
+import contextlib
+from datetime import datetime, timedelta
+from statistics import mean
+
+# 基准测试不访问真实服务，但模块导入时会构造客户端，需要占位的密钥
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+from context_budget import ContextBuilder, count_tokens
+import multi_agents_pro
+
+# 前缀缓存基准测试：模拟一段多轮对话，每轮用 build_master_messages 组装主控智能体的请求，
+# 按 DeepSeek 上下文缓存的规则（与此前任一请求相同的前缀、以 64 token 为单位）计算可命中的 token 数，
+# 对比历史窗口逐条滑动（window_block=1）与按块前移时的命中率与摘要调用次数。摘要函数为离线模拟
+
+CACHE_UNIT_TOKENS = 64
+QUESTIONS = [
+    "我想系统学习 Python 数据分析，应该先学什么？",
+    "NumPy 和 Pandas 的学习顺序怎么安排比较好？",
+    "能推荐几个适合练手的数据分析项目吗？",
+    "数据可视化应该学 Matplotlib 还是 Seaborn？",
+    "学完这些之后怎么准备数据分析岗位的面试？",
+    "SQL 在数据分析里需要掌握到什么程度？",
+]
+
+def fake_summarizer(previous_summary: str, messages, max_tokens: int) -> str:
+    topics = "；".join(msg["content"][:20] for msg in messages if msg["role"] == "user")
+    return f"{previous_summary}；{topics}" if previous_summary else topics
+
+def serialize(messages) -> str:
+    """主控智能体实际发送的内容：静态系统提示词在前，之后是各条消息"""
+    system_prompt = multi_agents_pro.master_agent_system_prompt
+    return system_prompt + "".join(f"\n<{msg['role']}>{msg['content']}" for msg in messages)
+
+def cached_prefix_tokens(request: str, previous: list) -> int:
+    """与此前任一请求的最长公共前缀，按缓存单位向下取整后的 token 数"""
+    best = 0
+    for earlier in previous:
+        length = 0
+        limit = min(len(request), len(earlier))
+        while length < limit and request[length] == earlier[length]:
+            length += 1
+        best = max(best, length)
+    return count_tokens(request[:best]) // CACHE_UNIT_TOKENS * CACHE_UNIT_TOKENS
+
+def run_conversation(turns: int, window_block: int, answer_chars: int):
+    builder = ContextBuilder(summarizer=fake_summarizer, window_block=window_block)
+    multi_agents_pro.context_builder = builder
+    memory = multi_agents_pro.ConversationMemory(max_history=50)
+    clock = datetime(2026, 1, 1)
+    previous, hits, totals = [], [], []
+    for turn in range(turns):
+        query = QUESTIONS[turn % len(QUESTIONS)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            messages = multi_agents_pro.build_master_messages(query, memory)
+        request = serialize(messages)
+        hits.append(cached_prefix_tokens(request, previous))
+        totals.append(count_tokens(request))
+        previous.append(request)
+        # 固定的时间戳让每次运行的结果一致
+        answer = f"第{turn + 1}轮回答：" + "建议先打好基础再做项目。" * (answer_chars // 12)
+        for role, content in (("user", query), ("assistant", answer)):
+            clock += timedelta(seconds=1)
+            memory.conversation_history.append({"role": role, "content": content, "timestamp": clock.isoformat(),
+                                                "metadata": {}})
+    # 前两轮还没有可复用的历史，从第三轮开始统计
+    return sum(hits[2:]) / sum(totals[2:]), mean(totals[2:]), builder.summaries_generated
+
+def main():
+    parser = argparse.ArgumentParser(description="历史窗口按块前移的前缀缓存基准测试")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--answer-chars", type=int, default=2000, help="每轮助手回答的长度（字符）")
+    parser.add_argument("--block", type=int, default=None, help="窗口每次前移的消息数，默认 CONTEXT_WINDOW_BLOCK")
+    args = parser.parse_args()
+
+    block = args.block or ContextBuilder(summarizer=fake_summarizer).window_block
+    print(f"📊 {args.turns} 轮对话，每轮回答约 {args.answer_chars} 字，缓存单位 {CACHE_UNIT_TOKENS} tokens")
+    start = time.perf_counter()
+    rows = {}
+    for name, window_block in (("逐条滑动", 1), (f"按块前移({block})", block)):
+        rows[name] = run_conversation(args.turns, window_block, args.answer_chars)
+        hit_rate, tokens, summaries = rows[name]
+        print(f"{name}：前缀缓存命中 {hit_rate:.0%}，平均每轮输入 {tokens:.0f} tokens，摘要调用 {summaries} 次")
+    (sliding, _, sliding_summaries), (blocked, _, blocked_summaries) = rows.values()
+    print(f"✅ 命中率 {sliding:.0%} -> {blocked:.0%}，摘要调用 {sliding_summaries} -> {blocked_summaries} 次"
+          f"（耗时 {time.perf_counter() - start:.1f}s）")
+
+if __name__ == "__main__":
+    main()
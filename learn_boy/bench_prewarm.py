@@ -0,0 +1,98 @@
+import os
+import io
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from statistics import mean
+
+# 基准测试不访问真实服务，但模块导入时会构造客户端，需要占位的密钥
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+import plan_library
+from plan_library import PlanLibrary, parse_plan_request
+from prewarm import mine_topics, prewarm, topic_key
+from bench_plan_library import TECHNOLOGIES, TEMPLATES
+from fake_models import FakeLearningChatModel, FakeTavilySearch, LatencyDistribution, install_fake_master_agents
+import multi_agents_pro
+
+# 计划库预热基准测试：用前一天的学习目标挖掘热门主题并离线预热，再回放当天的计划与资料请求
+# （少数热门技术占据大部分请求，Zipf 分布），对比冷启动的计划库
+# - 每个主题第一位用户的等待时间（冷启动时必然要现场生成）
+# - 当天全部请求的命中率与平均耗时
+# - 预热任务本身的耗时与模型调用次数（发生在用户到来之前）
+
+DATA_TEMPLATES = ["推荐一些{tech}学习资料", "{tech}有哪些好的教程", "{tech}入门书籍推荐", "找一些{tech}的学习资源"]
+
+def make_day(requests: int, rng: random.Random):
+    """生成一天的请求：(子智能体简称, 请求)，约 60% 为计划请求"""
+    weights = [1 / (rank + 1) for rank in range(len(TECHNOLOGIES))]
+    day = []
+    for _ in range(requests):
+        tech = rng.choices(TECHNOLOGIES, weights)[0]
+        kind = "plan" if rng.random() < 0.6 else "data"
+        day.append((kind, tech, rng.choice(TEMPLATES if kind == "plan" else DATA_TEMPLATES).format(tech=tech)))
+    return day
+
+def replay(day, library: PlanLibrary):
+    first_waits, all_times, hits = {}, [], 0
+    for kind, _, query in day:
+        hits_before = library.stats()["hits"]
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            multi_agents_pro.run_sub_agent(kind, query)
+        elapsed = time.perf_counter() - start
+        hits += library.stats()["hits"] > hits_before
+        first_waits.setdefault((kind, topic_key(parse_plan_request(query))), elapsed)
+        all_times.append(elapsed)
+    return first_waits, all_times, hits / len(day)
+
+def main():
+    parser = argparse.ArgumentParser(description="计划库预热基准测试")
+    parser.add_argument("--requests", type=int, default=200, help="每天的请求数")
+    parser.add_argument("--latency", default="0.2", help="模拟模型延迟分布")
+    parser.add_argument("--top", type=int, default=10, help="预热的主题数")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    model = FakeLearningChatModel(latency_distribution=LatencyDistribution.parse(args.latency), answer_chars=1500)
+    install_fake_master_agents(multi_agents_pro, model=model, search_tool=FakeTavilySearch(max_results=3))
+    rng = random.Random(args.seed)
+    # 前一天的请求作为用户的学习目标
+    goals = [query for _, _, query in make_day(args.requests, rng)]
+    hot_topics = mine_topics(goals, top=args.top)
+    today = make_day(args.requests, rng)
+    print(f"📊 每天 {args.requests} 次计划/资料请求（{len(TECHNOLOGIES)} 个技术），模型延迟 {args.latency}，"
+          f"预热前 {args.top} 个主题")
+
+    rows = {}
+    for warm in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            library = PlanLibrary(db_path=os.path.join(tmp, "plan_library.sqlite3"))
+            plan_library._plan_library = library
+            if warm:
+                calls = model.call_stats["calls"]
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    report = asyncio.run(prewarm(library, hot_topics, concurrency=args.concurrency))
+                print(f"🔥 预热 {report['jobs']['generated']} 条记录，耗时 {time.perf_counter() - start:.2f}s，"
+                      f"模型调用 {model.call_stats['calls'] - calls} 次，"
+                      f"覆盖率 plan {report['coverage_after']['plan']:.0%} / data {report['coverage_after']['data']:.0%}")
+            first_waits, all_times, hit_rate = replay(today, library)
+        top_topics = {(kind, topic_key(topic)) for kind in ("plan", "data") for topic, _ in hot_topics}
+        top_waits = [wait for key, wait in first_waits.items() if key in top_topics]
+        rows[warm] = (mean(top_waits), mean(first_waits.values()), hit_rate, mean(all_times))
+        label = "预热后" if warm else "冷启动"
+        print(f"{label}：热门主题首位用户等待 {rows[warm][0]:.3f}s，全部主题首位用户等待 {rows[warm][1]:.3f}s，"
+              f"命中率 {hit_rate:.0%}，平均耗时 {rows[warm][3]:.3f}s")
+    plan_library._plan_library = None
+    cold, warm = rows[False], rows[True]
+    print(f"✅ 热门主题首位用户等待减少 {1 - warm[0] / cold[0]:.0%}，命中率 {cold[2]:.0%} -> {warm[2]:.0%}，"
+          f"平均耗时减少 {1 - warm[3] / cold[3]:.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import time
+import asyncio
+import argparse
+import httpx
+from rate_limiter import AsyncRateLimitedTransport, ProviderLimiter
+
+# 限流基准测试：模拟一个每秒只允许 quota 个请求的服务端（超出返回 429），
+# 对比"盲目重试"（与 max_retries=2 的 SDK 行为类似）与进程级限流器下的成功率、429 次数和吞吐量
+
+class SimulatedProvider:
+    """按滑动时间窗口放行请求的模拟服务端：任意 1 秒内最多接受 quota 个请求"""
+    def __init__(self, quota: float, latency: float):
+        self.quota = quota
+        self.latency = latency
+        self.accepted = 0
+        self.rejected = 0
+        self._recent = []
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        now = time.monotonic()
+        self._recent = [t for t in self._recent if now - t < 1.0]
+        if len(self._recent) >= self.quota:
+            self.rejected += 1
+            return httpx.Response(429, headers={"retry-after": "0.2"}, json={"error": "rate limited"})
+        self._recent.append(now)
+        await asyncio.sleep(self.latency)
+        self.accepted += 1
+        return httpx.Response(200, json={"ok": True})
+
+async def run_naive(provider: SimulatedProvider, requests: int, concurrency: int, max_retries: int = 2):
+    """无限流，429 时按固定退避盲目重试"""
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(provider.handle)) as client:
+        async def one():
+            async with semaphore:
+                for attempt in range(max_retries + 1):
+                    response = await client.post("http://provider/chat")
+                    if response.status_code != 429:
+                        return True
+                    await asyncio.sleep(0.5 * (2 ** attempt))
+                return False
+        return await asyncio.gather(*(one() for _ in range(requests)))
+
+async def run_limited(provider: SimulatedProvider, requests: int, concurrency: int, rps: float):
+    """所有请求经过进程级限流器"""
+    limiter = ProviderLimiter("bench", requests_per_second=rps, max_concurrency=concurrency)
+    transport = AsyncRateLimitedTransport(limiter, httpx.MockTransport(provider.handle))
+    async with httpx.AsyncClient(transport=transport) as client:
+        async def one():
+            response = await client.post("http://provider/chat")
+            return response.status_code != 429
+        results = await asyncio.gather(*(one() for _ in range(requests)))
+    return results, limiter
+
+async def main(requests: int, concurrency: int, quota: float, latency: float):
+    print(f"📊 请求数：{requests}，客户端并发：{concurrency}，服务端配额：{quota:.0f} 次/秒，服务端延迟：{latency:.2f}s")
+    scenarios = [
+        ("盲目重试", None),
+        ("限流器（未配置配额，仅靠 AIMD + 退避）", 0),
+        ("限流器（配额 = 服务端配额）", quota),
+        # 客户端调度有抖动，配额留一点余量才能基本不撞服务端的滑动窗口
+        ("限流器（配额 = 服务端配额的 90%）", quota * 0.9),
+    ]
+    for label, rps in scenarios:
+        provider = SimulatedProvider(quota, latency)
+        start = time.perf_counter()
+        if rps is None:
+            results = await run_naive(provider, requests, concurrency)
+            extra = ""
+        else:
+            results, limiter = await run_limited(provider, requests, concurrency, rps)
+            stats = limiter.stats()
+            extra = f"，最终并发上限 {stats['concurrency_limit']}"
+        elapsed = time.perf_counter() - start
+        succeeded = sum(results)
+        print(f"{label}：成功 {succeeded}/{requests}，服务端返回 429 共 {provider.rejected} 次，"
+              f"耗时 {elapsed:.2f}s，有效吞吐 {succeeded / elapsed:.1f} 次/秒{extra}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="进程级限流器基准测试")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--quota", type=float, default=20, help="模拟服务端每秒允许的请求数")
+    parser.add_argument("--latency", type=float, default=0.1, help="模拟服务端处理延迟（秒）")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.quota, args.latency))
@@ -0,0 +1,129 @@
+import os
+import io
+import random
+import argparse
+import tempfile
+import contextlib
+from statistics import mean
+from typing import Any, Dict
+
+# 基准测试不访问真实服务，但模块导入时会构造客户端，需要占位的密钥
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+from context_budget import count_tokens
+from metrics import TurnMetrics
+from search_cache import CachedTavilySearch, SearchCache
+from fake_models import FakeLearningChatModel, install_fake_master_agents
+import multi_agents_pro
+
+# 搜索结果压缩基准测试：用仿真网页内容（相关段落 + 导航/广告等噪声 + 多个网站转载的相同段落）
+# 代替 Tavily 返回的结果，对比开启/关闭压缩时
+# - 每次搜索返回给智能体的 token 数
+# - 每次子智能体运行的上下文 token 数（各次模型调用的输入 token 之和）
+# - 关键信息（与查询直接相关的句子）的保留率
+
+TOPICS = {
+    "Python 数据分析学习资料": [
+        "Python 数据分析入门建议先掌握 NumPy 数组运算和 Pandas 的 DataFrame 操作。",
+        "Pandas 官方文档的 10 minutes to pandas 是数据分析入门最快的教程。",
+        "《利用 Python 进行数据分析》由 Pandas 作者编写，是数据分析的经典书籍。",
+        "数据可视化推荐学习 Matplotlib 与 Seaborn，配合 Jupyter Notebook 练习。",
+        "Kaggle 上的 Titanic 数据集适合作为第一个 Python 数据分析实战项目。",
+        "Coursera 的 Applied Data Science with Python 专项课程覆盖数据清洗与分析。",
+    ],
+    "React 前端开发教程": [
+        "React 官方文档 react.dev 提供了交互式教程，是学习 React 的首选资料。",
+        "学习 React 前需要掌握 JavaScript ES6 语法，尤其是箭头函数和解构赋值。",
+        "React Hooks 中的 useState 和 useEffect 是函数组件管理状态的核心。",
+        "前端开发实战可以从 TodoList 项目开始，再尝试使用 React Router 做多页面应用。",
+        "状态管理推荐先理解 Context，再根据需要学习 Redux Toolkit 或 Zustand。",
+        "Next.js 是基于 React 的全栈框架，适合在掌握 React 基础后学习。",
+    ],
+    "机器学习入门书籍推荐": [
+        "周志华的《机器学习》俗称西瓜书，系统介绍了机器学习的基本概念与算法。",
+        "《统计学习方法》由李航编写，适合想深入理解机器学习算法原理的读者。",
+        "吴恩达的机器学习课程是公认最适合入门的机器学习视频课程。",
+        "《机器学习实战》基于 Scikit-learn 和 TensorFlow，偏重动手实践。",
+        "入门机器学习建议先补充线性代数、概率统计与 Python 编程基础。",
+        "Scikit-learn 官方文档的用户指南涵盖了常用机器学习模型的用法与示例。",
+    ],
+}
+NOISE = [
+    "首页 | 登录 | 注册 | 帮助中心 | 关于我们",
+    "本站部分内容来源于网络，如有侵权请联系删除。版权所有，未经授权禁止转载。",
+    "点击关注公众号，回复关键词领取更多免费资源，每日更新不定期抽奖。",
+    "广告：限时优惠！全站会员低至五折，名师直播课程火热报名中。",
+    "上一篇：程序员如何提高工作效率 下一篇：年终总结怎么写才出彩",
+    "相关推荐：十大热门编程语言排行榜，看看你学的语言排第几。",
+    "评论区：感谢分享，收藏了！楼主辛苦了，期待更新。",
+    "扫码下载 App，随时随地学习，新用户注册即送七天会员体验。",
+]
+# 被多个网站转载的同一段文字
+SYNDICATED = "很多初学者在学习过程中容易只看不练，建议每学完一个知识点就动手写代码巩固，并把遇到的问题记录下来定期复盘。"
+
+def make_search_result(query: str, max_results: int, seed: int) -> Dict[str, Any]:
+    """生成仿真的 Tavily 搜索结果：每条结果包含若干相关句子、噪声与转载段落"""
+    rng = random.Random(f"{query}:{seed}")
+    facts = TOPICS[query]
+    results = []
+    for i in range(max_results):
+        sentences = rng.sample(facts, 2) + rng.sample(NOISE, 4) + ([SYNDICATED] if i % 2 == 0 else [])
+        rng.shuffle(sentences)
+        results.append({
+            "title": f"{query}（第 {i + 1} 篇）", "url": f"https://example.com/{list(TOPICS).index(query)}/{i}",
+            "content": "".join(sentences), "score": round(0.9 - i * 0.05, 2), "raw_content": None,
+        })
+    return {"query": query, "follow_up_questions": None, "answer": None, "images": [], "results": results}
+
+class SimulatedTavilySearch(CachedTavilySearch):
+    """经过真实缓存与压缩流程、但由 make_search_result 生成结果的 Tavily 搜索工具"""
+    def _search(self, query: str, run_manager=None, **kwargs: Any) -> Dict[str, Any]:
+        return make_search_result(query, self.max_results, 0)
+
+    async def _asearch(self, query: str, run_manager=None, **kwargs: Any) -> Dict[str, Any]:
+        return make_search_result(query, self.max_results, 0)
+
+def fact_retention(query: str, result: Dict[str, Any]) -> float:
+    """压缩后的结果中保留了多少条与查询相关的句子（按出现过的相关句子计）"""
+    original = make_search_result(query, len(result["results"]), 0)
+    present = [fact for fact in TOPICS[query] if any(fact in item["content"] for item in original["results"])]
+    kept = [fact for fact in present if any(fact in item["content"] for item in result["results"])]
+    return len(kept) / len(present) if present else 1.0
+
+def main():
+    parser = argparse.ArgumentParser(description="搜索结果抽取式压缩基准测试")
+    parser.add_argument("--max-results", type=int, default=5)
+    parser.add_argument("--budget", type=int, default=None, help="压缩后的 token 预算，默认使用 SEARCH_RESULT_TOKEN_BUDGET")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        search = SimulatedTavilySearch(max_results=args.max_results,
+                                       cache=SearchCache(db_path=os.path.join(tmp, "search_cache.sqlite3")))
+        if args.budget:
+            search.result_token_budget = args.budget
+        model = FakeLearningChatModel()
+        install_fake_master_agents(multi_agents_pro, model=model, search_tool=search)
+
+        print(f"📊 {len(TOPICS)} 个查询，每次搜索 {args.max_results} 条结果，压缩预算 {search.result_token_budget} tokens")
+        rows = {}
+        for compress in (False, True):
+            search.compress = compress
+            tool_tokens, context_tokens, retention = [], [], []
+            for query in TOPICS:
+                result = search.invoke({"query": query})
+                tool_tokens.append(count_tokens(str(result)))
+                retention.append(fact_retention(query, result))
+                turn_metrics = TurnMetrics()
+                with turn_metrics, contextlib.redirect_stdout(io.StringIO()):
+                    multi_agents_pro.run_sub_agent("data", query, {"callbacks": [turn_metrics]})
+                context_tokens.append(turn_metrics.summary()["totals"]["input_tokens"])
+            rows[compress] = (mean(tool_tokens), mean(context_tokens), mean(retention))
+            label = "开启压缩" if compress else "关闭压缩"
+            print(f"{label}：每次搜索返回 {rows[compress][0]:.0f} tokens，"
+                  f"每次子智能体运行上下文 {rows[compress][1]:.0f} tokens，关键信息保留 {rows[compress][2]:.0%}")
+        before, after = rows[False], rows[True]
+        print(f"✅ 搜索结果减少 {1 - after[0] / before[0]:.0%}，子智能体上下文减少 {1 - after[1] / before[1]:.0%}")
+
+if __name__ == "__main__":
+    main()
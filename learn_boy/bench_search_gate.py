@@ -0,0 +1,145 @@
+import os
+import io
+import time
+import argparse
+import tempfile
+import contextlib
+from statistics import mean
+
+# 基准测试不访问真实服务，但模块导入时会构造客户端，需要占位的密钥
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+import search_gate
+from search_gate import SearchGate
+from fake_models import FakeLearningChatModel, FakeTavilySearch, LatencyDistribution, install_fake_master_agents
+import multi_agents_pro
+
+# 搜索闸门基准测试：
+# 1. 在标注好"是否需要联网"的请求上，统计省下的搜索比例，以及该搜索却没搜索的比例
+#    （漏搜的回答可能基于过时知识，是回答质量下降的代理指标）
+# 2. 记录模型在提供搜索工具时的实际选择后，再次判断同一批请求（缓存的历史决定）
+# 3. 使用模拟模型对比开启/关闭闸门时子智能体的搜索次数、模型调用次数与耗时
+
+SEARCH, NO_SEARCH = True, False
+
+# (子智能体, 请求, 是否需要联网)。标注依据：答案是否依赖训练数据之后可能变化的信息
+LABELED_QUERIES = [
+    ("explain", "什么是梯度下降", NO_SEARCH),
+    ("explain", "用通俗的例子解释一下注意力机制", NO_SEARCH),
+    ("explain", "卷积神经网络的原理是什么", NO_SEARCH),
+    ("explain", "进程和线程的区别", NO_SEARCH),
+    ("explain", "为什么神经网络需要激活函数", NO_SEARCH),
+    ("explain", "用比喻讲讲动态规划", NO_SEARCH),
+    ("explain", "TCP三次握手是怎么回事", NO_SEARCH),
+    ("explain", "解释一下区块链", NO_SEARCH),
+    ("explain", "什么是RAG，现在主流的做法有哪些", SEARCH),
+    ("explain", "LangGraph 和 LangChain 有什么区别", SEARCH),
+    ("explain", "讲讲DeepSeek最新模型的架构", SEARCH),
+    ("explain", "大模型智能体是什么", SEARCH),
+    ("plan", "帮我制定一个Python学习计划", NO_SEARCH),
+    ("plan", "给我一份三个月的线性代数学习路线", NO_SEARCH),
+    ("plan", "零基础怎么学数据结构与算法", NO_SEARCH),
+    ("plan", "如何学好英语语法", NO_SEARCH),
+    ("plan", "制定一个操作系统的复习计划", NO_SEARCH),
+    ("plan", "学习Rust应该先学什么", NO_SEARCH),
+    ("plan", "请规划一下我学习React的时间表", SEARCH),
+    ("plan", "2025年学习大模型应用开发的路线", SEARCH),
+    ("plan", "帮我规划学习AIGC的路径", SEARCH),
+    ("plan", "目前前端开发的学习路线是怎样的", SEARCH),
+    ("plan", "备考软考，考试时间和复习计划", SEARCH),
+    ("plan", "学习鸿蒙开发的计划", SEARCH),
+    ("data", "推荐几本机器学习的书", SEARCH),
+    ("data", "有哪些好的Python教程", SEARCH),
+    ("data", "给我一些深度学习的学习资料", SEARCH),
+    ("data", "推荐一些学习Go语言的视频课程", SEARCH),
+    # 英文技术名按完整单词匹配，版本号与新特性类提问需要联网
+    ("explain", "Java 的垃圾回收机制是怎样的", NO_SEARCH),
+    ("plan", "JavaScript 全栈开发学习路线", SEARCH),
+    ("plan", "学习GitHub Copilot的计划", SEARCH),
+    ("explain", "Rust async 的新语法怎么用", SEARCH),
+    ("explain", "Python 3.13 有哪些新特性", SEARCH),
+    ("explain", "讲讲 Node v22 的权限模型", SEARCH),
+]
+
+def evaluate_decisions(gate: SearchGate, label: str):
+    """统计闸门在标注请求上的表现"""
+    skipped = missed = unneeded = 0
+    misses = []
+    for agent, query, needed in LABELED_QUERIES:
+        decision = gate.decide(agent, query)
+        if not decision.needed:
+            skipped += 1
+            if needed:
+                missed += 1
+                misses.append((agent, query, decision.reason))
+        elif not needed:
+            unneeded += 1
+    total = len(LABELED_QUERIES)
+    need = sum(1 for *_, needed in LABELED_QUERIES if needed)
+    print(f"{label}：省下搜索 {skipped}/{total}（{skipped / total:.0%}），"
+          f"不需要却仍搜索 {unneeded}/{total - need}，漏搜 {missed}/{need}（{missed / need:.0%}）")
+    for agent, query, reason in misses:
+        print(f"  ⚠️ 漏搜：[{agent}]「{query}」（依据 {reason}）")
+
+def evaluate_accuracy():
+    with tempfile.TemporaryDirectory() as tmp:
+        gate = SearchGate(db_path=os.path.join(tmp, "search_gate.sqlite3"))
+        print(f"📊 标注请求 {len(LABELED_QUERIES)} 条（需要联网 {sum(1 for *_, n in LABELED_QUERIES if n)} 条），"
+              f"不设闸门时全部提供搜索工具")
+        evaluate_decisions(gate, "关键词规则")
+        # 假设提供了搜索工具的模型只在确实需要时才搜索，把它的选择记录为历史决定
+        for agent, query, needed in LABELED_QUERIES:
+            if gate.decide(agent, query).needed:
+                gate.record_outcome(agent, query, needed)
+        evaluate_decisions(gate, "记录模型选择后")
+        print(f"判断依据分布：{gate.stats()['by_reason']}")
+
+def evaluate_latency(repeats: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        gate = SearchGate(db_path=os.path.join(tmp, "search_gate.sqlite3"))
+        samples = []
+        for _ in range(repeats):
+            for agent, query, _ in LABELED_QUERIES:
+                start = time.perf_counter()
+                gate.decide(agent, query)
+                samples.append(time.perf_counter() - start)
+        samples.sort()
+        print(f"闸门判断耗时：p50 {samples[len(samples) // 2] * 1e6:.1f}µs，"
+              f"p99 {samples[int(len(samples) * 0.99)] * 1e6:.1f}µs")
+
+def evaluate_agents(latency: str, search_latency: str):
+    """用模拟模型对比开启/关闭闸门时子智能体的搜索次数与耗时"""
+    model = FakeLearningChatModel(latency_distribution=LatencyDistribution.parse(latency), answer_chars=200)
+    search = FakeTavilySearch(max_results=3, latency_distribution=LatencyDistribution.parse(search_latency))
+    install_fake_master_agents(multi_agents_pro, model=model, search_tool=search)
+    print(f"\n📊 模拟模型延迟 {latency}，搜索延迟 {search_latency}")
+    for enabled in (False, True):
+        search_gate.SEARCH_GATE_ENABLED = enabled
+        with tempfile.TemporaryDirectory() as tmp:
+            # 使用临时数据库，避免读到之前运行记录的决定
+            search_gate._search_gate = SearchGate(db_path=os.path.join(tmp, "search_gate.sqlite3"))
+            llm_before, search_before = model.call_stats["calls"], search.call_stats["calls"]
+            totals = []
+            for agent, query, _ in LABELED_QUERIES:
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    multi_agents_pro.run_sub_agent(agent, query)
+                totals.append(time.perf_counter() - start)
+        total = len(LABELED_QUERIES)
+        label = "开启搜索闸门" if enabled else "始终提供搜索工具"
+        print(f"{label}：搜索 {search.call_stats['calls'] - search_before} 次，"
+              f"平均每次调用模型 {(model.call_stats['calls'] - llm_before) / total:.1f} 次，"
+              f"平均耗时 {mean(totals):.2f}s")
+    search_gate.SEARCH_GATE_ENABLED = True
+    search_gate._search_gate = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="联网搜索闸门基准测试")
+    parser.add_argument("--repeats", type=int, default=200, help="测量判断耗时的重复次数")
+    parser.add_argument("--latency", default="0.3", help="模拟模型延迟分布，如 0.3、lognormal:0.3,0.4")
+    parser.add_argument("--search-latency", default="1.0", help="模拟搜索延迟分布")
+    args = parser.parse_args()
+    evaluate_accuracy()
+    evaluate_latency(args.repeats)
+    evaluate_agents(args.latency, args.search_latency)
@@ -0,0 +1,138 @@
+import os
+import time
+import zlib
+import math
+import shutil
+import argparse
+import tempfile
+from typing import Any, Dict, List
+from langchain_core.embeddings import Embeddings
+from semantic_cache import SemanticCache, is_cacheable_answer
+
+# 语义缓存的命中率与质量基准测试
+# 每组是同一学习需求的不同说法：每组第一句作为种子写入缓存，其余句子用于查询。
+# 命中同组答案记为正确命中，命中其他组答案记为错误命中（质量问题）；
+# 另有一组缓存中没有的学习需求，句式与种子相近，任何命中都记为错误命中
+
+PARAPHRASE_GROUPS = {
+    "python": ["我想学Python", "Python入门怎么学", "零基础学python", "怎么开始学习Python编程", "python从零开始学习路线"],
+    "sql": ["我想学SQL", "SQL入门怎么学", "零基础如何学习SQL数据库查询", "学习SQL的路线"],
+    "react": ["我想学React前端开发", "React入门怎么学", "零基础学习React", "怎么系统学习React框架"],
+    "ml": ["我想学机器学习", "机器学习入门怎么学", "零基础如何学习机器学习", "机器学习学习路线"],
+    "docker": ["我想学Docker", "Docker入门怎么学", "零基础学习Docker容器", "如何系统学习Docker"],
+}
+UNSEEN_QUERIES = ["我想学Java", "Go入门怎么学", "零基础学习Kubernetes", "如何系统学习Rust", "深度学习学习路线"]
+# 不应写入缓存的回答：失败提示与只有直通摘要的回答
+UNCACHEABLE_ANSWERS = [
+    "处理请求时出现错误: timeout",
+    "「学习计划」调用失败: 429",
+    "「学习计划」的完整结果（约 800 tokens，句柄 out_0123456789ab）已直接展示给用户，请勿复述。\n结构概要：第一阶段",
+]
+
+# 字符 n-gram 向量只看字面重合，同义改写的相似度明显低于真正的 embedding 模型（多在 0.45~0.7），
+# 因此 --local 使用单独的阈值；它只验证缓存流程与误命中，不用来确定线上阈值
+LOCAL_THRESHOLD = 0.45
+SWEEP_THRESHOLDS = [0.95, 0.9, 0.85, 0.8, 0.75, 0.7, 0.6, 0.5, 0.45, 0.4]
+
+class CharNgramEmbeddings(Embeddings):
+    """离线使用的字符 n-gram 哈希向量，只用于在没有 embedding 服务时验证缓存流程"""
+    def __init__(self, dimensions: int = 512, n: int = 2):
+        self.dimensions = dimensions
+        self.n = n
+
+    def _embed(self, text: str) -> List[float]:
+        text = text.lower()
+        vector = [0.0] * self.dimensions
+        for i in range(max(len(text) - self.n + 1, 1)):
+            gram = text[i:i + self.n]
+            vector[zlib.crc32(gram.encode("utf-8")) % self.dimensions] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+def evaluate(cache: SemanticCache, verbose: bool = True) -> Dict[str, Any]:
+    """用各组的其余说法与未缓存的需求查询缓存，统计命中情况"""
+    correct = wrong = missed = false_hits = 0
+    latencies = []
+    for group, queries in PARAPHRASE_GROUPS.items():
+        for query in queries[1:]:
+            start = time.perf_counter()
+            answer = cache.lookup(query)
+            latencies.append(time.perf_counter() - start)
+            if answer is None:
+                missed += 1
+            elif answer == f"answer:{group}":
+                correct += 1
+            else:
+                wrong += 1
+                if verbose:
+                    print(f"❌ 错误命中：{query} -> {answer}")
+    for query in UNSEEN_QUERIES:
+        answer = cache.lookup(query)
+        if answer is not None:
+            false_hits += 1
+            if verbose:
+                print(f"❌ 错误命中（缓存中没有该需求）：{query} -> {answer}")
+    latencies.sort()
+    return {"correct": correct, "wrong": wrong, "missed": missed, "false_hits": false_hits,
+            "total": correct + wrong + missed, "latencies": latencies}
+
+def main(threshold: float, local: bool, sweep: bool) -> bool:
+    persist_directory = tempfile.mkdtemp(prefix="semantic_cache_bench_")
+    try:
+        cache = SemanticCache(
+            embedding=CharNgramEmbeddings() if local else None,
+            persist_directory=persist_directory,
+            threshold=threshold,
+            version="benchmark",
+        )
+        for group, queries in PARAPHRASE_GROUPS.items():
+            cache.update(queries[0], f"answer:{group}")
+
+        result = evaluate(cache)
+        total, correct, wrong = result["total"], result["correct"], result["wrong"]
+        latencies = result["latencies"]
+        print(f"📊 相似度阈值：{threshold}，embedding：{'本地字符n-gram' if local else '配置的 embedding 服务'}")
+        print(f"查询数：{total}，正确命中：{correct}，错误命中：{wrong}，未命中：{result['missed']}")
+        print(f"命中率：{(correct + wrong) / total:.0%}，命中准确率：{correct / max(correct + wrong, 1):.0%}，"
+              f"未缓存需求误命中：{result['false_hits']}/{len(UNSEEN_QUERIES)}")
+        print(f"查询延迟 p50：{latencies[len(latencies) // 2] * 1000:.1f}ms，"
+              f"最大：{latencies[-1] * 1000:.1f}ms")
+        if sweep:
+            # 不同 embedding 的相似度分布差别很大，换用 embedding 服务后用该表重新确定阈值
+            print(f"{'阈值':>6} | {'命中率':>6} | {'命中准确率':>8} | {'未缓存需求误命中':>10}")
+            for value in SWEEP_THRESHOLDS:
+                cache.threshold = value
+                row = evaluate(cache, verbose=False)
+                hits = row["correct"] + row["wrong"]
+                print(f"{value:>6.2f} | {hits / row['total']:>6.0%} | {row['correct'] / max(hits, 1):>8.0%} | "
+                      f"{row['false_hits']:>8}/{len(UNSEEN_QUERIES)}")
+    finally:
+        shutil.rmtree(persist_directory, ignore_errors=True)
+    rejected = [answer for answer in UNCACHEABLE_ANSWERS if is_cacheable_answer(answer)]
+    for answer in rejected:
+        print(f"❌ 不应缓存的回答被接受：{answer[:40]}")
+    if not rejected:
+        print(f"✅ 失败提示与只有摘要的回答（{len(UNCACHEABLE_ANSWERS)} 条）均不写入缓存")
+    return wrong + result["false_hits"] + len(rejected) == 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="语义缓存命中率/质量基准测试")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help=f"相似度阈值，默认使用 SEMANTIC_CACHE_THRESHOLD（--local 时为 {LOCAL_THRESHOLD}）")
+    parser.add_argument("--local", action="store_true", help="使用本地字符 n-gram 向量，不访问 embedding 服务")
+    parser.add_argument("--sweep", action="store_true", help="额外输出一组阈值下的命中率与误命中，用于选择阈值")
+    args = parser.parse_args()
+    if not args.local and not os.getenv("OPENAI_API_KEY"):
+        print("⚠️ 未设置 OPENAI_API_KEY，无法访问 embedding 服务，改用本地字符 n-gram 向量（--local）")
+        args.local = True
+    if args.threshold is None:
+        from semantic_cache import SEMANTIC_CACHE_THRESHOLD
+        args.threshold = LOCAL_THRESHOLD if args.local else SEMANTIC_CACHE_THRESHOLD
+    if not main(args.threshold, args.local, args.sweep):
+        raise SystemExit(1)
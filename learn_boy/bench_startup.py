@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+from statistics import median
+from typing import Any, Dict, List
+
+# 启动耗时检查：在全新的子进程中导入智能体模块，测量导入耗时（多次取中位数）与首次创建主控智能体的耗时，
+# 并用 python -X importtime 确认启动阶段没有加载较重的依赖（它们应在首次使用时才导入）。
+# --check 时超出预算或加载了重依赖则以非零状态退出，可用于回归检查
+
+STARTUP_IMPORT_BUDGET = float(os.getenv("STARTUP_IMPORT_BUDGET", "1.5"))  # 导入耗时预算（秒，中位数）
+STARTUP_MODULES = ["multi_agents_pro", "batch_runner", "multi_agents", "agent3"]
+# 只应在首次使用时导入的依赖
+DEFERRED_MODULES = [
+    "langchain.agents", "langchain.chat_models", "langchain_openai", "langchain_deepseek",
+    "langchain_tavily", "openai", "langgraph", "tiktoken", "langchain_chroma",
+]
+# 模块本身建立在这些依赖之上，启动时加载属于正常：agent3 的状态定义与图结构直接使用 langgraph 与 ToolNode，
+# 模型仍在节点与工具首次执行时才通过 model_registry 创建
+STARTUP_ALLOWED_DEPS = {
+    "agent3": ["langgraph", "langchain.agents"],
+}
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def _run(args: List[str]) -> subprocess.CompletedProcess:
+    env = dict(os.environ)
+    # 只测量导入，不访问真实服务，但部分模块需要密钥存在
+    env.setdefault("DEEPSEEK_API_KEY", "startup-check")
+    env.setdefault("TAVILY_API_KEY", "startup-check")
+    return subprocess.run([sys.executable, *args], cwd=HERE, env=env, capture_output=True, text=True)
+
+def measure_import(module: str, runs: int) -> Dict[str, Any]:
+    """在 runs 个全新进程中分别导入模块，返回导入耗时的中位数与最大值"""
+    code = (f"import time; start = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - start)")
+    samples = []
+    for _ in range(runs):
+        result = _run(["-c", code])
+        if result.returncode != 0:
+            raise RuntimeError(f"导入 {module} 失败：\n{result.stderr.strip()}")
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return {"median": median(samples), "max": max(samples), "samples": samples}
+
+def measure_first_use() -> Dict[str, Any]:
+    """导入 multi_agents_pro 后首次创建主控智能体的耗时（延迟到首次使用的部分）"""
+    code = ("import time, json; import multi_agents_pro; start = time.perf_counter(); "
+            "multi_agents_pro.get_master_agent(); print(json.dumps(time.perf_counter() - start))")
+    result = _run(["-c", code])
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "unknown"}
+    return {"seconds": json.loads(result.stdout.strip().splitlines()[-1])}
+
+def importtime_report(module: str, top: int = 8) -> Dict[str, Any]:
+    """解析 python -X importtime 的输出：导入的模块集合与耗时最多的直接依赖"""
+    result = _run(["-X", "importtime", "-c", f"import {module}"])
+    loaded = set()
+    direct = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # 表头
+        loaded.add(name.strip())
+        # 名称前的缩进表示嵌套深度，缩进两格的是被测模块的直接依赖
+        if len(name) - len(name.lstrip()) == 3:
+            direct.append((name.strip(), int(cumulative) / 1e6))
+    allowed = STARTUP_ALLOWED_DEPS.get(module, [])
+    deferred_loaded = sorted(m for m in DEFERRED_MODULES if m not in allowed
+                             and any(name == m or name.startswith(m + ".") for name in loaded))
+    direct.sort(key=lambda item: item[1], reverse=True)
+    return {"modules": len(loaded), "deferred_loaded": deferred_loaded, "slowest_imports": direct[:top]}
+
+def main():
+    parser = argparse.ArgumentParser(description="智能体模块启动耗时检查")
+    parser.add_argument("--modules", nargs="+", default=STARTUP_MODULES)
+    parser.add_argument("--runs", type=int, default=5, help="每个模块测量的进程数")
+    parser.add_argument("--budget", type=float, default=STARTUP_IMPORT_BUDGET, help="导入耗时预算（秒）")
+    parser.add_argument("--check", action="store_true", help="超出预算或启动时加载了重依赖时以状态码 1 退出")
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        try:
+            timing = measure_import(module, args.runs)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            failures.append(f"{module} 无法导入")
+            continue
+        report = importtime_report(module)
+        status = "✅" if timing["median"] <= args.budget else "❌"
+        print(f"{status} import {module}：中位数 {timing['median']:.3f}s，最大 {timing['max']:.3f}s"
+              f"（预算 {args.budget:.2f}s），共加载 {report['modules']} 个模块")
+        for name, seconds in report["slowest_imports"]:
+            print(f"    {seconds:.3f}s  {name}")
+        if timing["median"] > args.budget:
+            failures.append(f"{module} 导入耗时 {timing['median']:.3f}s 超出预算 {args.budget:.2f}s")
+        if report["deferred_loaded"]:
+            print(f"❌ 启动时加载了应延迟导入的依赖：{', '.join(report['deferred_loaded'])}")
+            failures.append(f"{module} 启动时加载了 {', '.join(report['deferred_loaded'])}")
+
+    first_use = measure_first_use()
+    if "seconds" in first_use:
+        print(f"⏱️ 首次创建主控智能体：{first_use['seconds']:.3f}s（模型、搜索工具与 langchain.agents 在此时加载）")
+    else:
+        print(f"⚠️ 无法测量首次创建主控智能体的耗时：{first_use['error']}")
+
+    if args.check and failures:
+        print("\n".join(["", "启动检查未通过："] + [f"- {failure}" for failure in failures]))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
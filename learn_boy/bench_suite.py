@@ -0,0 +1,253 @@
+import os
+import io
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import contextlib
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+# 基准测试不访问真实服务，但模块导入时会构造客户端，需要占位的密钥；语义缓存需要 embedding 服务，固定关闭
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+os.environ["SEMANTIC_CACHE_ENABLED"] = "0"
+
+from langchain_core.messages import HumanMessage
+from fake_models import (FakeLearningChatModel, FakeTavilySearch, LatencyDistribution, PolicyChatModel,
+                         agent3_policy, install_fake_agent3, install_fake_master_agents, install_fake_multi_agents)
+import multi_agents_pro
+import multi_agents
+import agent3
+from memory_journal import MemoryJournal
+
+# 离线基准测试套件：模型与搜索均为可复现的模拟实现，只测量智能体编排、记忆与上下文组装本身的开销。
+# 每个场景输出 p50/p95/p99 延迟（毫秒）、每次迭代的模型/搜索调用次数与峰值内存，结果为 JSON，
+# 可用 --compare 与之前保存的结果对比
+
+QUERIES = ["我想学习Python", "给我一份机器学习的学习计划", "推荐一些深度学习的学习资料"]
+
+def summarize_samples(samples: List[float]) -> Dict[str, float]:
+    """把耗时样本（秒）汇总为毫秒单位的分位数"""
+    ordered = sorted(samples)
+
+    def pick(fraction: float) -> float:
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+    to_ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "p50_ms": to_ms(pick(0.5)),
+        "p95_ms": to_ms(pick(0.95)),
+        "p99_ms": to_ms(pick(0.99)),
+        "mean_ms": to_ms(sum(ordered) / len(ordered)),
+        "max_ms": to_ms(ordered[-1]),
+    }
+
+class FirstTokenWriter(multi_agents_pro.BufferedStreamWriter):
+    """写入内存的输出目标，记录首个文本片段到达的时间"""
+    def __init__(self):
+        super().__init__(stream=io.StringIO())
+        self.first_token_time = None
+
+    def write(self, text: str):
+        if self.first_token_time is None and text.strip():
+            self.first_token_time = time.perf_counter()
+        super().write(text)
+
+class BenchmarkSuite:
+    def __init__(self, iterations: int, llm_latency: str, search_latency: str, token_latency: float, seed: int):
+        self.iterations = iterations
+        self.loop = asyncio.new_event_loop()
+        self.model = FakeLearningChatModel(
+            latency_distribution=LatencyDistribution.parse(llm_latency, seed),
+            token_latency=token_latency,
+            answer_chars=200,
+        )
+        self.search = FakeTavilySearch(max_results=5, latency_distribution=LatencyDistribution.parse(search_latency, seed + 1))
+        self.agent3_model = PolicyChatModel(
+            policy=agent3_policy,
+            latency_distribution=LatencyDistribution.parse(llm_latency, seed + 2),
+            token_latency=token_latency,
+        )
+        install_fake_master_agents(multi_agents_pro, model=self.model, search_tool=self.search)
+        install_fake_multi_agents(multi_agents, self.model, self.search)
+        install_fake_agent3(agent3, model=self.agent3_model)
+        self.agent3_app = agent3.build_graph()
+        self._ttft: List[float] = []
+
+    def _call_counts(self) -> Dict[str, int]:
+        return {
+            "llm": self.model.call_stats["calls"] + self.agent3_model.call_stats["calls"],
+            "search": self.search.call_stats["calls"],
+        }
+
+    def _run_once(self, fn: Callable, index: int):
+        if asyncio.iscoroutinefunction(fn):
+            return self.loop.run_until_complete(fn(index))
+        return fn(index)
+
+    def measure(self, fn: Callable, iterations: int = None) -> Dict[str, Any]:
+        """
+        运行一个场景：先预热一次，再计时 iterations 次，最后单独运行一次测量峰值内存
+
+        Args:
+            fn (Callable): 场景函数（同步或协程函数），参数为迭代序号
+            iterations (int): 计时次数，默认使用套件配置
+
+        Returns:
+            Dict[str, Any]: 延迟分位数、调用次数与峰值内存
+        """
+        iterations = iterations or self.iterations
+        self._run_once(fn, 0)
+        self._ttft.clear()
+        before = self._call_counts()
+        samples = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            self._run_once(fn, i)
+            samples.append(time.perf_counter() - start)
+        after = self._call_counts()
+        # tracemalloc 会拖慢执行，峰值内存单独测量，不影响上面的延迟样本
+        tracemalloc.start()
+        self._run_once(fn, iterations)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        result = {"iterations": iterations, **summarize_samples(samples)}
+        if self._ttft:
+            result["ttft"] = summarize_samples(self._ttft)
+        result["llm_calls_per_iter"] = round((after["llm"] - before["llm"]) / iterations, 2)
+        result["search_calls_per_iter"] = round((after["search"] - before["search"]) / iterations, 2)
+        result["peak_memory_kb"] = round(peak / 1024, 1)
+        return result
+
+    # --- 场景 ---
+    def master_stream(self, index: int):
+        writer = FirstTokenWriter()
+        start = time.perf_counter()
+        multi_agents_pro.run_master_agent_stream(QUERIES[index % len(QUERIES)], multi_agents_pro.ConversationMemory(), writer)
+        if writer.first_token_time:
+            self._ttft.append(writer.first_token_time - start)
+
+    async def master_stream_async(self, index: int):
+        writer = FirstTokenWriter()
+        start = time.perf_counter()
+        await multi_agents_pro.arun_master_agent_stream(QUERIES[index % len(QUERIES)], multi_agents_pro.ConversationMemory(), writer)
+        if writer.first_token_time:
+            self._ttft.append(writer.first_token_time - start)
+
+    def master_invoke(self, index: int):
+        multi_agents.run_master_agent(QUERIES[index % len(QUERIES)])
+
+    async def agent3_graph(self, index: int):
+        await self.agent3_app.ainvoke({
+            "messages": [HumanMessage(content=QUERIES[index % len(QUERIES)])],
+            "user_profile": {},
+            "current_topic": "",
+            "knowledge_links": [],
+        })
+
+    def memory_benchmarks(self, operations: int) -> Dict[str, Dict[str, Any]]:
+        """ConversationMemory 的单次操作耗时：添加消息（内存/日志存储）、组装上下文、导出与恢复"""
+        results = {}
+        in_memory = multi_agents_pro.ConversationMemory()
+        results["memory_add_message"] = self.measure(
+            lambda i: in_memory.add_message("user" if i % 2 == 0 else "assistant", f"{QUERIES[i % len(QUERIES)]}（第{i}条）"),
+            operations,
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = MemoryJournal(path_prefix=os.path.join(tmp, "bench_memory"))
+            journaled = multi_agents_pro.ConversationMemory(journal=journal)
+            results["memory_add_message_journal"] = self.measure(
+                lambda i: journaled.add_message("user" if i % 2 == 0 else "assistant", f"{QUERIES[i % len(QUERIES)]}（第{i}条）"),
+                operations,
+            )
+            journal.close()
+
+        long_history = multi_agents_pro.ConversationMemory(max_history=200)
+        for i in range(200):
+            long_history.add_message("user" if i % 2 == 0 else "assistant", self.model._answer(QUERIES[i % len(QUERIES)]))
+            long_history.update_user_profile(QUERIES[i % len(QUERIES)])
+        results["memory_build_context"] = self.measure(
+            lambda i: multi_agents_pro.build_master_messages(QUERIES[i % len(QUERIES)], long_history),
+            self.iterations,
+        )
+        results["memory_to_dict_restore"] = self.measure(
+            lambda i: multi_agents_pro.ConversationMemory(max_history=200).restore(long_history.to_dict()),
+            operations,
+        )
+        return results
+
+    def run(self, scenarios: List[str], memory_operations: int) -> Dict[str, Dict[str, Any]]:
+        results = {}
+        # 屏蔽智能体的状态输出，只保留测试结果
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name in scenarios:
+                if name == "memory":
+                    results.update(self.memory_benchmarks(memory_operations))
+                else:
+                    results[name] = self.measure(getattr(self, name))
+        return results
+
+SCENARIOS = ["master_stream", "master_stream_async", "master_invoke", "agent3_graph", "memory"]
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """打印与基线结果的对比（p50/p95 变化与调用次数变化）"""
+    print(f"\n📊 与基线对比（基线时间：{baseline['config'].get('timestamp', '未知')}）")
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if not old:
+            print(f"{name}：基线中没有该场景")
+            continue
+        changes = []
+        for key in ("p50_ms", "p95_ms"):
+            change = (result[key] - old[key]) / old[key] if old[key] else 0.0
+            changes.append(f"{key[:3]} {old[key]:.2f} -> {result[key]:.2f}ms（{change:+.0%}）")
+        if result["llm_calls_per_iter"] != old["llm_calls_per_iter"]:
+            changes.append(f"模型调用 {old['llm_calls_per_iter']} -> {result['llm_calls_per_iter']}")
+        print(f"{name}：{'，'.join(changes)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准测试套件（模拟模型与模拟搜索）")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--iterations", type=int, default=20, help="每个智能体场景的计时次数")
+    parser.add_argument("--memory-operations", type=int, default=1000, help="记忆操作场景的计时次数")
+    parser.add_argument("--llm-latency", default="0", help="模拟模型延迟分布，如 0.2、uniform:0.1,0.3、lognormal:0.2,0.5")
+    parser.add_argument("--search-latency", default="0", help="模拟搜索延迟分布，格式同 --llm-latency")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="流式输出相邻片段之间的延迟（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="延迟分布的随机种子")
+    parser.add_argument("-o", "--output", help="把 JSON 结果写入文件，默认输出到终端")
+    parser.add_argument("--compare", metavar="BASELINE", help="与之前保存的 JSON 结果对比")
+    args = parser.parse_args()
+
+    suite = BenchmarkSuite(args.iterations, args.llm_latency, args.search_latency, args.token_latency, args.seed)
+    results = suite.run(args.scenarios, args.memory_operations)
+    report = {
+        "config": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "iterations": args.iterations,
+            "memory_operations": args.memory_operations,
+            "llm_latency": str(LatencyDistribution.parse(args.llm_latency)),
+            "search_latency": str(LatencyDistribution.parse(args.search_latency)),
+            "token_latency": args.token_latency,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"✅ 基准测试结果已写入 {args.output}")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
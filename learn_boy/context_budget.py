@@ -0,0 +1,193 @@
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 按 token 预算组装发送给主控智能体的对话上下文：
+# - 从最新的消息开始往前保留完整消息，直到用完预算
+# - 放不下的旧消息合并进一段滚动摘要；摘要缓存在对话记忆里，只有新消息被挤出窗口时才增量更新
+# - 窗口的起点按块前移：超出条数或预算时一次移出 CONTEXT_WINDOW_BLOCK 条消息，之后几轮起点不变，
+#   历史部分的前缀保持逐字节相同，DeepSeek 的前缀缓存可以连续命中（见 multi_agents_pro.PREFIX_CACHE_LAYOUT）
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))  # 上下文 + 摘要 + 历史消息的 token 上限
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "400"))   # 滚动摘要的 token 上限
+CONTEXT_MAX_MESSAGES = 8  # 最多保留的完整历史消息数（最近4轮对话）
+CONTEXT_WINDOW_BLOCK = int(os.getenv("CONTEXT_WINDOW_BLOCK", "6"))  # 窗口起点每次前移的消息数，1 表示逐条滑动
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+_encoder = None
+_encoder_loaded = False
+_encoder_lock = threading.Lock()
+
+def _get_encoder():
+    """加载 tiktoken 编码器；词表不在本地且无法下载时返回 None，改用字符数估算"""
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        with _encoder_lock:
+            if not _encoder_loaded:
+                try:
+                    import tiktoken
+                    _encoder = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                except Exception:
+                    _encoder = None
+                _encoder_loaded = True
+    return _encoder
+
+def estimate_tokens(text: str) -> int:
+    """按 DeepSeek 官方给出的换算估算 token 数：1 个中文字符约 0.6 token，1 个英文字符约 0.3 token"""
+    cjk = sum(1 for ch in text if ord(ch) > 0x2E7F)
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+def count_tokens(text: str) -> int:
+    """统计文本的 token 数（优先使用本地 tokenizer）"""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截断文本使其不超过 max_tokens，保留开头部分"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoder = _get_encoder()
+    if encoder is not None:
+        return encoder.decode(encoder.encode(text, disallowed_special=())[:max_tokens]) + "…"
+    end = len(text)
+    while end > 0 and estimate_tokens(text[:end]) > max_tokens:
+        end = int(end * 0.9)
+    return text[:end] + "…"
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """单条消息的 token 数，另加 4 个 token 近似角色标记等格式开销"""
+    return count_tokens(message["content"]) + 4
+
+class ContextBuilder:
+    """
+    带 token 预算的上下文构建器
+
+    Args:
+        summarizer: 摘要函数，接收 (已有摘要, 新被挤出窗口的消息, token 上限)，返回新的摘要
+        budget (int): 每次调用的上下文 token 上限（不含系统提示词和当前用户输入）
+        summary_budget (int): 滚动摘要的 token 上限
+        max_messages (int): 最多保留的完整历史消息数
+        window_block (int): 窗口起点每次前移的消息数
+    """
+    def __init__(self, summarizer: Callable[[str, List[Dict[str, Any]], int], str],
+                 budget: int = CONTEXT_TOKEN_BUDGET, summary_budget: int = SUMMARY_TOKEN_BUDGET,
+                 max_messages: int = CONTEXT_MAX_MESSAGES, window_block: int = CONTEXT_WINDOW_BLOCK):
+        self.summarizer = summarizer
+        self.budget = budget
+        self.summary_budget = summary_budget
+        self.max_messages = max_messages
+        self.window_block = max(window_block, 1)
+        self.summaries_generated = 0
+        self.total_tokens_saved = 0
+
+    def _update_summary(self, conversation_memory, moved_out: List[Dict[str, Any]], summarize: bool):
+        """
+        窗口起点移到 moved_out 之后：需要摘要时把这些消息合并进滚动摘要，否则只记录新的起点
+
+        summary_until 同时是窗口起点的标记，之后几轮的窗口都从它之后的第一条消息开始
+        """
+        summary = conversation_memory.history_summary
+        if summarize:
+            summary = truncate_to_tokens(self.summarizer(summary, moved_out, self.summary_budget), self.summary_budget)
+            self.summaries_generated += 1
+        conversation_memory.update_history_summary(summary, moved_out[-1]["timestamp"])
+
+    def build(self, conversation_memory, context: str = "") -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+        """
+        构建历史消息列表
+
+        Args:
+            conversation_memory (ConversationMemory): 对话记忆实例
+            context (str): 对话上下文摘要（get_conversation_context 的结果）
+
+        Returns:
+            Tuple[List[Dict[str, str]], Dict[str, int]]: (消息列表, token 统计)
+        """
+        history = conversation_memory.conversation_history
+        recent = history[-self.max_messages:]
+        context_message = {"role": "system", "content": f"对话上下文：{context}"} if context and history else None
+        context_tokens = message_tokens(context_message) if context_message else 0
+        # 未做预算控制时会发送的 token 数：上下文 + 最近的完整消息
+        full_tokens = context_tokens + sum(message_tokens(msg) for msg in recent)
+
+        # 先按"需要摘要"预留摘要的空间。窗口从上次的起点（summary_until 之后）开始，
+        # 条数或 token 超出时按块前移起点，直到放得下（至少保留最新的一条消息）
+        history_budget = max(self.budget - context_tokens - self.summary_budget, 0)
+        summary_until = conversation_memory.summary_until or ""
+        window = [msg for msg in history if msg["timestamp"] > summary_until]
+        start, over_budget = 0, False
+        while start < len(window) - 1:
+            tokens = sum(message_tokens(msg) for msg in window[start:])
+            if len(window) - start <= self.max_messages and tokens <= history_budget:
+                break
+            over_budget = over_budget or tokens > history_budget
+            start = min(start + self.window_block, len(window) - 1)
+        kept = [{"role": msg["role"], "content": msg["content"]} for msg in window[start:]]
+        if len(kept) == 1 and message_tokens(kept[0]) > history_budget:
+            # 最新的一条消息本身就超出预算时，截断后保留，保证上一轮的内容不会完全丢失
+            kept[0]["content"] = truncate_to_tokens(kept[0]["content"], max(history_budget - 4, 0))
+            over_budget = True
+
+        # 预算不足时，移出窗口的消息进入滚动摘要；一旦开始摘要就持续增量维护。
+        # 从未超出预算的短对话与原来一样只保留最近的消息，不额外调用模型
+        if start:
+            self._update_summary(conversation_memory, window[:start],
+                                 summarize=over_budget or bool(conversation_memory.history_summary))
+        dropped = history[:len(history) - len(kept)]
+
+        messages: List[Dict[str, str]] = []
+        system_parts = []
+        if context_message:
+            system_parts.append(context_message["content"])
+        if dropped and conversation_memory.history_summary:
+            system_parts.append(f"更早对话的摘要：\n{conversation_memory.history_summary}")
+        if system_parts:
+            messages.append({"role": "system", "content": "\n\n".join(system_parts)})
+        messages.extend(kept)
+
+        used_tokens = sum(message_tokens(msg) for msg in messages)
+        stats = {
+            "full_tokens": full_tokens,
+            "used_tokens": used_tokens,
+            "saved_tokens": max(full_tokens - used_tokens, 0),
+            "kept_messages": len(kept),
+            "summarized_messages": len(dropped),
+        }
+        self.total_tokens_saved += stats["saved_tokens"]
+        return messages, stats
+
+def make_llm_summarizer(model) -> Callable[[str, List[Dict[str, Any]], int], str]:
+    """
+    用聊天模型生成增量摘要
+
+    Args:
+        model: 聊天模型，建议使用 temperature=0 的确定性模型以便命中回复缓存；
+            也可以传入返回模型的无参函数，首次生成摘要时才创建模型
+
+    Returns:
+        Callable: ContextBuilder 使用的摘要函数
+    """
+    get_model = model if not hasattr(model, "invoke") else (lambda: model)
+
+    def summarize(previous_summary: str, messages: List[Dict[str, Any]], max_tokens: int) -> str:
+        dialogue = "\n".join(
+            f"{'用户' if msg['role'] == 'user' else '助手'}：{msg['content']}" for msg in messages
+        )
+        prompt = f"""请把以下对话合并进已有摘要，生成一段新的对话摘要。
+要求：
+1. 保留用户的学习目标、当前水平、偏好，以及助手已经给出的计划/资料/解释的要点
+2. 省略寒暄和重复内容，不超过{max_tokens // 2}字
+3. 只输出摘要正文
+
+已有摘要：
+{previous_summary or "无"}
+
+新增对话：
+{dialogue}"""
+        response = get_model().invoke([{"role": "user", "content": prompt}])
+        return response.content.strip()
+    return summarize
@@ -0,0 +1,18 @@
+import os
+
+# 运行时数据（缓存库、会话库、计划库、统计日志、报告等）的存放目录。
+# 默认是代码所在目录，不随启动时的工作目录变化；可通过 LEARN_BOY_DATA_DIR 统一改到其他位置。
+# 各文件仍可用各自的环境变量单独指定，相对路径按当前工作目录解析
+DATA_DIR = os.getenv("LEARN_BOY_DATA_DIR", os.path.dirname(os.path.abspath(__file__)))
+
+def data_path(name: str) -> str:
+    """
+    运行时数据文件的默认路径
+
+    Args:
+        name (str): 文件或目录名，如 llm_cache.sqlite3
+
+    Returns:
+        str: DATA_DIR 下的绝对路径
+    """
+    return os.path.join(DATA_DIR, name)
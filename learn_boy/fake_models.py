@@ -0,0 +1,301 @@
+import json
+import math
+import time
+import random
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+from pydantic import Field
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_tavily import TavilySearch
+from context_budget import count_tokens
+
+# 用于基准测试的离线聊天模型与搜索工具：不访问网络，按固定规则回复，并模拟模型与搜索延迟
+
+class LatencyDistribution:
+    """
+    可复现的模拟延迟分布，由字符串描述：
+    - "0.2" 或 "fixed:0.2"：固定延迟
+    - "uniform:0.1,0.3"：均匀分布
+    - "lognormal:0.2,0.5"：对数正态分布（中位数, sigma），模拟偶发的长尾延迟
+    相同的 seed 产生相同的延迟序列
+    """
+    def __init__(self, kind: str = "fixed", params=(0.0,), seed: int = 0):
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"未知的延迟分布：{kind}")
+        self.kind = kind
+        self.params = tuple(float(p) for p in params)
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec, seed: int = 0) -> "LatencyDistribution":
+        spec = str(spec)
+        kind, _, params = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+        return cls(kind, params.split(","), seed)
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "uniform":
+                return self._random.uniform(*self.params[:2])
+            if self.kind == "lognormal":
+                median, sigma = self.params[:2]
+                return self._random.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+            return self.params[0]
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{','.join(f'{p:g}' for p in self.params)}"
+
+class FakeChatModelBase(BaseChatModel):
+    """离线聊天模型基类：模拟延迟、记录绑定的工具、统计调用次数，并支持逐 token 流式输出"""
+    latency: float = 0.0              # 每次调用的模拟延迟（秒），即流式输出的首个 token 延迟
+    latency_distribution: Optional[LatencyDistribution] = Field(default=None, exclude=True)  # 设置后替代 latency
+    token_latency: float = 0.0        # 流式输出时相邻两个片段之间的延迟（秒）
+    stream_chunk_chars: int = 4       # 流式输出时每个片段的字符数
+    bound_tool_names: List[str] = []
+    # 调用统计。bind_tools 生成的副本与原模型共享同一个字典，便于汇总一轮中的全部调用
+    call_stats: Dict[str, int] = Field(default_factory=lambda: {"calls": 0})
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools, **kwargs):
+        names = [convert_to_openai_tool(t)["function"]["name"] for t in tools]
+        return self.model_copy(update={"bound_tool_names": names})
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        raise NotImplementedError
+
+    def _with_usage(self, messages: List[BaseMessage], reply: AIMessage) -> AIMessage:
+        """估算输入/输出 token 数写入 usage_metadata，使指标回调能统计模拟调用的 token"""
+        input_tokens = sum(count_tokens(m.content) for m in messages if isinstance(m.content, str))
+        output_tokens = count_tokens(reply.content) + sum(
+            count_tokens(json.dumps(call["args"], ensure_ascii=False)) for call in reply.tool_calls)
+        reply.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                                "total_tokens": input_tokens + output_tokens}
+        return reply
+
+    def _delay(self) -> float:
+        return self.latency_distribution.sample() if self.latency_distribution else self.latency
+
+    def _chunks(self, message: AIMessage) -> List[AIMessageChunk]:
+        """把回复拆成流式片段：工具调用作为一个片段，文本按 stream_chunk_chars 切分"""
+        if message.tool_calls:
+            return [AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"], ensure_ascii=False), "id": call["id"], "index": i}
+                for i, call in enumerate(message.tool_calls)
+            ], usage_metadata=message.usage_metadata)]
+        text = message.content
+        size = max(self.stream_chunk_chars, 1)
+        chunks = [AIMessageChunk(content=text[i:i + size]) for i in range(0, len(text), size)] or [AIMessageChunk(content="")]
+        # token 用量只附在最后一个片段上，合并后即为整条回复的用量
+        chunks[-1].usage_metadata = message.usage_metadata
+        return chunks
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        self.call_stats["calls"] += 1
+        time.sleep(self._delay())
+        return ChatResult(generations=[ChatGeneration(message=self._with_usage(messages, self._reply(messages)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        self.call_stats["calls"] += 1
+        await asyncio.sleep(self._delay())
+        return ChatResult(generations=[ChatGeneration(message=self._with_usage(messages, self._reply(messages)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self.call_stats["calls"] += 1
+        time.sleep(self._delay())
+        for i, chunk in enumerate(self._chunks(self._with_usage(messages, self._reply(messages)))):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        self.call_stats["calls"] += 1
+        await asyncio.sleep(self._delay())
+        for i, chunk in enumerate(self._chunks(self._with_usage(messages, self._reply(messages)))):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=chunk)
+
+def _tool_call(name: str, args: dict, index: int) -> dict:
+    return {"name": name, "args": args, "id": f"call_{name}_{index}"}
+
+class FakeLearningChatModel(FakeChatModelBase):
+    """
+    模拟学习助手场景的聊天模型
+
+    - 绑定了子智能体工具（主控智能体）且最后一条是用户消息时，调用 route_tool
+    - 绑定了搜索工具（子智能体）且最后一条是用户消息时，调用 search_tool
+    - 最后一条是工具结果时，主控智能体给出简短的总结（echo_tool_results 时先复述工具结果），子智能体给出模拟回答
+    - 其他情况（子智能体）直接返回模拟回答
+    """
+    route_tool: str = "learn_plan_agent_tool"
+    search_tool: str = "tavily_search"
+    answer_chars: int = 0             # 模拟回答的最小长度，用于产生足够多的流式片段
+    echo_tool_results: bool = False   # 主控智能体是否按提示词"直接输出"子智能体结果（在收尾前复述一遍工具结果）
+
+    def _answer(self, query: str) -> str:
+        answer = f"【模拟回答】{query}"
+        if len(answer) < self.answer_chars:
+            answer += "模拟内容" * ((self.answer_chars - len(answer)) // 4 + 1)
+        return answer
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        last = messages[-1]
+        if isinstance(last, HumanMessage):
+            for name in (self.route_tool, self.search_tool):
+                if name in self.bound_tool_names:
+                    return AIMessage(content="", tool_calls=[_tool_call(name, {"query": last.content}, len(messages))])
+            return AIMessage(content=self._answer(last.content))
+        if isinstance(last, ToolMessage):
+            if self.route_tool in self.bound_tool_names:
+                # 工具返回的是直通摘要（artifact 中带句柄）时，结果已经展示给用户，只给出简短收尾
+                if self.echo_tool_results and not getattr(last, "artifact", None):
+                    return AIMessage(content=f"{last.content}\n\n以上内容已为您整理完成。")
+                return AIMessage(content="以上内容已为您整理完成。")
+            query = next(m.content for m in reversed(messages) if isinstance(m, HumanMessage))
+            return AIMessage(content=self._answer(query))
+        return AIMessage(content=self._answer(str(last.content)))
+
+class PolicyChatModel(FakeChatModelBase):
+    """
+    由策略函数决定回复的聊天模型，用于编排更复杂的多步流程。
+    策略函数接收 (消息列表, 当前绑定的工具名列表)，返回 AIMessage。
+    """
+    policy: Callable[[List[BaseMessage], List[str]], AIMessage]
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        return self.policy(messages, self.bound_tool_names)
+
+class FakeTavilySearch(TavilySearch):
+    """离线的 TavilySearch：按延迟分布模拟搜索耗时，返回与 Tavily 格式一致的固定结果"""
+    latency_distribution: LatencyDistribution = Field(default_factory=LatencyDistribution, exclude=True)
+    call_stats: Dict[str, int] = Field(default_factory=lambda: {"calls": 0}, exclude=True)
+
+    def _result(self, query: str) -> Dict[str, Any]:
+        self.call_stats["calls"] += 1
+        return {
+            "query": query,
+            "results": [
+                {"title": f"{query} 学习资料 {i}", "url": f"https://example.com/{i}",
+                 "content": f"关于「{query}」的模拟搜索结果 {i}。" * 5, "score": round(1 - i * 0.1, 2)}
+                for i in range(1, self.max_results + 1)
+            ],
+            "response_time": 0.0,
+        }
+
+    def _run(self, query: str, run_manager=None, **kwargs: Any) -> Dict[str, Any]:
+        time.sleep(self.latency_distribution.sample())
+        return self._result(query)
+
+    async def _arun(self, query: str, run_manager=None, **kwargs: Any) -> Dict[str, Any]:
+        await asyncio.sleep(self.latency_distribution.sample())
+        return self._result(query)
+
+# agent3 场景的模拟数据与策略
+ANALYSIS_RESULT = {"level": "0基础", "career": "学生", "topic": "神经网络", "previous_topics": []}
+PARALLEL_TOOLS = ["adjust_explanation_depth_tool", "provide_contextual_examples_tool", "make_knowledge_connections_tool"]
+
+def agent3_policy(messages: List[BaseMessage], bound_tools: List[str]) -> AIMessage:
+    """模拟 DeepSeek 在 agent3 中的典型行为（配合 PolicyChatModel 使用）"""
+    # 一次性查询分析（结构化输出）
+    if "QueryAnalysis" in bound_tools:
+        return AIMessage(content="", tool_calls=[_tool_call("QueryAnalysis", ANALYSIS_RESULT, 0)])
+    # 工具内部的模型调用
+    if not bound_tools:
+        return AIMessage(content='{"level": "0基础", "career": "学生"}')
+    # Agent 节点：按已完成的工具决定下一步
+    last_human = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+    done = {m.name for m in messages[last_human:] if isinstance(m, ToolMessage)}
+    topic_args = {"topic": "神经网络"}
+    if "analyze_query_tool" in bound_tools:
+        if "analyze_query_tool" not in done:
+            return AIMessage(content="", tool_calls=[_tool_call("analyze_query_tool", {"query": messages[last_human].content}, 0)])
+    else:
+        if "get_user_background_tool" not in done:
+            return AIMessage(content="", tool_calls=[_tool_call("get_user_background_tool", {"query": messages[last_human].content}, 0)])
+        if "identify_topic_tool" not in done:
+            return AIMessage(content="", tool_calls=[_tool_call("identify_topic_tool", {"query": messages[last_human].content}, 0)])
+    if not done.intersection(PARALLEL_TOOLS):
+        return AIMessage(content="", tool_calls=[
+            _tool_call("adjust_explanation_depth_tool", {**topic_args, "level": "0基础"}, 1),
+            _tool_call("provide_contextual_examples_tool", {**topic_args, "career": "学生"}, 2),
+            _tool_call("make_knowledge_connections_tool", {**topic_args, "previous_topics": []}, 3),
+        ])
+    return AIMessage(content="这是为您整理的神经网络讲解。")
+
+def install_fake_master_agents(multi_agents_module, latency: float = 0.0, model: FakeLearningChatModel = None,
+                               search_tool: TavilySearch = None) -> FakeLearningChatModel:
+    """
+    把 multi_agents_pro 的主控智能体和子智能体替换为使用离线模拟模型的版本
+
+    Args:
+        multi_agents_module: 已导入的 multi_agents_pro 模块
+        latency (float): 模拟模型每次调用的延迟（秒），传入 model 时忽略
+        model (FakeLearningChatModel): 使用的模拟模型，默认新建
+        search_tool (TavilySearch): 子智能体使用的搜索工具（如 FakeTavilySearch），默认子智能体不搜索
+
+    Returns:
+        FakeLearningChatModel: 使用的模拟模型，可通过 call_stats 查看调用次数
+    """
+    from langchain.agents import create_agent
+    fake_model = model or FakeLearningChatModel(latency=latency)
+    sub_agent_tools = [search_tool] if search_tool else []
+    for name, (_agent, label) in list(multi_agents_module.SUB_AGENTS.items()):
+        multi_agents_module.SUB_AGENTS[name] = (create_agent(model=fake_model, tools=sub_agent_tools, prompt=label), label)
+        # 搜索闸门判断无需联网时使用的不带搜索工具的版本
+        multi_agents_module.OFFLINE_SUB_AGENTS[name] = create_agent(model=fake_model, tools=[], prompt=label)
+    multi_agents_module.master_agent = create_agent(
+        model=fake_model,
+        tools=multi_agents_module.master_agent_tools,
+        prompt=multi_agents_module.master_agent_system_prompt
+    )
+    multi_agents_module.async_master_agent = create_agent(
+        model=fake_model,
+        tools=multi_agents_module.async_master_agent_tools,
+        prompt=multi_agents_module.master_agent_system_prompt
+    )
+    # 超出上下文预算时的历史摘要也改用模拟模型
+    from context_budget import make_llm_summarizer
+    multi_agents_module.context_builder.summarizer = make_llm_summarizer(fake_model)
+    return fake_model
+
+def install_fake_multi_agents(multi_agents_module, model: FakeLearningChatModel, search_tool: TavilySearch = None):
+    """把 multi_agents 的两个子智能体和主控智能体替换为使用离线模拟模型的版本"""
+    from langchain.agents import create_agent
+    tools = [search_tool] if search_tool else []
+    multi_agents_module.learn_plan_agent = create_agent(
+        model=model, tools=tools, prompt=multi_agents_module.learn_plan_agent_system_prompt)
+    multi_agents_module.learn_data_agent = create_agent(
+        model=model, tools=tools, prompt=multi_agents_module.learn_data_agent_system_prompt)
+    multi_agents_module.master_agent = create_agent(
+        model=model,
+        tools=[multi_agents_module.learn_plan_agent_tool, multi_agents_module.learn_data_agent_tool],
+        prompt=multi_agents_module.master_agent_system_prompt
+    )
+    multi_agents_module.async_master_agent = create_agent(
+        model=model,
+        tools=[multi_agents_module.alearn_plan_agent_tool, multi_agents_module.alearn_data_agent_tool],
+        prompt=multi_agents_module.master_agent_system_prompt
+    )
+
+def install_fake_agent3(agent3_module, latency: float = 0.0, model: PolicyChatModel = None) -> PolicyChatModel:
+    """
+    让 agent3 的 Agent 节点和工具都使用按 agent3_policy 回复的离线模拟模型（需在 build_graph 之前调用）
+
+    Returns:
+        PolicyChatModel: 使用的模拟模型，可通过 call_stats 查看调用次数
+    """
+    fake_model = model or PolicyChatModel(policy=agent3_policy, latency=latency)
+    agent3_module.get_chat_model = lambda **kwargs: fake_model
+    return fake_model
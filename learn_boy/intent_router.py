@@ -0,0 +1,85 @@
+import os
+import re
+from typing import Dict, List, Optional, Set
+from semantic_cache import CONTEXT_DEPENDENT_KEYWORDS
+
+# 本地意图路由：意图明确的请求直接交给对应的子智能体，省去主控智能体"决定调用哪个工具"的一次模型往返；
+# 拿不准（多种意图混杂、否定表达、依赖上文、没有明确意图）时返回 None，仍由主控智能体编排。
+# 各意图的关键词编译成一个带命名分组的正则，一次扫描即可找出请求中出现的全部意图
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "1") == "1"
+
+# 选择学什么、先学哪个的问题属于学习规划
+CHOICE_KEYWORDS = ["先学哪", "学哪个", "选哪", "怎么选", "该选"]
+# 比较类关键词：单独出现时是请求解释（"进程和线程的区别"），
+# 与选择类关键词一起出现时只是选择的依据（"Python和Java有什么区别，我该先学哪个"），按学习规划处理
+COMPARISON_KEYWORDS = ["区别"]
+
+# 意图 -> 关键词正则片段。plan/data/explain 对应 SUB_AGENTS 中的子智能体，
+# full 表示"学习计划+配套资源"的完整方案（主控提示词中的场景3）
+ROUTE_PATTERNS: Dict[str, List[str]] = {
+    "plan": [
+        "学习计划", "学习路线", "学习路径", "学习规划", "路线图", "规划", "计划", "时间表", "日程",
+        "怎么学", "如何学", "从哪.{0,2}开始", "先学什么", "学习顺序", "roadmap", *CHOICE_KEYWORDS,
+    ],
+    "data": [
+        "资料", "资源", "教程", "书单", "书籍", "课程", "文档", "视频", "网站", "博客", "链接", "开源项目",
+        "推荐.{0,6}(书|课|视频|网站|文档|博客|项目)",
+    ],
+    "explain": [
+        "解释", "什么是", "是什么", "通俗", "形象", "举例", "例子", "比喻", "原理", "讲解", "讲讲",
+        "介绍一下", *COMPARISON_KEYWORDS, "为什么", "怎么理解", "如何理解",
+    ],
+    "full": ["完整方案", "完整的学习方案", "全套", "一条龙", "学习方案", "体系化"],
+}
+
+# 否定或限定表达（如"不需要资料"）容易让关键词匹配出错，交给主控智能体判断
+NEGATION_PATTERN = re.compile("不要|不需要|无需|不用|除了|别给")
+
+# 过短的输入（如"好的"、"谢谢"）没有明确意图
+MIN_ROUTABLE_QUERY_LENGTH = 4
+
+INTENT_PATTERN = re.compile(
+    "|".join(f"(?P<{intent}>{'|'.join(patterns)})" for intent, patterns in ROUTE_PATTERNS.items()),
+    re.IGNORECASE,
+)
+
+def _intent_matches(query: str) -> Dict[str, Set[str]]:
+    """返回查询中出现的意图及各自命中的关键词"""
+    matches: Dict[str, Set[str]] = {}
+    for match in INTENT_PATTERN.finditer(query):
+        matches.setdefault(match.lastgroup, set()).add(match.group().lower())
+    return matches
+
+def match_intents(query: str) -> set:
+    """返回查询中出现的全部意图"""
+    return set(_intent_matches(query))
+
+def route_query(query: str, allow_parallel: bool = True) -> Optional[List[str]]:
+    """
+    判断查询能否绕过主控智能体直接交给子智能体
+
+    Args:
+        query (str): 用户输入
+        allow_parallel (bool): 是否允许把"计划+资料"类请求同时交给两个子智能体
+
+    Returns:
+        Optional[List[str]]: 需要调用的子智能体简称（plan/data/explain），无法确定时返回 None
+    """
+    query = query.strip()
+    if len(query) < MIN_ROUTABLE_QUERY_LENGTH:
+        return None
+    if NEGATION_PATTERN.search(query) or any(keyword in query for keyword in CONTEXT_DEPENDENT_KEYWORDS):
+        return None
+    matches = _intent_matches(query)
+    intents = set(matches)
+    # 选择类问题优先：解释意图只来自比较类关键词时，不再算作另一种意图
+    if set(CHOICE_KEYWORDS) & matches.get("plan", set()) and matches.get("explain", set()) <= set(COMPARISON_KEYWORDS):
+        intents.discard("explain")
+    if "full" in intents and "explain" not in intents:
+        intents = {"plan", "data"}
+    if intents == {"plan", "data"}:
+        return ["plan", "data"] if allow_parallel else None
+    if len(intents) == 1 and "full" not in intents:
+        return list(intents)
+    return None
@@ -6,6 +6,8 @@ from langchain_core.runnables import RunnableConfig
 from langchain.chat_models import init_chat_model
 from langgraph.checkpoint.memory import InMemorySaver
 from langchain_tavily import TavilySearch
+from search_cache import CachedTavilySearch
+from model_registry import deepseek_client_kwargs
 from dataclasses import dataclass
 
 # 加载.env文件中的环境变量
@@ -13,10 +15,12 @@ load_dotenv()          # os.environ["DEEPSEEK_API_KEY"]
 
 model = init_chat_model(
     "deepseek:deepseek-chat",
-    temperature=0
+    temperature=0,
+    **deepseek_client_kwargs()  # 共享连接池，并经过进程级限流
 )
 
-tavily_search_tool = TavilySearch(
+# 使用带 TTL/LRU 缓存的搜索工具，所有智能体共享同一份缓存
+tavily_search_tool = CachedTavilySearch(
     max_results=5,
     topic="general",
     # include_answer=False,
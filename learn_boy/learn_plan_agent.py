@@ -6,6 +6,9 @@ from langchain_core.runnables import RunnableConfig
 from langchain.chat_models import init_chat_model
 from langgraph.checkpoint.memory import InMemorySaver
 from langchain_tavily import TavilySearch
+from search_cache import CachedTavilySearch
+from search_gate import decide_search, get_search_gate, searched_in
+from model_registry import deepseek_client_kwargs
 from dataclasses import dataclass
 
 # 加载.env文件中的环境变量
@@ -13,10 +16,12 @@ load_dotenv()          # os.environ["DEEPSEEK_API_KEY"]
 
 model = init_chat_model(
     "deepseek:deepseek-chat",
-    temperature=0
+    temperature=0,
+    **deepseek_client_kwargs()  # 共享连接池，并经过进程级限流
 )
 
-tavily_search_tool = TavilySearch(
+# 使用带 TTL/LRU 缓存的搜索工具，所有智能体共享同一份缓存
+tavily_search_tool = CachedTavilySearch(
     max_results=5,
     topic="general",
     # include_answer=False,
@@ -113,20 +118,6 @@ Stack Overflow 关键词）”。
 
 # system_prompt = get_user_input()
 
-# 判断是否需要联网搜索
-# needs_internet = needs_internet_search(system_prompt)
-needs_internet = True
-
-# 根据判断结果创建工具列表
-if needs_internet:
-    tools = [tavily_search_tool]
-    # print("检测到需要联网搜索，已启用Tavily搜索工具")
-else:
-    tools = []
-    # print("检测到禁用联网工具")
-
-agent = create_agent(model=model, tools=tools, prompt=system_prompt)
-
 # user_input = "请将Pytorch、TensorFlow、MindSpore三个AI框架按照目前国内外综合使用率和流行性排序，并给出参考依据"
 
 # 从context.txt文件中读取内容
@@ -143,6 +134,22 @@ def get_user_input():
 
 user_input = get_user_input()
 
+# 判断是否需要联网搜索：由搜索闸门按请求判断（时效性、主题是否稳定、历史决定），需要读取用户输入后再创建智能体
+# needs_internet = needs_internet_search(system_prompt)
+search_decision = decide_search("plan", user_input)
+needs_internet = search_decision.needed
+
+# 根据判断结果创建工具列表
+if needs_internet:
+    tools = [tavily_search_tool]
+    # print("检测到需要联网搜索，已启用Tavily搜索工具")
+else:
+    tools = []
+    system_prompt += "\n本次请求无需联网搜索，请直接依据已有知识作答。"
+    # print("检测到禁用联网工具")
+
+agent = create_agent(model=model, tools=tools, prompt=system_prompt)
+
 # 获取agent的完整响应
 result = None
 for step in agent.stream(
@@ -153,4 +160,7 @@ for step in agent.stream(
 
 # 输出最终的AI消息
 if result:
-    result["messages"][-1].pretty_print()
\ No newline at end of file
+    result["messages"][-1].pretty_print()
+    # 提供了搜索工具时，记录模型是否真的搜索了，相同的请求之后沿用这一决定
+    if needs_internet:
+        get_search_gate().record_outcome("plan", user_input, searched_in(result["messages"]))
\ No newline at end of file
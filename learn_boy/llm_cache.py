@@ -0,0 +1,88 @@
+import os
+import json
+import threading
+from typing import Any, Dict, Optional, Sequence
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+from lru_store import SQLiteLRUStore
+from data_dir import data_path
+
+# 模型回复缓存的默认配置，可通过环境变量覆盖
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", data_path("llm_cache.sqlite3"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))      # 缓存有效期（秒）
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))  # 最多缓存条数，超出按 LRU 淘汰
+
+# 序列化消息中不会发送给模型、且每次运行都可能变化的字段，计算缓存键时去掉
+_VOLATILE_MESSAGE_FIELDS = ("id", "usage_metadata", "response_metadata")
+
+def _normalize_prompt(prompt: str) -> str:
+    """
+    去掉序列化消息中的易变字段。智能体每次运行都会给消息分配新的随机ID，
+    命中缓存的回复也会带上不同的用量信息，不去掉的话内容相同的请求也无法命中缓存
+    """
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    if isinstance(messages, list):
+        for message in messages:
+            if isinstance(message, dict) and isinstance(message.get("kwargs"), dict):
+                for field in _VOLATILE_MESSAGE_FIELDS:
+                    message["kwargs"].pop(field, None)
+    return json.dumps(messages, ensure_ascii=False, sort_keys=True)
+
+class LLMResponseCache(BaseCache):
+    """
+    精确匹配的模型回复缓存，实现 LangChain 的 BaseCache 接口。
+
+    缓存键由模型与调用参数（llm_string，包含模型名、temperature、绑定的工具等）
+    以及完整消息列表（含系统提示词）组成，只应挂在 temperature=0 的确定性模型上。
+    """
+    def __init__(self, db_path: str = LLM_CACHE_DB, ttl_seconds: int = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.store = SQLiteLRUStore(db_path, "llm_cache", ttl_seconds=ttl_seconds, max_entries=max_entries)
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        return self.store.hash_key(llm_string + "\n---\n" + _normalize_prompt(prompt))
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        value = self.store.get(self._key(prompt, llm_string))
+        if value is None:
+            return None
+        messages = messages_from_dict(json.loads(value))
+        # 标记为本地缓存结果，用量统计（如前缀缓存命中率）据此跳过这些没有真正请求接口的调用
+        for message in messages:
+            message.response_metadata["from_llm_cache"] = True
+        return [ChatGeneration(message=message) for message in messages]
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]):
+        # 只缓存聊天模型的回复
+        if not all(isinstance(generation, ChatGeneration) for generation in return_val):
+            return
+        value = json.dumps([message_to_dict(generation.message) for generation in return_val],
+                           ensure_ascii=False)
+        self.store.set(self._key(prompt, llm_string), value)
+
+    def clear(self, **kwargs: Any):
+        self.store.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计"""
+        stats = self.store.stats()
+        stats["entries"] = len(self.store)
+        return stats
+
+_default_cache: Optional[LLMResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """获取进程内共享的模型回复缓存实例，LLM_CACHE_ENABLED=0 时返回 None（不缓存）"""
+    global _default_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMResponseCache()
+        return _default_cache
@@ -0,0 +1,244 @@
+import os
+import gzip
+import json
+import threading
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+from data_dir import data_path
+
+# 对话记忆的追加式日志存储：
+# - 每条消息追加为日志文件中的一行 JSON，写入成本与历史长度无关
+# - 日志累计一定条数后压缩成快照（先写临时文件再原子替换），随后重置日志
+# - 学习档案和滚动摘要很小且很少变化，最新版本各自单独原子写入一个文件，不进日志
+# - 加载时读取快照，再从日志末尾倒序读取最近的消息，不需要解析整个文件
+
+JOURNAL_COMPACT_EVERY = int(os.getenv("MEMORY_JOURNAL_COMPACT_EVERY", "500"))  # 每追加多少条记录压缩一次
+# 命令行对话记忆的默认位置（在 DATA_DIR 下，不随启动时的工作目录变化）
+MEMORY_JOURNAL_PREFIX = os.getenv("MEMORY_JOURNAL_PREFIX", data_path("conversation_memory"))  # 日志存储的路径前缀
+MEMORY_FILE = os.getenv("MEMORY_FILE", data_path("conversation_memory.json"))  # 不使用日志存储时的 JSON 记忆文件
+
+class MemoryJournal:
+    """ConversationMemory 的追加式日志存储"""
+    def __init__(self, path_prefix: str = MEMORY_JOURNAL_PREFIX, compress: bool = False,
+                 compact_every: int = JOURNAL_COMPACT_EVERY, fsync: bool = False):
+        suffix = ".gz" if compress else ""
+        self.snapshot_path = f"{path_prefix}.snapshot.json{suffix}"
+        self.journal_path = f"{path_prefix}.journal.jsonl{suffix}"
+        self.profile_path = f"{path_prefix}.profile.json"
+        self.summary_path = f"{path_prefix}.summary.json"
+        self.compress = compress
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.records_since_compaction = 0
+        self._generation: Optional[int] = None
+        self._handle = None
+        self._lock = threading.Lock()
+
+    # --- 文件读写 ---
+    def _open(self, path: str, mode: str):
+        if self.compress:
+            return gzip.open(path, mode + "t", encoding="utf-8")
+        return open(path, mode, encoding="utf-8")
+
+    def _read_snapshot(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with self._open(self.snapshot_path, "r") as f:
+            return json.load(f)
+
+    def _read_small_file(self, path: str) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _read_profile(self) -> Optional[Dict[str, Any]]:
+        return self._read_small_file(self.profile_path)
+
+    def _atomic_write(self, path: str, lines: List[str], compress: Optional[bool] = None):
+        """写入临时文件后原子替换，进程崩溃时不会留下写了一半的文件"""
+        compress = self.compress if compress is None else compress
+        tmp_path = f"{path}.tmp"
+        with (gzip.open(tmp_path, "wt", encoding="utf-8") if compress else open(tmp_path, "w", encoding="utf-8")) as f:
+            for line in lines:
+                f.write(line)
+            f.flush()
+            if not compress:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _current_generation(self) -> int:
+        if self._generation is None:
+            snapshot = self._read_snapshot()
+            self._generation = snapshot.get("generation", 0) if snapshot else 0
+        return self._generation
+
+    def _append_line(self, record: Dict[str, Any]):
+        with self._lock:
+            if self._handle is None:
+                if not os.path.exists(self.journal_path):
+                    header = {"type": "header", "generation": self._current_generation()}
+                    self._atomic_write(self.journal_path, [json.dumps(header) + "\n"])
+                self._handle = self._open(self.journal_path, "a")
+            self._handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._handle.flush()
+            if self.fsync and not self.compress:
+                os.fsync(self._handle.fileno())
+            self.records_since_compaction += 1
+
+    def _iter_journal(self) -> Iterator[Dict[str, Any]]:
+        """顺序读取日志记录，末尾写了一半的记录（崩溃导致）会被忽略"""
+        if not os.path.exists(self.journal_path):
+            return
+        try:
+            with self._open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except (EOFError, gzip.BadGzipFile):
+            # 压缩日志在写入过程中崩溃时会缺少结尾，已读出的记录仍然有效
+            return
+
+    def _journal_generation(self) -> int:
+        """读取日志首行记录的代数"""
+        for record in self._iter_journal():
+            return record.get("generation", 0) if record.get("type") == "header" else 0
+        return 0
+
+    def _count_journal_records(self, block_size: int = 1024 * 1024) -> int:
+        """统计日志中的记录数（不含首行），只数换行不解析 JSON；末尾写了一半的记录不计入"""
+        if not os.path.exists(self.journal_path):
+            return 0
+        lines = 0
+        try:
+            with (gzip.open(self.journal_path, "rb") if self.compress else open(self.journal_path, "rb")) as f:
+                for block in iter(lambda: f.read(block_size), b""):
+                    lines += block.count(b"\n")
+        except (EOFError, gzip.BadGzipFile):
+            pass
+        return max(lines - 1, 0)
+
+    def _iter_journal_reversed(self, block_size: int = 64 * 1024) -> Iterator[Dict[str, Any]]:
+        """从文件末尾倒序读取日志记录；压缩日志无法倒序定位，退化为顺序读取后倒序"""
+        if not os.path.exists(self.journal_path):
+            return
+        if self.compress:
+            yield from reversed(list(self._iter_journal()))
+            return
+        with open(self.journal_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            remainder = b""
+            while position > 0:
+                read_size = min(block_size, position)
+                position -= read_size
+                f.seek(position)
+                lines = (f.read(read_size) + remainder).split(b"\n")
+                remainder = lines.pop(0)
+                for line in reversed(lines):
+                    if line.strip():
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+            if remainder.strip():
+                try:
+                    yield json.loads(remainder)
+                except ValueError:
+                    pass
+
+    # --- 对外接口 ---
+    def exists(self) -> bool:
+        """是否已有持久化的记忆"""
+        return os.path.exists(self.snapshot_path) or os.path.exists(self.journal_path)
+
+    def append_message(self, message: Dict[str, Any]):
+        """追加一条对话消息"""
+        self._append_line({"type": "message", "message": message})
+
+    def append_profile(self, user_profile: Dict[str, Any]):
+        """记录最新的学习档案（整体原子替换，带上当前代数，压缩后旧档案自动失效）"""
+        with self._lock:
+            record = {"generation": self._current_generation(), "user_profile": user_profile}
+            self._atomic_write(self.profile_path, [json.dumps(record, ensure_ascii=False)], compress=False)
+
+    def append_summary(self, history_summary: str, summary_until: Optional[str]):
+        """记录最新的滚动摘要（与学习档案相同，整体原子替换并带上当前代数）"""
+        with self._lock:
+            record = {"generation": self._current_generation(), "history_summary": history_summary,
+                      "summary_until": summary_until}
+            self._atomic_write(self.summary_path, [json.dumps(record, ensure_ascii=False)], compress=False)
+
+    def should_compact(self) -> bool:
+        return self.records_since_compaction >= self.compact_every
+
+    def compact(self, memory_data: Dict[str, Any]):
+        """
+        把当前记忆状态写成快照并重置日志
+
+        Args:
+            memory_data (Dict[str, Any]): ConversationMemory.to_dict() 的结果
+        """
+        with self._lock:
+            generation = self._current_generation() + 1
+            snapshot = dict(memory_data, generation=generation)
+            self._atomic_write(self.snapshot_path, [json.dumps(snapshot, ensure_ascii=False)])
+            # 快照写入成功后再重置日志。若在两步之间崩溃，旧日志的代数小于快照，加载时会被忽略
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+            header = {"type": "header", "generation": generation}
+            self._atomic_write(self.journal_path, [json.dumps(header) + "\n"])
+            self._generation = generation
+            self.records_since_compaction = 0
+
+    def load(self, max_messages: int) -> Optional[Dict[str, Any]]:
+        """
+        加载记忆：读取快照和最新的学习档案，再从日志末尾倒序读取最近的 max_messages 条消息
+
+        Returns:
+            Optional[Dict[str, Any]]: 与 ConversationMemory.to_dict() 相同结构的数据，没有持久化数据时返回 None
+        """
+        if not self.exists():
+            return None
+        snapshot = self._read_snapshot() or {}
+        generation = snapshot.get("generation", 0)
+        self._generation = generation
+        profile = self._read_profile()
+        latest_profile = profile["user_profile"] if profile and profile.get("generation", 0) >= generation else None
+        summary = self._read_small_file(self.summary_path)
+        if not summary or summary.get("generation", 0) < generation:
+            summary = snapshot
+        recent_messages = deque()
+        journal_is_current = self._journal_generation() >= generation
+        # 日志代数小于快照说明上次压缩在重置日志前中断，日志内容已包含在快照里
+        if max_messages > 0 and journal_is_current:
+            for record in self._iter_journal_reversed():
+                if record.get("type") == "header":
+                    break
+                if record.get("type") == "message":
+                    recent_messages.appendleft(record["message"])
+                    # 最近的消息已读够，不再继续读更早的记录
+                    if len(recent_messages) >= max_messages:
+                        break
+        # 上面只读了最近的消息，日志中的实际记录数单独统计（最多算到 max_messages 会推迟压缩）
+        self.records_since_compaction = self._count_journal_records() if journal_is_current else 0
+
+        history = list(snapshot.get("conversation_history", []))
+        history.extend(recent_messages)
+        return {
+            "conversation_history": history[-max_messages:],
+            "user_profile": latest_profile or snapshot.get("user_profile"),
+            "session_start_time": snapshot.get("session_start_time"),
+            "history_summary": summary.get("history_summary") or "",
+            "summary_until": summary.get("summary_until"),
+        }
+
+    def close(self):
+        """关闭日志文件句柄"""
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
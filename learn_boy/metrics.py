@@ -0,0 +1,327 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from prompt_cache import extract_prompt_cache_usage
+
+# 基于回调的耗时与 token 指标：
+# 每轮对话挂一个 TurnMetrics 回调，记录智能体、图节点、工具、搜索与模型调用的耗时、排队时间、
+# 输入/输出 token 与缓存命中，结束时生成该轮的 JSON 汇总，并累加到进程级的 MetricsRegistry，
+# 后者可输出 Prometheus 文本格式（server.py 的 GET /metrics）
+#
+# 组件类型（kind）：
+# - agent：智能体一次完整运行。调用方以 run_name="agent:<名称>" 标记，没有父运行的图也算作 agent
+# - node：图节点（如 model、tools、agent），名称为 "<智能体>.<节点>"
+# - tool / search：工具调用，搜索工具单独归为 search
+# - llm：模型调用，名称为发起调用的节点或工具
+
+METRICS_LOG = os.getenv("METRICS_LOG", "")  # 每轮汇总追加写入的 JSONL 文件，置空则不写
+SEARCH_TOOL_NAMES = {"tavily_search"}
+AGENT_RUN_PREFIX = "agent:"
+# Prometheus 直方图的分桶（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def agent_run_name(label: str) -> str:
+    """生成标记智能体运行的 run_name，TurnMetrics 据此把该运行记为 agent"""
+    return f"{AGENT_RUN_PREFIX}{label}"
+
+class Histogram:
+    """Prometheus 风格的累积直方图"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+def _labels(labels: Dict[str, str]) -> str:
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for k, v in labels.items())
+    return "{" + ",".join(escaped) + "}"
+
+class MetricsRegistry:
+    """进程级的指标汇总，累加各轮的耗时、token 与缓存命中，输出 Prometheus 文本格式"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.span_seconds: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.span_errors: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.queue_seconds: Dict[str, Histogram] = defaultdict(Histogram)
+        self.tokens: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.cache_hits: Dict[str, int] = defaultdict(int)
+        self.turn_seconds = Histogram()
+
+    def record_turn(self, spans: List[Dict[str, Any]], queue_time: Dict[str, List[float]], wall_time: float):
+        with self._lock:
+            self.turn_seconds.observe(wall_time)
+            for span in spans:
+                key = (span["kind"], span["name"])
+                self.span_seconds[key].observe(span["duration"])
+                if span.get("error"):
+                    self.span_errors[key] += 1
+                if span["kind"] == "llm":
+                    self.tokens[(span["name"], "input")] += span.get("input_tokens", 0)
+                    self.tokens[(span["name"], "output")] += span.get("output_tokens", 0)
+                    self.cache_hits["llm_cache"] += int(span.get("llm_cache_hit", False))
+                    self.cache_hits["prompt_cache_hit_tokens"] += span.get("prompt_cache_hit_tokens", 0)
+                    self.cache_hits["prompt_cache_miss_tokens"] += span.get("prompt_cache_miss_tokens", 0)
+            for kind, waits in queue_time.items():
+                for seconds in waits:
+                    self.queue_seconds[kind].observe(seconds)
+
+    def render_prometheus(self) -> str:
+        """以 Prometheus 文本格式输出全部指标"""
+        lines = []
+
+        def histogram(name: str, help_text: str, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in series:
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(f"{name}_bucket{_labels({**labels, 'le': f'{bound:g}'})} {count}")
+                lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {hist.count}")
+                lines.append(f"{name}_sum{_labels(labels) if labels else ''} {hist.sum:.6f}")
+                lines.append(f"{name}_count{_labels(labels) if labels else ''} {hist.count}")
+
+        def counter(name: str, help_text: str, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series:
+                lines.append(f"{name}{_labels(labels)} {value}")
+
+        with self._lock:
+            histogram("learn_boy_turn_seconds", "每轮对话的总耗时", [({}, self.turn_seconds)])
+            histogram("learn_boy_span_seconds", "智能体、图节点、工具、搜索与模型调用的耗时",
+                      [({"kind": kind, "name": name}, hist) for (kind, name), hist in sorted(self.span_seconds.items())])
+            counter("learn_boy_span_errors_total", "出错的调用次数",
+                    [({"kind": kind, "name": name}, n) for (kind, name), n in sorted(self.span_errors.items())])
+            histogram("learn_boy_queue_seconds", "排队等待时间（限流、并发上限、服务端队列）",
+                      [({"kind": kind}, hist) for kind, hist in sorted(self.queue_seconds.items())])
+            counter("learn_boy_llm_tokens_total", "模型调用的输入/输出 token 数",
+                    [({"name": name, "direction": direction}, n) for (name, direction), n in sorted(self.tokens.items())])
+            counter("learn_boy_cache_total", "模型回复缓存命中次数与前缀缓存命中/未命中 token 数",
+                    [({"kind": kind}, n) for kind, n in sorted(self.cache_hits.items())])
+        return "\n".join(lines) + "\n"
+
+_registry = MetricsRegistry()
+
+def get_metrics_registry() -> MetricsRegistry:
+    """获取进程级的指标汇总"""
+    return _registry
+
+# 当前正在统计的一轮对话，限流器等排队位置通过它记录排队时间。
+# 线程池（ContextThreadPoolExecutor）与 asyncio 任务都会复制上下文，子智能体中的排队同样归到本轮
+_current_turn: contextvars.ContextVar[Optional["TurnMetrics"]] = contextvars.ContextVar("current_turn", default=None)
+
+def record_queue_time(kind: str, seconds: float):
+    """记录一次排队等待（如限流、工具并发上限），不在统计中的调用会被忽略"""
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.add_queue_time(kind, seconds)
+
+class TurnMetrics(BaseCallbackHandler):
+    """
+    一轮对话的指标回调，通过 config={"callbacks": [turn_metrics]} 传给智能体或图，
+    子智能体、工具与模型调用会继承该回调
+
+    用法：
+        with TurnMetrics() as turn_metrics:
+            agent.invoke(inputs, config={"callbacks": [turn_metrics]})
+        print(turn_metrics.summary())
+    """
+    # 同步执行回调，避免异步运行时回调被放到线程池中而使计时不准
+    run_inline = True
+
+    def __init__(self, turn_id: str = None, registry: MetricsRegistry = None, log_path: str = METRICS_LOG):
+        self.turn_id = turn_id or uuid4().hex
+        self.registry = registry or _registry
+        self.log_path = log_path
+        self.spans: List[Dict[str, Any]] = []
+        self.queue_time: Dict[str, List[float]] = defaultdict(list)
+        self.start_time = None
+        self.wall_time = 0.0
+        # run_id -> (标签, 所属智能体, 进行中的 span 或 None)
+        self._runs: Dict[UUID, Tuple[str, str, Optional[Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+        self._token = None
+        self._summary = None
+
+    # --- 一轮的开始与结束 ---
+    def __enter__(self) -> "TurnMetrics":
+        self.start_time = time.perf_counter()
+        self._token = _current_turn.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _current_turn.reset(self._token)
+        self.finish()
+
+    def finish(self) -> Dict[str, Any]:
+        """结束统计：生成本轮汇总，累加到进程级指标并写入日志（只执行一次）"""
+        if self._summary is not None:
+            return self._summary
+        self.wall_time = time.perf_counter() - self.start_time if self.start_time else 0.0
+        self._summary = self.summary()
+        self.registry.record_turn(self.spans, self.queue_time, self.wall_time)
+        if self.log_path:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self._summary, ensure_ascii=False) + "\n")
+        return self._summary
+
+    def add_queue_time(self, kind: str, seconds: float):
+        with self._lock:
+            self.queue_time[kind].append(seconds)
+
+    # --- 运行的登记 ---
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], kind: Optional[str], name: str = ""):
+        """登记一次运行；kind 为 None 时只继承父运行的标签，不单独计时"""
+        with self._lock:
+            parent_label, agent, _ = self._runs.get(parent_run_id, ("", "", None))
+            span = None
+            label = parent_label
+            if kind == "agent":
+                label = agent = name
+            elif kind == "node":
+                label = f"{agent}.{name}" if agent else name
+            elif kind in ("tool", "search"):
+                label = name
+            if kind:
+                span = {"kind": kind, "name": label if kind != "llm" else (parent_label or name),
+                        "start": time.perf_counter()}
+            self._runs[run_id] = (label, agent, span)
+
+    def _end(self, run_id: UUID, error: BaseException = None, **fields):
+        with self._lock:
+            _, _, span = self._runs.pop(run_id, ("", "", None))
+            if span is None:
+                return
+            span["duration"] = time.perf_counter() - span.pop("start")
+            span.update(fields)
+            if error is not None:
+                span["error"] = type(error).__name__
+            self.spans.append(span)
+
+    def on_chain_start(self, serialized: Optional[Dict[str, Any]], inputs: Any, *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, metadata: Optional[Dict[str, Any]] = None,
+                       **kwargs: Any):
+        name = kwargs.get("name") or (serialized or {}).get("name", "")
+        if name.startswith(AGENT_RUN_PREFIX):
+            self._start(run_id, parent_run_id, "agent", name[len(AGENT_RUN_PREFIX):])
+        elif parent_run_id is None or parent_run_id not in self._runs:
+            self._start(run_id, parent_run_id, "agent", name)
+        elif name and name == (metadata or {}).get("langgraph_node"):
+            self._start(run_id, parent_run_id, "node", name)
+        else:
+            self._start(run_id, parent_run_id, None)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized: Optional[Dict[str, Any]], input_str: str, *, run_id: UUID,
+                      parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        name = kwargs.get("name") or (serialized or {}).get("name", "")
+        self._start(run_id, parent_run_id, "search" if name in SEARCH_TOOL_NAMES else "tool", name)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized: Optional[Dict[str, Any]], messages, *, run_id: UUID,
+                            parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        self._start(run_id, parent_run_id, "llm", kwargs.get("name") or "llm")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        fields = {"input_tokens": 0, "output_tokens": 0}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or {}
+                fields["input_tokens"] += usage.get("input_tokens", 0)
+                fields["output_tokens"] += usage.get("output_tokens", 0)
+                if message is not None and message.response_metadata.get("from_llm_cache"):
+                    fields["llm_cache_hit"] = True
+                    continue
+                cache_usage = extract_prompt_cache_usage(message, response.llm_output)
+                if cache_usage:
+                    fields["prompt_cache_hit_tokens"] = cache_usage["prompt_cache_hit_tokens"]
+                    fields["prompt_cache_miss_tokens"] = cache_usage["prompt_cache_miss_tokens"]
+        self._end(run_id, **fields)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error)
+
+    # --- 汇总 ---
+    def summary(self) -> Dict[str, Any]:
+        """
+        本轮的 JSON 汇总
+
+        Returns:
+            Dict[str, Any]: 总耗时、排队时间、模型/工具/搜索调用与 token 合计，
+                以及按 (kind, name) 分组、按总耗时降序排列的各组件明细
+        """
+        with self._lock:
+            spans = list(self.spans)
+            queue_time = {kind: round(sum(waits), 4) for kind, waits in self.queue_time.items()}
+        components: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        totals = {"llm_calls": 0, "input_tokens": 0, "output_tokens": 0, "llm_cache_hits": 0,
+                  "prompt_cache_hit_tokens": 0, "prompt_cache_miss_tokens": 0,
+                  "tool_calls": 0, "search_calls": 0, "errors": 0}
+        for span in spans:
+            item = components.setdefault((span["kind"], span["name"]), {
+                "kind": span["kind"], "name": span["name"], "calls": 0, "total_time": 0.0, "max_time": 0.0, "errors": 0,
+            })
+            item["calls"] += 1
+            item["total_time"] += span["duration"]
+            item["max_time"] = max(item["max_time"], span["duration"])
+            if span.get("error"):
+                item["errors"] += 1
+                totals["errors"] += 1
+            if span["kind"] == "llm":
+                totals["llm_calls"] += 1
+                for key in ("input_tokens", "output_tokens", "prompt_cache_hit_tokens", "prompt_cache_miss_tokens"):
+                    item[key] = item.get(key, 0) + span.get(key, 0)
+                    totals[key] += span.get(key, 0)
+                item["llm_cache_hits"] = item.get("llm_cache_hits", 0) + int(span.get("llm_cache_hit", False))
+                totals["llm_cache_hits"] += int(span.get("llm_cache_hit", False))
+            elif span["kind"] == "tool":
+                totals["tool_calls"] += 1
+            elif span["kind"] == "search":
+                totals["search_calls"] += 1
+        for item in components.values():
+            item["total_time"] = round(item["total_time"], 4)
+            item["max_time"] = round(item["max_time"], 4)
+        wall_time = self.wall_time or (time.perf_counter() - self.start_time if self.start_time else 0.0)
+        return {
+            "turn_id": self.turn_id,
+            "wall_time": round(wall_time, 4),
+            "queue_time": queue_time,
+            "totals": totals,
+            "components": sorted(components.values(), key=lambda item: item["total_time"], reverse=True),
+        }
+
+def format_turn_summary(summary: Dict[str, Any], top: int = 3) -> str:
+    """把一轮汇总格式化为一行终端输出"""
+    totals = summary["totals"]
+    # 智能体与节点的耗时包含其中的模型和工具调用，只列出模型、工具与搜索
+    leaves = [item for item in summary["components"] if item["kind"] not in ("agent", "node")]
+    slowest = "，".join(f"{item['name']}({item['kind']}) {item['total_time']:.2f}s" for item in leaves[:top])
+    queued = sum(summary["queue_time"].values())
+    return (f"📈 模型调用 {totals['llm_calls']} 次（输入 {totals['input_tokens']} / 输出 {totals['output_tokens']} tokens，"
+            f"缓存命中 {totals['llm_cache_hits']} 次），搜索 {totals['search_calls']} 次，排队 {queued:.2f}s"
+            + (f" | 最耗时：{slowest}" if slowest else ""))
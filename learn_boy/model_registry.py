@@ -0,0 +1,102 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+import httpx
+from rate_limiter import AsyncRateLimitedTransport, RateLimitedTransport, get_limiter
+
+# 进程级模型注册表：所有调用共用同一组保持长连接的 HTTP 客户端，
+# 同一 (模型, temperature) 只创建一个 ChatOpenAI 实例，避免每次调用都重建客户端、重新握手。
+# 共享客户端的传输层接入了 DeepSeek 的进程级限流器，经过它的每个请求都受同一配额约束。
+# langchain_openai（及其依赖的 openai、tiktoken）在首次创建模型时才导入，导入本模块不会加载它们
+# 429 的退避重试统一由限流传输层负责，模型客户端的 SDK 重试关闭（max_retries=0），避免两层重试叠加放大请求
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+DEEPSEEK_MODEL = "deepseek-chat"
+# 连接池配置
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))  # 空闲连接保留时间（秒）
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "120"))
+
+_lock = threading.Lock()
+_models: Dict[Tuple[str, float], "ChatOpenAI"] = {}
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+def get_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """获取共享的同步/异步 HTTP 客户端（带连接池、keep-alive 与 DeepSeek 限流）"""
+    global _http_client, _http_async_client
+    limiter = get_limiter("deepseek")
+    with _lock:
+        if _http_client is None:
+            transport = RateLimitedTransport(limiter, httpx.HTTPTransport(limits=_limits()))
+            _http_client = httpx.Client(transport=transport, timeout=HTTP_TIMEOUT)
+        if _http_async_client is None:
+            transport = AsyncRateLimitedTransport(limiter, httpx.AsyncHTTPTransport(limits=_limits()))
+            _http_async_client = httpx.AsyncClient(transport=transport, timeout=HTTP_TIMEOUT)
+        return _http_client, _http_async_client
+
+def deepseek_client_kwargs() -> Dict[str, Any]:
+    """
+    init_chat_model("deepseek:...") / ChatDeepSeek 使用共享 HTTP 客户端所需的参数，
+    让各脚本直接创建的 DeepSeek 模型也经过连接池与限流，并关闭 SDK 自带的重试
+    """
+    http_client, http_async_client = get_http_clients()
+    return {"http_client": http_client, "http_async_client": http_async_client, "max_retries": 0}
+
+def get_chat_model(temperature: float = 0.0, model: str = DEEPSEEK_MODEL) -> "ChatOpenAI":
+    """
+    获取共享的 DeepSeek 聊天模型实例
+
+    Args:
+        temperature (float): 采样温度，每个温度对应一个实例
+        model (str): 模型名称
+
+    Returns:
+        ChatOpenAI: 复用连接池的模型实例
+    """
+    key = (model, float(temperature))
+    model_instance = _models.get(key)
+    if model_instance is not None:
+        return model_instance
+    # 从环境变量获取 DeepSeek API 密钥
+    api_key = os.getenv("DEEPSEEK_API_KEY")
+    if not api_key:
+        raise ValueError("DEEPSEEK_API_KEY 环境变量未设置")
+    from langchain_openai import ChatOpenAI
+    http_client, http_async_client = get_http_clients()
+    with _lock:
+        if key not in _models:
+            _models[key] = ChatOpenAI(
+                model=model,
+                temperature=temperature,
+                base_url=DEEPSEEK_BASE_URL,
+                api_key=api_key,
+                http_client=http_client,
+                http_async_client=http_async_client,
+                max_retries=0,  # 重试交给限流传输层
+            )
+        return _models[key]
+
+async def aclose_http_clients():
+    """关闭共享的 HTTP 客户端（进程退出前在事件循环中调用）"""
+    global _http_client, _http_async_client
+    with _lock:
+        http_client, http_async_client = _http_client, _http_async_client
+        _http_client = None
+        _http_async_client = None
+        _models.clear()
+    if http_client is not None:
+        http_client.close()
+    if http_async_client is not None:
+        await http_async_client.aclose()
@@ -1,35 +1,58 @@
 import os
 import sys
 import time
+import threading
 from dotenv import load_dotenv
-from langchain.agents import create_agent
 from langchain_core.tools import tool
+from langchain_core.messages import AIMessage
 from langchain_core.runnables import RunnableConfig
-from langchain.chat_models import init_chat_model
-from langgraph.checkpoint.memory import InMemorySaver
-from langchain_tavily import TavilySearch
-from dataclasses import dataclass
 
 # 加载.env文件中的环境变量
 load_dotenv()          # os.environ["DEEPSEEK_API_KEY"]
 
-model = init_chat_model(
-    "deepseek:deepseek-chat",
-    temperature=0
-)
-
-tavily_search_tool = TavilySearch(
-    max_results=5,
-    topic="general",
-    # include_answer=False,
-    # include_raw_content=False,
-    # include_images=False,
-    # include_image_descriptions=False,
-    # search_depth="basic",
-    # time_range="day",
-    # include_domains=None,
-    # exclude_domains=None
-)
+# 与 multi_agents_pro 相同，模型、搜索工具和各智能体都在首次使用时才创建，
+# langchain.agents、模型客户端、Tavily 等较重的依赖也随之延迟导入
+_factory_lock = threading.RLock()
+model = None
+tavily_search_tool = None
+
+def get_model():
+    """获取主控与子智能体共用的聊天模型（首次调用时创建）"""
+    global model
+    with _factory_lock:
+        if model is None:
+            from langchain.chat_models import init_chat_model
+            from llm_cache import get_llm_cache
+            from model_registry import deepseek_client_kwargs
+            # temperature=0 的确定性模型挂载精确匹配的回复缓存，相同请求直接返回缓存结果
+            model = init_chat_model(
+                "deepseek:deepseek-chat",
+                temperature=0,
+                cache=get_llm_cache(),
+                **deepseek_client_kwargs()  # 共享连接池，并经过进程级限流
+            )
+        return model
+
+def get_tavily_search_tool():
+    """获取所有子智能体共享的搜索工具（首次调用时创建）"""
+    global tavily_search_tool
+    with _factory_lock:
+        if tavily_search_tool is None:
+            from search_cache import CachedTavilySearch
+            # 使用带 TTL/LRU 缓存的搜索工具，所有智能体共享同一份缓存
+            tavily_search_tool = CachedTavilySearch(
+                max_results=5,
+                topic="general",
+                # include_answer=False,
+                # include_raw_content=False,
+                # include_images=False,
+                # include_image_descriptions=False,
+                # search_depth="basic",
+                # time_range="day",
+                # include_domains=None,
+                # exclude_domains=None
+            )
+        return tavily_search_tool
 
 learn_plan_agent_system_prompt = """
 你是一位专业、高效的学习计划生成专家，核心职责是根据用户提供的目标技术（如编程开发、数据分析、设计工具、运维技术等），
@@ -112,15 +135,35 @@ b.注意事项：提醒用户技术版本差异（如 “注意：本教程基
 请注意，在回答的开头需声明本学习资料汇总由学习资料查找智能体生成。
 """
 
-learn_plan_agent = create_agent(model=model, tools=[tavily_search_tool], prompt=learn_plan_agent_system_prompt)
+# 两个子智能体，首次使用时创建
+learn_plan_agent = None
+learn_data_agent = None
+
+def get_learn_plan_agent():
+    """获取学习计划生成智能体（首次调用时创建）"""
+    global learn_plan_agent
+    with _factory_lock:
+        if learn_plan_agent is None:
+            from langchain.agents import create_agent
+            learn_plan_agent = create_agent(model=get_model(), tools=[get_tavily_search_tool()],
+                                            prompt=learn_plan_agent_system_prompt)
+        return learn_plan_agent
 
-learn_data_agent = create_agent(model=model, tools=[tavily_search_tool], prompt=learn_data_agent_system_prompt)
+def get_learn_data_agent():
+    """获取学习资料搜索智能体（首次调用时创建）"""
+    global learn_data_agent
+    with _factory_lock:
+        if learn_data_agent is None:
+            from langchain.agents import create_agent
+            learn_data_agent = create_agent(model=get_model(), tools=[get_tavily_search_tool()],
+                                            prompt=learn_data_agent_system_prompt)
+        return learn_data_agent
 
 @tool
 def learn_plan_agent_tool(query: str):
     """根据用户输入的学习目标，生成学习计划"""
     print('正在调用「计划生成智能体」生成结果...')
-    result = learn_plan_agent.invoke({
+    result = get_learn_plan_agent().invoke({
         "messages":[{"role": "user", "content": query}]
     })
     return result["messages"][-1].content
@@ -129,7 +172,7 @@ def learn_plan_agent_tool(query: str):
 def learn_data_agent_tool(query: str):
     """根据用户输入的学习目标，搜索相关的学习资料"""
     print('正在调用「资料搜索智能体」生成结果...')
-    result = learn_data_agent.invoke({
+    result = get_learn_data_agent().invoke({
         "messages":[{"role": "user", "content": query}]
     })
     return result["messages"][-1].content
@@ -176,12 +219,21 @@ master_agent_system_prompt = """
 
 """
 
-# 创建主控智能体
-master_agent = create_agent(
-    model=model, 
-    tools=[learn_plan_agent_tool, learn_data_agent_tool], 
-    prompt=master_agent_system_prompt
-)
+# 主控智能体，首次使用时创建
+master_agent = None
+
+def get_master_agent():
+    """获取主控智能体（首次调用时创建）"""
+    global master_agent
+    with _factory_lock:
+        if master_agent is None:
+            from langchain.agents import create_agent
+            master_agent = create_agent(
+                model=get_model(), 
+                tools=[learn_plan_agent_tool, learn_data_agent_tool], 
+                prompt=master_agent_system_prompt
+            )
+        return master_agent
 
 # 主控智能体调用函数（流式输出版本）
 def run_master_agent_stream(user_query: str):
@@ -196,7 +248,7 @@ def run_master_agent_stream(user_query: str):
     """
     try:
         # 使用stream方法进行流式调用
-        stream = master_agent.stream({
+        stream = get_master_agent().stream({
             "messages": [{"role": "user", "content": user_query}]
         })
         
@@ -240,15 +292,100 @@ def run_master_agent(user_query: str):
         str: 整合后的完整回答
     """
     try:
-        result = master_agent.invoke({
+        result = get_master_agent().invoke({
+            "messages": [{"role": "user", "content": user_query}]
+        })
+        return result["messages"][-1].content
+    except Exception as e:
+        return f"处理请求时出现错误: {str(e)}"
+
+# --- 异步版本：子智能体工具使用 ainvoke，不阻塞事件循环，一个进程可同时服务多个会话 ---
+@tool("learn_plan_agent_tool")
+async def alearn_plan_agent_tool(query: str):
+    """根据用户输入的学习目标，生成学习计划"""
+    print('正在调用「计划生成智能体」生成结果...')
+    result = await get_learn_plan_agent().ainvoke({
+        "messages":[{"role": "user", "content": query}]
+    })
+    return result["messages"][-1].content
+
+@tool("learn_data_agent_tool")
+async def alearn_data_agent_tool(query: str):
+    """根据用户输入的学习目标，搜索相关的学习资料"""
+    print('正在调用「资料搜索智能体」生成结果...')
+    result = await get_learn_data_agent().ainvoke({
+        "messages":[{"role": "user", "content": query}]
+    })
+    return result["messages"][-1].content
+
+# 异步主控智能体，首次使用时创建
+async_master_agent = None
+
+def get_async_master_agent():
+    """获取异步主控智能体（首次调用时创建）"""
+    global async_master_agent
+    with _factory_lock:
+        if async_master_agent is None:
+            from langchain.agents import create_agent
+            async_master_agent = create_agent(
+                model=get_model(),
+                tools=[alearn_plan_agent_tool, alearn_data_agent_tool],
+                prompt=master_agent_system_prompt
+            )
+        return async_master_agent
+
+async def arun_master_agent_stream(user_query: str):
+    """
+    主控智能体入口函数（异步流式输出版本）
+
+    Args:
+        user_query (str): 用户的学习需求查询
+
+    Returns:
+        str: 流式输出的完整内容
+    """
+    try:
+        full_response = ""
+        # 以 token 粒度输出主控智能体及子智能体生成的文本
+        stream = get_async_master_agent().astream(
+            {"messages": [{"role": "user", "content": user_query}]},
+            stream_mode="messages",
+            subgraphs=True,
+        )
+        async for _namespace, (message, _metadata) in stream:
+            if isinstance(message, AIMessage) and isinstance(message.content, str) and message.content:
+                print(message.content, end='', flush=True)
+                full_response += message.content
+        print()
+        return full_response
+    except Exception as e:
+        error_msg = f"处理请求时出现错误: {str(e)}"
+        print(error_msg)
+        return error_msg
+
+async def arun_master_agent(user_query: str):
+    """
+    主控智能体入口函数（异步非流式版本）
+
+    Args:
+        user_query (str): 用户的学习需求查询
+
+    Returns:
+        str: 整合后的完整回答
+    """
+    try:
+        result = await get_async_master_agent().ainvoke({
             "messages": [{"role": "user", "content": user_query}]
         })
         return result["messages"][-1].content
     except Exception as e:
         return f"处理请求时出现错误: {str(e)}"
 
-# 为了向后兼容，保留原有的agent变量
-agent = master_agent
+# 为了向后兼容，保留原有的agent变量（访问时才创建主控智能体）
+def __getattr__(name: str):
+    if name == "agent":
+        return get_master_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_user_input():
     """获取用户输入的user_input"""
@@ -256,10 +393,11 @@ def get_user_input():
     user_input = input().strip()
     return user_input
 
-# 使用流式输出版本
-user_input = get_user_input()
-run_master_agent_stream(user_input)
+if __name__ == "__main__":
+    # 使用流式输出版本
+    user_input = get_user_input()
+    run_master_agent_stream(user_input)
 
-# 使用原始输出
-# response = run_master_agent(user_input)
-# print(response)
+    # 使用原始输出
+    # response = run_master_agent(user_input)
+    # print(response)
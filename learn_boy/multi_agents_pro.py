@@ -1,38 +1,78 @@
 import os
+import re
 import sys
 import time
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
-from langchain.agents import create_agent
 from langchain_core.tools import tool
+from langchain_core.messages import AIMessage, ToolMessage
 from langchain_core.runnables import RunnableConfig
-from langchain.chat_models import init_chat_model
-from langgraph.checkpoint.memory import InMemorySaver
-from langchain_tavily import TavilySearch
-from dataclasses import dataclass
-from typing import List, Dict, Any
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from semantic_cache import get_semantic_cache, make_cache_version
+from memory_journal import MEMORY_FILE, MemoryJournal
+from session_store import SessionManager
+from context_budget import ContextBuilder, count_tokens, make_llm_summarizer
+from prompt_cache import get_prompt_cache_stats
+from metrics import TurnMetrics, agent_run_name, format_turn_summary
+from intent_router import INTENT_ROUTER_ENABLED, route_query
+from search_gate import SearchDecision, decide_search, get_search_gate, searched_in
+from plan_library import get_plan_library
+from typing import List, Dict, Any, Optional, Tuple
 import json
 from datetime import datetime
 
 # 加载.env文件中的环境变量
 load_dotenv()          # os.environ["DEEPSEEK_API_KEY"]
 
-model = init_chat_model(
-    "deepseek:deepseek-chat",
-    temperature=0
-)
-
-tavily_search_tool = TavilySearch(
-    max_results=5,
-    topic="general",
-    # include_answer=False,
-    # include_raw_content=False,
-    # include_images=False,
-    # include_image_descriptions=False,
-    # search_depth="basic",
-    # time_range="day",
-    # include_domains=None,
-    # exclude_domains=None
-)
+# 模型、搜索工具和各智能体都在首次使用时才创建（见 get_model、get_sub_agent、get_master_agent），
+# langchain.agents、模型客户端、Tavily 等较重的依赖也随之延迟导入，导入本模块时不会加载它们
+_factory_lock = threading.RLock()
+model = None
+tavily_search_tool = None
+
+def get_model():
+    """获取主控与子智能体共用的聊天模型（首次调用时创建）"""
+    global model
+    with _factory_lock:
+        if model is None:
+            from langchain.chat_models import init_chat_model
+            from llm_cache import get_llm_cache
+            from model_registry import deepseek_client_kwargs
+            # temperature=0 的确定性模型挂载精确匹配的回复缓存，相同请求直接返回缓存结果；
+            # 流式输出时也返回用量，用于统计 DeepSeek 前缀缓存的命中情况
+            model = init_chat_model(
+                "deepseek:deepseek-chat",
+                temperature=0,
+                cache=get_llm_cache(),
+                stream_usage=True,
+                callbacks=[get_prompt_cache_stats()],
+                **deepseek_client_kwargs()  # 共享连接池，并经过进程级限流
+            )
+        return model
+
+def get_tavily_search_tool():
+    """获取所有子智能体共享的搜索工具（首次调用时创建）"""
+    global tavily_search_tool
+    with _factory_lock:
+        if tavily_search_tool is None:
+            from search_cache import CachedTavilySearch
+            # 使用带 TTL/LRU 缓存的搜索工具，所有智能体共享同一份缓存
+            tavily_search_tool = CachedTavilySearch(
+                max_results=5,
+                topic="general",
+                # include_answer=False,
+                # include_raw_content=False,
+                # include_images=False,
+                # include_image_descriptions=False,
+                # search_depth="basic",
+                # time_range="day",
+                # include_domains=None,
+                # exclude_domains=None
+            )
+        return tavily_search_tool
 
 learn_plan_agent_system_prompt = """
 你是一位专业、高效的学习计划生成专家，核心职责是根据用户提供的目标技术（如编程开发、数据分析、设计工具、运维技术等），
@@ -120,17 +160,34 @@ learn_explain_agent_system_prompt = """
 """
 
 # 对话记忆管理类
+# 对话记忆的存储方式：journal 为追加式日志（默认），json 为每次整体重写的单个 JSON 文件，
+# sqlite 为多用户会话库（命令行使用其中的 CLI_SESSION_ID 会话）
+MEMORY_STORAGE = os.getenv("MEMORY_STORAGE", "journal")
+CLI_SESSION_ID = os.getenv("CLI_SESSION_ID", "cli")
+# 日志文件是否使用 gzip 压缩
+MEMORY_JOURNAL_COMPRESS = os.getenv("MEMORY_JOURNAL_COMPRESS", "0") == "1"
+
+def default_user_profile() -> Dict[str, Any]:
+    """新用户的默认学习档案"""
+    return {
+        "learning_goals": [],
+        "completed_topics": [],
+        "current_level": "beginner",
+        "preferences": {}
+    }
+
 class ConversationMemory:
-    def __init__(self, max_history: int = 10):
+    def __init__(self, max_history: int = 10, journal: MemoryJournal = None):
         self.max_history = max_history
         self.conversation_history: List[Dict[str, Any]] = []
-        self.user_profile = {
-            "learning_goals": [],
-            "completed_topics": [],
-            "current_level": "beginner",
-            "preferences": {}
-        }
+        self.user_profile = default_user_profile()
         self.session_start_time = datetime.now()
+        # 超出上下文预算的旧消息的滚动摘要，以及摘要覆盖到的最后一条消息的时间戳
+        self.history_summary = ""
+        self.summary_until = None
+        # 设置后，每条消息和档案变更都会立即追加到日志，save_to_file 只在需要时压缩快照。
+        # 也可以是接口相同的其他存储，例如 session_store.SessionJournal
+        self.journal = journal
     
     def add_message(self, role: str, content: str, metadata: Dict = None):
         """添加消息到对话历史"""
@@ -145,6 +202,11 @@ class ConversationMemory:
         # 保持历史记录在限制范围内
         if len(self.conversation_history) > self.max_history * 2:  # *2 因为包含用户和助手消息
             self.conversation_history = self.conversation_history[-self.max_history * 2:]
+        
+        if self.journal:
+            self.journal.append_message(message)
+            if self.journal.should_compact():
+                self.journal.compact(self.to_dict())
     
     def get_conversation_context(self) -> str:
         """获取对话上下文摘要"""
@@ -172,6 +234,24 @@ class ConversationMemory:
         """更新用户学习档案"""
         if learning_goal not in self.user_profile["learning_goals"]:
             self.user_profile["learning_goals"].append(learning_goal)
+            if self.journal:
+                self.journal.append_profile(self.user_profile)
+    
+    def update_history_summary(self, history_summary: str, summary_until: Optional[str]):
+        """更新滚动摘要；使用日志或会话库存储时立即持久化，重启或会话被重新加载后不必从头摘要"""
+        self.history_summary = history_summary
+        self.summary_until = summary_until
+        if self.journal:
+            self.journal.append_summary(history_summary, summary_until)
+
+    def clear(self):
+        """清除对话历史和学习档案"""
+        self.conversation_history.clear()
+        self.user_profile = default_user_profile()
+        self.history_summary = ""
+        self.summary_until = None
+        if self.journal:
+            self.journal.compact(self.to_dict())
     
     def get_formatted_history(self) -> List[Dict[str, str]]:
         """获取格式化的对话历史，用于agent调用"""
@@ -183,73 +263,476 @@ class ConversationMemory:
             })
         return formatted_history
     
-    def save_to_file(self, filename: str = "conversation_memory.json"):
-        """保存对话记忆到文件"""
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为可保存的字典"""
+        return {
+            "conversation_history": self.conversation_history,
+            "user_profile": self.user_profile,
+            "session_start_time": self.session_start_time.isoformat(),
+            "history_summary": self.history_summary,
+            "summary_until": self.summary_until
+        }
+    
+    def restore(self, memory_data: Dict[str, Any]):
+        """从 to_dict() 结构的数据恢复记忆"""
+        self.conversation_history = memory_data.get("conversation_history") or []
+        self.user_profile = memory_data.get("user_profile") or default_user_profile()
+        session_time_str = memory_data.get("session_start_time")
+        if session_time_str:
+            self.session_start_time = datetime.fromisoformat(session_time_str)
+        self.history_summary = memory_data.get("history_summary") or ""
+        self.summary_until = memory_data.get("summary_until")
+    
+    def save_to_file(self, filename: str = MEMORY_FILE):
+        """保存对话记忆到文件（使用日志存储时，消息已实时追加，这里只在日志过长时压缩快照）"""
         try:
-            memory_data = {
-                "conversation_history": self.conversation_history,
-                "user_profile": self.user_profile,
-                "session_start_time": self.session_start_time.isoformat()
-            }
+            if self.journal:
+                if self.journal.should_compact():
+                    self.journal.compact(self.to_dict())
+                return
+            memory_data = self.to_dict()
             with open(filename, 'w', encoding='utf-8') as f:
                 json.dump(memory_data, f, ensure_ascii=False, indent=2)
         except Exception as e:
             print(f"保存对话记忆失败: {e}")
     
-    def load_from_file(self, filename: str = "conversation_memory.json"):
+    def load_from_file(self, filename: str = MEMORY_FILE):
         """从文件加载对话记忆"""
         try:
-            if os.path.exists(filename):
+            memory_data = None
+            if self.journal:
+                # 只读取快照和日志末尾最近的消息，不解析完整日志
+                memory_data = self.journal.load(self.max_history * 2)
+            if memory_data is None and os.path.exists(filename):
                 with open(filename, 'r', encoding='utf-8') as f:
                     memory_data = json.load(f)
-                self.conversation_history = memory_data.get("conversation_history", [])
-                self.user_profile = memory_data.get("user_profile", {
-                    "learning_goals": [],
-                    "completed_topics": [],
-                    "current_level": "beginner",
-                    "preferences": {}
-                })
-                session_time_str = memory_data.get("session_start_time")
-                if session_time_str:
-                    self.session_start_time = datetime.fromisoformat(session_time_str)
+                memory_data["conversation_history"] = memory_data.get("conversation_history", [])[-self.max_history * 2:]
+                if self.journal:
+                    # 首次启用日志存储时，把旧的 JSON 记忆迁移为快照
+                    self.journal.compact(memory_data)
+            if memory_data is not None:
+                self.restore(memory_data)
                 print("✅ 成功加载历史对话记忆")
         except Exception as e:
             print(f"加载对话记忆失败: {e}")
 
-# 创建全局记忆实例
-memory = ConversationMemory()
+_session_manager = None
+_session_manager_lock = threading.Lock()
+
+def get_session_manager() -> SessionManager:
+    """获取多用户会话管理器（首次调用时创建）"""
+    global _session_manager
+    # 并发的首次调用只能创建一个管理器，否则各自打开 SQLite 并启动写线程，先前会话的缓存也会丢失
+    with _session_manager_lock:
+        if _session_manager is None:
+            _session_manager = SessionManager(lambda journal: ConversationMemory(journal=journal))
+        return _session_manager
+
+def get_session_memory(session_id: str, create: bool = True) -> Optional[ConversationMemory]:
+    """
+    获取指定会话（用户/线程）的对话记忆，供同一进程服务多个用户时使用
+
+    Args:
+        session_id (str): 会话 id
+        create (bool): 会话不存在时是否新建，为 False 时返回 None（只读查看时使用）
+
+    Returns:
+        Optional[ConversationMemory]: 该会话的对话记忆，修改会在后台批量写入 SQLite
+    """
+    return get_session_manager().get(session_id, create=create)
+
+def create_cli_memory() -> ConversationMemory:
+    """创建命令行使用的记忆实例"""
+    if MEMORY_STORAGE == "sqlite":
+        return get_session_memory(CLI_SESSION_ID)
+    return ConversationMemory(
+        journal=MemoryJournal(compress=MEMORY_JOURNAL_COMPRESS) if MEMORY_STORAGE == "journal" else None
+    )
+
+# 子智能体注册表：简称 -> (智能体, 显示名称)。注册顺序即并行调用后合并结果的固定顺序。
+# 智能体在首次调用时由 get_sub_agent 创建
+SUB_AGENTS = {
+    "plan": (None, "计划生成智能体"),
+    "data": (None, "资料搜索智能体"),
+    "explain": (None, "解释生成智能体"),
+}
+SUB_AGENT_PROMPTS = {
+    "plan": learn_plan_agent_system_prompt,
+    "data": learn_data_agent_system_prompt,
+    "explain": learn_explain_agent_system_prompt,
+}
+
+# 不提供搜索工具的子智能体：搜索闸门判断本次请求无需联网时使用（见 search_gate），同样在首次使用时创建
+OFFLINE_SUB_AGENTS = {name: None for name in SUB_AGENTS}
+# 不提供搜索工具时追加到子智能体提示词末尾的说明
+OFFLINE_SUB_AGENT_NOTE = "\n本次请求无需联网搜索，请直接依据已有知识作答，不要编造具体的链接地址。"
+
+def get_sub_agent(name: str, search: bool = True) -> Tuple[Any, str]:
+    """获取子智能体及其显示名称，首次调用时创建。search 为 False 时返回不带搜索工具的版本"""
+    with _factory_lock:
+        agent, label = SUB_AGENTS[name]
+        if not search:
+            if OFFLINE_SUB_AGENTS[name] is None:
+                from langchain.agents import create_agent
+                OFFLINE_SUB_AGENTS[name] = create_agent(
+                    model=get_model(), tools=[], prompt=SUB_AGENT_PROMPTS[name] + OFFLINE_SUB_AGENT_NOTE)
+            return OFFLINE_SUB_AGENTS[name], label
+        if agent is None:
+            from langchain.agents import create_agent
+            agent = create_agent(model=get_model(), tools=[get_tavily_search_tool()], prompt=SUB_AGENT_PROMPTS[name])
+            SUB_AGENTS[name] = (agent, label)
+        return agent, label
 
-# 创建子智能体
-learn_plan_agent = create_agent(model=model, tools=[tavily_search_tool], prompt=learn_plan_agent_system_prompt)
-learn_data_agent = create_agent(model=model, tools=[tavily_search_tool], prompt=learn_data_agent_system_prompt)
-learn_explain_agent = create_agent(model=model, tools=[tavily_search_tool], prompt=learn_explain_agent_system_prompt)
+def select_sub_agent(name: str, query: str) -> Tuple[Any, str, SearchDecision]:
+    """由搜索闸门决定本次请求是否提供搜索工具，返回对应版本的子智能体、显示名称与闸门判断"""
+    decision = decide_search(name, query)
+    agent, label = get_sub_agent(name, search=decision.needed)
+    note = "" if decision.needed else "（无需联网搜索）"
+    print(f'正在调用「{label}」生成结果{note}...')
+    return agent, label, decision
 
-@tool
+def record_search_outcome(name: str, query: str, decision: SearchDecision, searched: bool):
+    """提供了搜索工具时，把模型是否真的搜索记录为该请求之后的决定"""
+    if decision.needed:
+        get_search_gate().record_outcome(name, query, searched)
+
+# 结果先查本地计划库的子智能体：命中时直接返回库中的结果，未命中时调用子智能体并把结果入库（见 plan_library）。
+# 热门主题的结果可由 prewarm.py 提前生成
+LIBRARY_SUB_AGENTS = {"plan", "data"}
+
+def library_version(name: str) -> str:
+    """计划库记录的版本号：子智能体提示词或模型变化后，旧记录不再命中"""
+    return make_cache_version(SUB_AGENT_PROMPTS[name], "deepseek:deepseek-chat")
+
+def lookup_library(name: str, query: str) -> Optional[str]:
+    """在本地计划库中查找本次请求的结果，未命中时返回 None"""
+    library = get_plan_library() if name in LIBRARY_SUB_AGENTS else None
+    if library is None:
+        return None
+    entry = library.lookup(query, kind=name, version=library_version(name))
+    if entry is None:
+        return None
+    print(f"📚 命中本地计划库（{entry.match}）：{entry.technology}，跳过「{SUB_AGENTS[name][1]}」")
+    return library.adapt(entry, query)
+
+def save_to_library(name: str, query: str, answer: str, source: str = "agent"):
+    """把子智能体新生成的结果写入本地计划库，source 标明结果来自用户请求（agent）还是预热任务（prewarm）"""
+    library = get_plan_library() if name in LIBRARY_SUB_AGENTS else None
+    if library is not None:
+        library.store(query, answer, kind=name, version=library_version(name), source=source)
+
+# 本地路由绕过主控智能体时，子智能体看不到对话上下文，因此附带一段简短的用户背景：
+# 此前的学习目标（最多几条）与滚动摘要（截断），避免个性化信息丢失
+SUB_AGENT_CONTEXT_GOALS = 3
+SUB_AGENT_CONTEXT_GOAL_CHARS = 80
+SUB_AGENT_CONTEXT_SUMMARY_CHARS = 300
+
+def build_sub_agent_context(user_query: str, conversation_memory: ConversationMemory) -> str:
+    """
+    整理本地路由时传给子智能体的用户背景
+
+    Args:
+        user_query (str): 当前的用户输入（不重复列入学习目标）
+        conversation_memory (ConversationMemory): 对话记忆实例
+
+    Returns:
+        str: 用户背景，没有可用信息时返回空字符串
+    """
+    goals = [goal for goal in conversation_memory.user_profile["learning_goals"] if goal != user_query]
+    lines = []
+    if goals:
+        recent = goals[-SUB_AGENT_CONTEXT_GOALS:]
+        lines.append(f"- 此前的学习目标：{'；'.join(goal[:SUB_AGENT_CONTEXT_GOAL_CHARS] for goal in recent)}")
+    if conversation_memory.history_summary:
+        lines.append(f"- 早前对话摘要：{conversation_memory.history_summary[:SUB_AGENT_CONTEXT_SUMMARY_CHARS]}")
+    return "用户背景：\n" + "\n".join(lines) if lines else ""
+
+def with_user_context(query: str, context: str) -> str:
+    """把用户背景放在需求之前，组成发给子智能体的消息"""
+    return f"{context}\n\n当前需求：{query}" if context else query
+
+# 是否允许主控智能体在同一轮中并行调用多个子智能体
+PARALLEL_SUB_AGENTS = True
+# 并行调用子智能体的最大线程数
+SUB_AGENT_MAX_WORKERS = 3
+# 并行调用时各子智能体结果之间的分隔符
+MERGED_RESULT_SEPARATOR = "\n\n---\n\n"
+
+def run_sub_agent(name: str, query: str, config: RunnableConfig = None, context: str = "",
+                  refresh: bool = False) -> str:
+    """
+    调用指定的子智能体并返回其最终回答
+
+    Args:
+        name (str): 子智能体简称，见 SUB_AGENTS
+        query (str): 用户的学习需求
+        config (RunnableConfig): 传递给子智能体的运行配置
+        context (str): 用户背景（见 build_sub_agent_context）。带背景的回答是个性化的，不查找也不写入计划库
+        refresh (bool): 是否跳过计划库查找（调用方已经查过），生成后仍写入计划库
+
+    Returns:
+        str: 子智能体的最终回答
+    """
+    stored = None if refresh or context else lookup_library(name, query)
+    if stored is not None:
+        return stored
+    agent, label, decision = select_sub_agent(name, query)
+    # run_name 让指标回调把这次运行记为子智能体
+    result = agent.invoke({
+        "messages":[{"role": "user", "content": with_user_context(query, context)}]
+    }, config={**(config or {}), "run_name": agent_run_name(label)})
+    record_search_outcome(name, query, decision, searched_in(result["messages"]))
+    answer = result["messages"][-1].content
+    if not context:
+        save_to_library(name, query, answer)
+    return answer
+
+def run_sub_agents_parallel(query: str, names: List[str], config: RunnableConfig = None,
+                            context: str = "") -> Dict[str, str]:
+    """
+    并行调用多个子智能体，总耗时约等于最慢的那个子智能体
+
+    Args:
+        query (str): 用户的学习需求
+        names (List[str]): 需要调用的子智能体简称列表
+        config (RunnableConfig): 传递给子智能体的运行配置（在工具外调用时用于传递指标回调）
+        context (str): 用户背景，见 run_sub_agent
+
+    Returns:
+        Dict[str, str]: 子智能体简称 -> 回答，按 SUB_AGENTS 中的固定顺序排列
+    """
+    ordered = [name for name in SUB_AGENTS if name in names]
+    # 并行执行时各子智能体的 token 会交错，因此打上标记，流式输出时跳过它们，
+    # 由合并后的结果统一按固定顺序输出
+    config = {**(config or {}), "metadata": {**(config or {}).get("metadata", {}), "parallel_sub_agent": True}}
+    # ContextThreadPoolExecutor 会把回调等上下文传递到工作线程中
+    with ContextThreadPoolExecutor(max_workers=min(SUB_AGENT_MAX_WORKERS, max(len(ordered), 1))) as executor:
+        futures = {name: executor.submit(run_sub_agent, name, query, config, context) for name in ordered}
+    results = {}
+    for name in ordered:
+        try:
+            results[name] = futures[name].result()
+        except Exception as e:
+            results[name] = f"「{SUB_AGENTS[name][1]}」调用失败: {str(e)}"
+    return results
+
+# 子智能体结果直通：子智能体的完整回答直接流式展示给用户并按句柄保存，工具只把简短摘要返回给主控智能体，
+# 由主控决定是否需要补充综合说明，避免长篇的学习计划被主控模型再读一遍、再生成一遍
+PASS_THROUGH_SUB_AGENTS = os.getenv("PASS_THROUGH_SUB_AGENTS", "1") == "1"
+# 最多保存的子智能体结果条数，超出按 LRU 淘汰
+SUB_AGENT_OUTPUT_CAPACITY = int(os.getenv("SUB_AGENT_OUTPUT_CAPACITY", "256"))
+# 摘要中最多列出的小标题数
+DIGEST_MAX_HEADINGS = 8
+# Markdown 标题、加粗的独立行与"模块 1""第一阶段"等小标题
+HEADING_PATTERN = re.compile(r"^\s*(#{1,4}\s+|\*\*[^*]+\*\*[:：]?\s*$|模块\s*\d|第[一二三四五六七八九十\d]+(阶段|部分|周|步))")
+
+class SubAgentOutputStore:
+    """按句柄保存子智能体的完整回答（进程内 LRU），供流式输出与批量处理取回"""
+    def __init__(self, capacity: int = SUB_AGENT_OUTPUT_CAPACITY):
+        self.capacity = capacity
+        self._outputs: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, text: str) -> str:
+        """保存一段回答，返回其句柄"""
+        handle = f"out_{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self._outputs[handle] = text
+            while len(self._outputs) > self.capacity:
+                self._outputs.popitem(last=False)
+        return handle
+
+    def get(self, handle: str) -> Optional[str]:
+        """按句柄取回回答，已被淘汰时返回 None"""
+        with self._lock:
+            text = self._outputs.get(handle)
+            if text is not None:
+                self._outputs.move_to_end(handle)
+            return text
+
+sub_agent_outputs = SubAgentOutputStore()
+
+def make_sub_agent_digest(label: str, handle: str, text: str) -> str:
+    """
+    生成返回给主控智能体的结果摘要：句柄、长度与小标题，不包含正文
+
+    Args:
+        label (str): 子智能体的显示名称
+        handle (str): 完整结果的句柄
+        text (str): 子智能体的完整回答
+
+    Returns:
+        str: 结果摘要
+    """
+    headings = [line.strip().strip("#* ") for line in text.splitlines() if HEADING_PATTERN.match(line)]
+    if headings:
+        outline = "；".join(headings[:DIGEST_MAX_HEADINGS])
+    else:
+        outline = text.strip().splitlines()[0][:80] if text.strip() else "（空）"
+    return (f"「{label}」的完整结果（约 {count_tokens(text)} tokens，句柄 {handle}）已直接展示给用户，请勿复述。\n"
+            f"结构概要：{outline}")
+
+def sub_agent_tool_result(label: str, text: str, streamed: bool = True) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    子智能体工具的返回值 (内容, artifact)：直通模式下内容为摘要，完整结果按句柄保存，句柄放在 artifact 中
+    （artifact 不会发送给模型）；关闭直通时内容即完整结果。
+    streamed 为 False 表示结果没有逐 token 输出过（计划库命中、并行调用），流式输出时需要一次性展示完整结果
+    """
+    if not PASS_THROUGH_SUB_AGENTS:
+        return text, None
+    handle = sub_agent_outputs.put(text)
+    return make_sub_agent_digest(label, handle, text), {"handle": handle, "streamed": streamed}
+
+def call_sub_agent_tool(name: str, query: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """单个子智能体工具的实现：先查计划库，命中的结果没有逐 token 输出过，在 artifact 中标明"""
+    stored = lookup_library(name, query)
+    if stored is not None:
+        return sub_agent_tool_result(SUB_AGENTS[name][1], stored, streamed=False)
+    return sub_agent_tool_result(SUB_AGENTS[name][1], run_sub_agent(name, query, refresh=True))
+
+async def acall_sub_agent_tool(name: str, query: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """call_sub_agent_tool 的异步版本"""
+    stored = await asyncio.to_thread(lookup_library, name, query)
+    if stored is not None:
+        return sub_agent_tool_result(SUB_AGENTS[name][1], stored, streamed=False)
+    return sub_agent_tool_result(SUB_AGENTS[name][1], await arun_sub_agent(name, query, refresh=True))
+
+def passed_through_output(message) -> Optional[str]:
+    """取回一条工具消息对应的直通结果，不是直通结果时返回 None"""
+    artifact = getattr(message, "artifact", None)
+    if isinstance(artifact, dict) and artifact.get("handle"):
+        return sub_agent_outputs.get(artifact["handle"])
+    return None
+
+def collect_master_response(messages: List[Any]) -> str:
+    """
+    从主控智能体本轮的消息列表中组装完整回复：直通的子智能体结果在前，主控的最终回复在后。
+    非流式调用（如批量处理）使用，流式输出时子智能体结果已经逐 token 展示过了
+
+    Args:
+        messages (List[Any]): 主控智能体 invoke 返回的消息列表
+
+    Returns:
+        str: 完整回复
+    """
+    start = max((i for i, message in enumerate(messages) if getattr(message, "type", None) == "human"), default=-1)
+    parts = [text for text in (passed_through_output(message) for message in messages[start + 1:]
+                               if isinstance(message, ToolMessage)) if text]
+    if messages and messages[-1].content:
+        parts.append(messages[-1].content)
+    return "\n\n".join(parts)
+
+@tool(response_format="content_and_artifact")
 def learn_plan_agent_tool(query: str):
     """根据用户输入的学习目标，生成学习计划"""
-    print('正在调用「计划生成智能体」生成结果...')
-    result = learn_plan_agent.invoke({
-        "messages":[{"role": "user", "content": query}]
-    })
-    return result["messages"][-1].content
+    return call_sub_agent_tool("plan", query)
 
-@tool
+@tool(response_format="content_and_artifact")
 def learn_data_agent_tool(query: str):
     """根据用户输入的学习目标，搜索相关的学习资料"""
-    print('正在调用「资料搜索智能体」生成结果...')
-    result = learn_data_agent.invoke({
-        "messages":[{"role": "user", "content": query}]
-    })
-    return result["messages"][-1].content
+    return call_sub_agent_tool("data", query)
 
-@tool
+@tool(response_format="content_and_artifact")
 def learn_explain_agent_tool(query: str):
     """根据用户输入的学习目标，用生动贴切的例子，进行形象阐释"""
-    print('正在调用「解释生成智能体」生成结果...')
-    result = learn_explain_agent.invoke({
-        "messages":[{"role": "user", "content": query}]
-    })
-    return result["messages"][-1].content
+    return call_sub_agent_tool("explain", query)
+
+@tool(response_format="content_and_artifact")
+def learn_multi_agent_tool(query: str, agents: List[str]):
+    """
+    同时调用多个子智能体并按固定顺序拼接结果。
+    agents 取值为 "plan"（学习计划）、"data"（学习资料）、"explain"（形象阐释）中的多个，
+    当用户同时需要多种结果（如"学习计划+配套资源"）时使用
+    """
+    results = run_sub_agents_parallel(query, agents)
+    labels = "、".join(SUB_AGENTS[name][1] for name in results)
+    return sub_agent_tool_result(labels, MERGED_RESULT_SEPARATOR.join(results.values()), streamed=False)
+
+# --- 异步版本的子智能体调用：使用 ainvoke，不阻塞事件循环，便于单进程同时服务多个会话 ---
+async def arun_sub_agent(name: str, query: str, config: RunnableConfig = None, refresh: bool = False,
+                         source: str = "agent", context: str = "") -> str:
+    """
+    异步调用指定的子智能体并返回其最终回答
+
+    Args:
+        name (str): 子智能体简称，见 SUB_AGENTS
+        query (str): 用户的学习需求
+        config (RunnableConfig): 传递给子智能体的运行配置
+        refresh (bool): 是否跳过计划库查找、重新生成并覆盖库中的记录（预热任务使用）
+        source (str): 写入计划库时记录的结果来源
+        context (str): 用户背景，见 run_sub_agent
+
+    Returns:
+        str: 子智能体的最终回答
+    """
+    # 计划库的查找与写入会读写 SQLite，开启向量检索时还要请求 embedding 服务，放到线程中执行以免阻塞事件循环
+    stored = None if refresh or context else await asyncio.to_thread(lookup_library, name, query)
+    if stored is not None:
+        return stored
+    agent, label, decision = select_sub_agent(name, query)
+    result = await agent.ainvoke({
+        "messages":[{"role": "user", "content": with_user_context(query, context)}]
+    }, config={**(config or {}), "run_name": agent_run_name(label)})
+    record_search_outcome(name, query, decision, searched_in(result["messages"]))
+    answer = result["messages"][-1].content
+    if not context:
+        await asyncio.to_thread(save_to_library, name, query, answer, source)
+    return answer
+
+async def arun_sub_agents_parallel(query: str, names: List[str], config: RunnableConfig = None,
+                                   context: str = "") -> Dict[str, str]:
+    """
+    并发调用多个子智能体（asyncio.gather），结果按 SUB_AGENTS 中的固定顺序排列
+
+    Args:
+        query (str): 用户的学习需求
+        names (List[str]): 需要调用的子智能体简称列表
+        config (RunnableConfig): 传递给子智能体的运行配置
+        context (str): 用户背景，见 run_sub_agent
+
+    Returns:
+        Dict[str, str]: 子智能体简称 -> 回答
+    """
+    ordered = [name for name in SUB_AGENTS if name in names]
+    config = {**(config or {}), "metadata": {**(config or {}).get("metadata", {}), "parallel_sub_agent": True}}
+    outputs = await asyncio.gather(
+        *(arun_sub_agent(name, query, config, context=context) for name in ordered),
+        return_exceptions=True,
+    )
+    results = {}
+    for name, output in zip(ordered, outputs):
+        if isinstance(output, Exception):
+            results[name] = f"「{SUB_AGENTS[name][1]}」调用失败: {str(output)}"
+        else:
+            results[name] = output
+    return results
+
+# 异步工具与同步工具同名，主控智能体的提示词无需区分
+@tool("learn_plan_agent_tool", response_format="content_and_artifact")
+async def alearn_plan_agent_tool(query: str):
+    """根据用户输入的学习目标，生成学习计划"""
+    return await acall_sub_agent_tool("plan", query)
+
+@tool("learn_data_agent_tool", response_format="content_and_artifact")
+async def alearn_data_agent_tool(query: str):
+    """根据用户输入的学习目标，搜索相关的学习资料"""
+    return await acall_sub_agent_tool("data", query)
+
+@tool("learn_explain_agent_tool", response_format="content_and_artifact")
+async def alearn_explain_agent_tool(query: str):
+    """根据用户输入的学习目标，用生动贴切的例子，进行形象阐释"""
+    return await acall_sub_agent_tool("explain", query)
+
+@tool("learn_multi_agent_tool", response_format="content_and_artifact")
+async def alearn_multi_agent_tool(query: str, agents: List[str]):
+    """
+    同时调用多个子智能体并按固定顺序拼接结果。
+    agents 取值为 "plan"（学习计划）、"data"（学习资料）、"explain"（形象阐释）中的多个，
+    当用户同时需要多种结果（如"学习计划+配套资源"）时使用
+    """
+    results = await arun_sub_agents_parallel(query, agents)
+    labels = "、".join(SUB_AGENTS[name][1] for name in results)
+    return sub_agent_tool_result(labels, MERGED_RESULT_SEPARATOR.join(results.values()), streamed=False)
 
 # 更新主控智能体系统提示词，加入记忆功能
 master_agent_system_prompt = """
@@ -309,89 +792,427 @@ master_agent_system_prompt = """
 - 记住用户的学习偏好和进度，避免重复建议
 """
 
-# 创建主控智能体
-master_agent = create_agent(
-    model=model, 
-    tools=[learn_plan_agent_tool, learn_data_agent_tool, learn_explain_agent_tool], 
-    prompt=master_agent_system_prompt
-)
+# 并行模式下追加的编排说明
+parallel_sub_agents_prompt = """
+### 并行调用
+- 当一轮需求需要多个子智能体时（如场景3、场景4），不要依次调用，
+  而是调用一次 learn_multi_agent_tool，并在 agents 中列出所需的子智能体，它们会同时执行
+- learn_multi_agent_tool 返回的结果已按"学习计划、学习资料、学习解释"的顺序拼接好，直接输出即可
+"""
+
+# 直通模式下追加的说明，覆盖前面"直接输出子智能体结果"的要求
+pass_through_prompt = """
+### 子智能体结果直通（优先于上文的结果整合要求）
+- 子智能体的完整结果会直接展示给用户，工具只返回结果摘要（句柄、长度与结构概要）
+- 不要复述、改写或重新输出子智能体的结果
+- 如无需补充，只用一句话收尾（如"以上是为您生成的学习计划，祝学习顺利"）
+- 仅当需要把多个结果联系起来（如说明资料与计划各阶段的对应关系）或回应用户的额外要求时，给出不超过 150 字的补充说明
+"""
+
+master_agent_tools = [learn_plan_agent_tool, learn_data_agent_tool, learn_explain_agent_tool]
+async_master_agent_tools = [alearn_plan_agent_tool, alearn_data_agent_tool, alearn_explain_agent_tool]
+if PARALLEL_SUB_AGENTS:
+    master_agent_tools.append(learn_multi_agent_tool)
+    async_master_agent_tools.append(alearn_multi_agent_tool)
+    master_agent_system_prompt += parallel_sub_agents_prompt
+if PASS_THROUGH_SUB_AGENTS:
+    master_agent_system_prompt += pass_through_prompt
+
+# 主控智能体与异步主控智能体（工具均为协程，配合 astream 使用），首次使用时创建
+master_agent = None
+async_master_agent = None
+
+def get_master_agent():
+    """获取主控智能体（首次调用时创建）"""
+    global master_agent
+    with _factory_lock:
+        if master_agent is None:
+            from langchain.agents import create_agent
+            master_agent = create_agent(
+                model=get_model(), 
+                tools=master_agent_tools, 
+                prompt=master_agent_system_prompt
+            )
+        return master_agent
+
+def get_async_master_agent():
+    """获取异步主控智能体（首次调用时创建）"""
+    global async_master_agent
+    with _factory_lock:
+        if async_master_agent is None:
+            from langchain.agents import create_agent
+            async_master_agent = create_agent(
+                model=get_model(),
+                tools=async_master_agent_tools,
+                prompt=master_agent_system_prompt
+            )
+        return async_master_agent
+
+# 流式输出的缓冲参数：累计到一定字符数或超过刷新间隔才写入终端，避免逐字符 flush
+STREAM_FLUSH_CHARS = 32
+STREAM_FLUSH_INTERVAL = 0.05  # 秒
+
+class BufferedStreamWriter:
+    """带缓冲的终端写入器"""
+    def __init__(self, stream=None, flush_chars: int = STREAM_FLUSH_CHARS,
+                 flush_interval: float = STREAM_FLUSH_INTERVAL):
+        self.stream = stream or sys.stdout
+        self.flush_chars = flush_chars
+        self.flush_interval = flush_interval
+        self._buffer: List[str] = []
+        self._buffered_chars = 0
+        self._last_flush = time.perf_counter()
+
+    def write(self, text: str):
+        """写入文本，达到字符阈值或时间阈值时刷新到终端"""
+        self._buffer.append(text)
+        self._buffered_chars += len(text)
+        if (self._buffered_chars >= self.flush_chars
+                or time.perf_counter() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """把缓冲区内容一次性写入终端"""
+        if self._buffer:
+            self.stream.write("".join(self._buffer))
+            self._buffer.clear()
+            self._buffered_chars = 0
+        self.stream.flush()
+        self._last_flush = time.perf_counter()
+
+def _stream_text(message, metadata: Dict[str, Any]):
+    """从 stream_mode="messages" 的一条输出中取出需要展示给用户的文本，不需要展示时返回 None"""
+    # 并行调用的子智能体不逐 token 输出，由合并后的工具结果一次性输出
+    if metadata.get("parallel_sub_agent"):
+        return None
+    # 只输出模型生成的文本；工具消息的内容已经作为子智能体 token 输出过了
+    if isinstance(message, AIMessage) and isinstance(message.content, str) and message.content:
+        return message.content
+    # 没有逐 token 输出过的工具结果（并行调用、计划库命中）在这里一次性输出；
+    # 直通模式下工具内容只是摘要，输出按句柄保存的完整结果
+    artifact = getattr(message, "artifact", None) if isinstance(message, ToolMessage) else None
+    if isinstance(artifact, dict) and artifact.get("streamed") is False:
+        return passed_through_output(message) or message.content
+    if isinstance(message, ToolMessage) and message.name == learn_multi_agent_tool.name:
+        return passed_through_output(message) or message.content
+    return None
+
+def iter_master_agent_tokens(messages: List[Dict[str, str]], config: RunnableConfig = None):
+    """
+    以 token 粒度迭代主控智能体（包括被调用的子智能体）生成的文本
+
+    Args:
+        messages (List[Dict[str, str]]): 发送给主控智能体的消息列表
+        config (RunnableConfig): 运行配置（如指标回调）
+
+    Yields:
+        tuple: (消息ID, 文本片段)，模型每生成一个片段就立即产出
+    """
+    # stream_mode="messages" 会在模型生成 token 时立即回调；
+    # subgraphs=True 使子智能体（在工具内部调用）的 token 也能实时输出
+    stream = get_master_agent().stream(
+        {"messages": messages},
+        config,
+        stream_mode="messages",
+        subgraphs=True,
+    )
+    for _namespace, (message, metadata) in stream:
+        text = _stream_text(message, metadata)
+        if text:
+            yield message.id, text
+
+async def aiter_master_agent_tokens(messages: List[Dict[str, str]], config: RunnableConfig = None):
+    """
+    iter_master_agent_tokens 的异步版本，基于 async_master_agent.astream
+
+    Args:
+        messages (List[Dict[str, str]]): 发送给主控智能体的消息列表
+        config (RunnableConfig): 运行配置（如指标回调）
+
+    Yields:
+        tuple: (消息ID, 文本片段)
+    """
+    stream = get_async_master_agent().astream(
+        {"messages": messages},
+        config,
+        stream_mode="messages",
+        subgraphs=True,
+    )
+    async for _namespace, (message, metadata) in stream:
+        text = _stream_text(message, metadata)
+        if text:
+            yield message.id, text
+
+def route_to_sub_agents(user_query: str):
+    """本地意图路由：意图明确时返回需要直接调用的子智能体简称列表，否则返回 None（由主控智能体编排）"""
+    if not INTENT_ROUTER_ENABLED:
+        return None
+    return route_query(user_query, allow_parallel=PARALLEL_SUB_AGENTS)
+
+def iter_sub_agent_tokens(names: List[str], query: str, config: RunnableConfig = None, context: str = ""):
+    """
+    绕过主控智能体，直接以 token 粒度输出子智能体的回答
+
+    Args:
+        names (List[str]): 子智能体简称列表，多个时并行调用后按固定顺序合并输出
+        query (str): 用户的学习需求
+        config (RunnableConfig): 运行配置（如指标回调）
+        context (str): 用户背景，见 run_sub_agent
+
+    Yields:
+        tuple: (消息ID, 文本片段)
+    """
+    config = config or {}
+    if len(names) > 1:
+        results = run_sub_agents_parallel(query, names, config, context)
+        yield "sub_agents", MERGED_RESULT_SEPARATOR.join(results.values())
+        return
+    stored = None if context else lookup_library(names[0], query)
+    if stored is not None:
+        yield "library", stored
+        return
+    agent, label, decision = select_sub_agent(names[0], query)
+    stream = agent.stream(
+        {"messages": [{"role": "user", "content": with_user_context(query, context)}]},
+        {**config, "run_name": agent_run_name(label)},
+        stream_mode="messages",
+    )
+    searched = False
+    # 最后一条消息即最终回答，结束后写入计划库
+    answers: Dict[str, List[str]] = {}
+    for message, metadata in stream:
+        searched = searched or isinstance(message, ToolMessage)
+        text = _stream_text(message, metadata)
+        if text:
+            answers.setdefault(message.id, []).append(text)
+            yield message.id, text
+    record_search_outcome(names[0], query, decision, searched)
+    if answers and not context:
+        save_to_library(names[0], query, "".join(list(answers.values())[-1]))
+
+async def aiter_sub_agent_tokens(names: List[str], query: str, config: RunnableConfig = None, context: str = ""):
+    """iter_sub_agent_tokens 的异步版本"""
+    config = config or {}
+    if len(names) > 1:
+        results = await arun_sub_agents_parallel(query, names, config, context)
+        yield "sub_agents", MERGED_RESULT_SEPARATOR.join(results.values())
+        return
+    stored = None if context else await asyncio.to_thread(lookup_library, names[0], query)
+    if stored is not None:
+        yield "library", stored
+        return
+    agent, label, decision = select_sub_agent(names[0], query)
+    stream = agent.astream(
+        {"messages": [{"role": "user", "content": with_user_context(query, context)}]},
+        {**config, "run_name": agent_run_name(label)},
+        stream_mode="messages",
+    )
+    searched = False
+    # 最后一条消息即最终回答，结束后写入计划库
+    answers: Dict[str, List[str]] = {}
+    async for message, metadata in stream:
+        searched = searched or isinstance(message, ToolMessage)
+        text = _stream_text(message, metadata)
+        if text:
+            answers.setdefault(message.id, []).append(text)
+            yield message.id, text
+    record_search_outcome(names[0], query, decision, searched)
+    if answers and not context:
+        await asyncio.to_thread(save_to_library, names[0], query, "".join(list(answers.values())[-1]))
+
+# 是否按前缀缓存友好的顺序排列消息：静态系统提示词 -> 历史对话 -> 易变的对话上下文 -> 当前输入。
+# DeepSeek 对与之前请求相同的消息前缀命中缓存，易变内容放在最后，前面的部分每轮都能复用
+PREFIX_CACHE_LAYOUT = os.getenv("PREFIX_CACHE_LAYOUT", "1") == "1"
+
+# 按 token 预算组装历史对话，旧消息的摘要使用带回复缓存的确定性模型生成
+context_builder = ContextBuilder(summarizer=make_llm_summarizer(get_model))
+
+def build_master_messages(user_query: str, conversation_memory: ConversationMemory) -> List[Dict[str, str]]:
+    """
+    构建发送给主控智能体的消息列表（对话上下文、历史对话与当前输入）
+
+    Args:
+        user_query (str): 用户的学习需求查询
+        conversation_memory (ConversationMemory): 对话记忆实例
+
+    Returns:
+        List[Dict[str, str]]: 消息列表
+    """
+    # 按 token 预算添加对话上下文和历史对话，超出预算的旧消息以滚动摘要代替
+    context = conversation_memory.get_conversation_context()
+    messages, stats = context_builder.build(conversation_memory, context)
+    if stats["saved_tokens"]:
+        print(f"🧮 上下文 {stats['used_tokens']} tokens（预算 {context_builder.budget}），"
+              f"本轮节省 {stats['saved_tokens']} tokens")
+    # 包含轮数、最近话题、滚动摘要的系统消息每轮都会变化，移到历史对话之后，避免打断缓存前缀
+    if PREFIX_CACHE_LAYOUT and messages and messages[0]["role"] == "system":
+        messages.append(messages.pop(0))
+    
+    # 添加当前用户输入
+    messages.append({"role": "user", "content": user_query})
+    return messages
+
+class StreamTurn:
+    """一轮流式输出：负责写入终端、分隔不同消息、拼接完整回复并统计延迟"""
+    def __init__(self, writer: BufferedStreamWriter = None):
+        self.writer = writer or BufferedStreamWriter()
+        self.full_response = ""
+        self.current_message_id = None
+        self.start_time = time.perf_counter()
+        self.first_token_time = None
+
+    def feed(self, message_id: str, text: str):
+        """写入一个文本片段"""
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+        # 不同消息（如子智能体结果与主控回复）之间换行分隔
+        if self.current_message_id is not None and message_id != self.current_message_id:
+            self.writer.write("\n")
+            self.full_response += "\n"
+        self.current_message_id = message_id
+        self.writer.write(text)
+        self.full_response += text
+
+    def finish(self) -> str:
+        """结束本轮输出，报告首个 token 延迟与本轮总耗时，返回完整回复"""
+        self.writer.write("\n")
+        self.writer.flush()
+        total_time = time.perf_counter() - self.start_time
+        ttft = (self.first_token_time - self.start_time) if self.first_token_time else total_time
+        print(f"⏱️ 首个token延迟：{ttft:.2f}s | 本轮总耗时：{total_time:.2f}s")
+        return self.full_response
+
+def get_master_semantic_cache():
+    """获取主控智能体的语义缓存，主控提示词或模型变化时自动切换到新的缓存版本"""
+    return get_semantic_cache(version=make_cache_version(master_agent_system_prompt, "deepseek:deepseek-chat"))
 
 # 主控智能体调用函数（流式输出版本，支持记忆）
-def run_master_agent_stream(user_query: str, conversation_memory: ConversationMemory):
+def run_master_agent_stream(user_query: str, conversation_memory: ConversationMemory,
+                            writer: BufferedStreamWriter = None, turn_metrics: TurnMetrics = None):
     """
-    主控智能体入口函数（流式输出版本，支持记忆）
+    主控智能体入口函数（token 级流式输出版本，支持记忆）
     
     Args:
         user_query (str): 用户的学习需求查询
         conversation_memory (ConversationMemory): 对话记忆实例
+        writer (BufferedStreamWriter): 输出目标，默认写入终端
+        turn_metrics (TurnMetrics): 本轮的指标回调，调用方需要读取本轮汇总时传入
         
     Returns:
         str: 助手的回复内容
     """
+    with turn_metrics or TurnMetrics() as turn_metrics:
+        response = _run_master_agent_stream(user_query, conversation_memory, writer, turn_metrics)
+    print(format_turn_summary(turn_metrics.summary()))
+    return response
+
+def _run_master_agent_stream(user_query: str, conversation_memory: ConversationMemory,
+                             writer: BufferedStreamWriter, turn_metrics: TurnMetrics) -> str:
     try:
-        # 构建包含历史对话的消息列表
-        messages = []
-        
-        # 添加对话上下文
-        context = conversation_memory.get_conversation_context()
-        if context and len(conversation_memory.conversation_history) > 0:
-            messages.append({"role": "system", "content": f"对话上下文：{context}"})
+        turn = StreamTurn(writer)
+        # 语义相近的请求直接返回历史回答，跳过整轮智能体调用
+        semantic_cache = get_master_semantic_cache()
+        cached = semantic_cache.lookup(user_query) if semantic_cache else None
+        if cached:
+            print("⚡ 命中语义缓存，直接返回历史回答")
+            turn.feed("semantic_cache", cached)
+            return turn.finish()
         
-        # 添加历史对话
-        history = conversation_memory.get_formatted_history()
-        messages.extend(history)
-        
-        # 添加当前用户输入
-        messages.append({"role": "user", "content": user_query})
-        
-        # 使用stream方法进行流式调用
-        stream = master_agent.stream({"messages": messages})
-        
-        # 收集完整回复
-        full_response = ""
+        # 意图明确的请求直接交给子智能体，省去主控智能体决定调用哪个工具的一次模型往返；
+        # 用户背景随请求一起传给子智能体，保留个性化信息
+        sub_agents = route_to_sub_agents(user_query)
+        if sub_agents:
+            print(f"🧭 本地路由：直接调用{'、'.join(SUB_AGENTS[name][1] for name in sub_agents)}")
+            context = build_sub_agent_context(user_query, conversation_memory)
+            tokens = iter_sub_agent_tokens(sub_agents, user_query, {"callbacks": [turn_metrics]}, context)
+        else:
+            messages = build_master_messages(user_query, conversation_memory)
+            config = {"callbacks": [turn_metrics], "run_name": agent_run_name("主控智能体")}
+            tokens = iter_master_agent_tokens(messages, config)
+        # 模型每生成一个 token 就写入终端，不再等待整段消息后逐字回放
+        for message_id, text in tokens:
+            turn.feed(message_id, text)
+        response = turn.finish()
+        if semantic_cache:
+            semantic_cache.update(user_query, response)
+        return response
+                            
+    except Exception as e:
+        error_msg = f"处理请求时出现错误: {str(e)}"
+        print(error_msg)
+        return error_msg
+
+async def arun_master_agent_stream(user_query: str, conversation_memory: ConversationMemory,
+                                   writer: BufferedStreamWriter = None, turn_metrics: TurnMetrics = None):
+    """
+    主控智能体异步入口函数，多个会话可以在同一个事件循环中并发执行
+    
+    Args:
+        user_query (str): 用户的学习需求查询
+        conversation_memory (ConversationMemory): 对话记忆实例
+        writer (BufferedStreamWriter): 输出目标，默认写入终端
+        turn_metrics (TurnMetrics): 本轮的指标回调，调用方需要读取本轮汇总时传入
         
-        # 流式输出每个chunk
-        for chunk in stream:
-            # 检查chunk中是否包含agent的输出
-            if "agent" in chunk:
-                agent_output = chunk["agent"]
-                if "messages" in agent_output and agent_output["messages"]:
-                    latest_message = agent_output["messages"][-1]
-                    if hasattr(latest_message, 'content') and latest_message.content:
-                        content = latest_message.content
-                        full_response += content
-                        # 逐字符输出，模拟打字机效果
-                        for char in content:
-                            print(char, end='', flush=True)
-                            time.sleep(0.015)  # 稍微加快打字速度
-                        print()  # 输出完成后换行
-            # 检查是否有工具调用的输出
-            elif "tools" in chunk:
-                tools_output = chunk["tools"]
-                if "messages" in tools_output and tools_output["messages"]:
-                    for message in tools_output["messages"]:
-                        if hasattr(message, 'content') and message.content:
-                            content = message.content
-                            full_response += content
-                            # 逐字符输出，模拟打字机效果
-                            for char in content:
-                                print(char, end='', flush=True)
-                                time.sleep(0.015)
-                            print()  # 输出完成后换行
+    Returns:
+        str: 助手的回复内容
+    """
+    with turn_metrics or TurnMetrics() as turn_metrics:
+        response = await _arun_master_agent_stream(user_query, conversation_memory, writer, turn_metrics)
+    print(format_turn_summary(turn_metrics.summary()))
+    return response
+
+async def _arun_master_agent_stream(user_query: str, conversation_memory: ConversationMemory,
+                                    writer: BufferedStreamWriter, turn_metrics: TurnMetrics) -> str:
+    try:
+        turn = StreamTurn(writer)
+        # embedding 查询是同步调用，放到线程中执行以免阻塞事件循环
+        semantic_cache = get_master_semantic_cache()
+        cached = None
+        if semantic_cache:
+            cached = await asyncio.to_thread(semantic_cache.lookup, user_query)
+        if cached:
+            print("⚡ 命中语义缓存，直接返回历史回答")
+            turn.feed("semantic_cache", cached)
+            return turn.finish()
         
-        return full_response
+        sub_agents = route_to_sub_agents(user_query)
+        if sub_agents:
+            print(f"🧭 本地路由：直接调用{'、'.join(SUB_AGENTS[name][1] for name in sub_agents)}")
+            context = build_sub_agent_context(user_query, conversation_memory)
+            tokens = aiter_sub_agent_tokens(sub_agents, user_query, {"callbacks": [turn_metrics]}, context)
+        else:
+            # 需要更新滚动摘要时会同步调用模型，放到线程中执行，避免阻塞事件循环
+            messages = await asyncio.to_thread(build_master_messages, user_query, conversation_memory)
+            config = {"callbacks": [turn_metrics], "run_name": agent_run_name("主控智能体")}
+            tokens = aiter_master_agent_tokens(messages, config)
+        async for message_id, text in tokens:
+            turn.feed(message_id, text)
+        response = turn.finish()
+        if semantic_cache:
+            await asyncio.to_thread(semantic_cache.update, user_query, response)
+        return response
                             
     except Exception as e:
         error_msg = f"处理请求时出现错误: {str(e)}"
         print(error_msg)
         return error_msg
 
+# 表示学习需求的关键词，用于更新用户学习档案（简单的关键词提取）
+LEARNING_KEYWORDS = ["学习", "学", "掌握", "了解", "入门", "进阶"]
+
+def remember_user_message(conversation_memory: ConversationMemory, user_input: str):
+    """把用户消息加入对话记忆，包含学习需求时记入学习档案"""
+    conversation_memory.add_message("user", user_input)
+    if any(keyword in user_input for keyword in LEARNING_KEYWORDS):
+        conversation_memory.update_user_profile(user_input)
+
 def main():
     """主程序入口，支持多轮对话"""
     print("🎓 欢迎使用智能学习助手！")
     print("=" * 50)
     
-    # 加载历史对话记忆
+    # 创建并加载历史对话记忆
+    memory = create_cli_memory()
     memory.load_from_file()
     
     print("💡 输入 'quit' 或 'exit' 退出程序")
@@ -412,15 +1233,38 @@ def main():
             if user_input.lower() in ['quit', 'exit', '退出']:
                 print("\n👋 感谢使用智能学习助手，祝您学习愉快！")
                 memory.save_to_file()  # 保存对话记忆
+                from search_cache import get_search_cache
+                from llm_cache import get_llm_cache
+                stats = get_search_cache().stats()
+                print(f"🔍 搜索缓存：命中 {stats['hits']} 次，未命中 {stats['misses']} 次，"
+                      f"跳过 {stats['bypassed']} 次，命中率 {stats['hit_rate']:.0%}")
+                if tavily_search_tool is not None and tavily_search_tool.compression_stats["searches"]:
+                    stats = tavily_search_tool.compression_stats
+                    print(f"✂️ 搜索结果压缩：{stats['searches']} 次，{stats['original_tokens']} -> "
+                          f"{stats['compressed_tokens']} tokens")
+                plan_library = get_plan_library()
+                if plan_library:
+                    stats = plan_library.stats()
+                    print(f"📚 本地计划库：命中 {stats['hits']} 次（精确 {stats['exact']} / 全文 {stats['text']} / "
+                          f"向量 {stats['vector']}），未命中 {stats['misses']} 次，过期 {stats['expired']} 次，"
+                          f"共 {stats['entries']} 条")
+                llm_cache = get_llm_cache()
+                if llm_cache:
+                    stats = llm_cache.stats()
+                    print(f"🧠 模型回复缓存：命中 {stats['hits']} 次，未命中 {stats['misses']} 次，"
+                          f"命中率 {stats['hit_rate']:.0%}，缓存条数 {stats['entries']}")
+                stats = get_prompt_cache_stats().stats()
+                if stats["hit_tokens"] or stats["miss_tokens"]:
+                    print(f"📦 DeepSeek 前缀缓存：命中 {stats['hit_tokens']} tokens，未命中 {stats['miss_tokens']} tokens，"
+                          f"命中率 {stats['hit_rate']:.0%}")
+                semantic_cache = get_master_semantic_cache()
+                if semantic_cache:
+                    stats = semantic_cache.stats()
+                    print(f"⚡ 语义缓存：命中 {stats['hits']} 次，未命中 {stats['misses']} 次，"
+                          f"命中率 {stats['hit_rate']:.0%}")
                 break
             elif user_input.lower() in ['clear', '清除']:
-                memory.conversation_history.clear()
-                memory.user_profile = {
-                    "learning_goals": [],
-                    "completed_topics": [],
-                    "current_level": "beginner",
-                    "preferences": {}
-                }
+                memory.clear()
                 print("✅ 对话历史已清除")
                 continue
             elif user_input.lower() in ['history', '历史']:
@@ -439,13 +1283,8 @@ def main():
                 print(f"📊 当前水平：{memory.user_profile['current_level']}")
                 continue
             
-            # 添加用户消息到记忆
-            memory.add_message("user", user_input)
-            
-            # 更新用户学习档案（简单的关键词提取）
-            learning_keywords = ["学习", "学", "掌握", "了解", "入门", "进阶"]
-            if any(keyword in user_input for keyword in learning_keywords):
-                memory.update_user_profile(user_input)
+            # 添加用户消息到记忆，并更新学习档案
+            remember_user_message(memory, user_input)
             
             print("\n🤖 正在为您生成回答...")
             print("-" * 50)
@@ -0,0 +1,443 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from data_dir import data_path
+from search_compress import tokenize
+from search_gate import VOLATILE_TOPIC_PATTERN
+from semantic_cache import EMBEDDING_BASE_URL, EMBEDDING_MODEL, is_cacheable_query
+
+# 本地计划库：持久化保存子智能体生成过的学习计划，按"规范化的技术名称 + 用户水平 + 应用场景 + 资料类型"建立索引。
+# 热门技术的请求高度集中，查库命中时直接返回（附上说明后的）已有计划，只有未命中或已过期才重新生成。
+# 查找顺序：精确匹配 -> 全文检索（SQLite FTS5，中文按两字切分）-> 向量检索（Chroma，可选）
+
+PLAN_LIBRARY_ENABLED = os.getenv("PLAN_LIBRARY_ENABLED", "1") == "1"
+PLAN_LIBRARY_DB = os.getenv("PLAN_LIBRARY_DB", data_path("plan_library.sqlite3"))
+PLAN_LIBRARY_TTL = int(os.getenv("PLAN_LIBRARY_TTL", str(30 * 24 * 3600)))                    # 有效期（秒）
+PLAN_LIBRARY_VOLATILE_TTL = int(os.getenv("PLAN_LIBRARY_VOLATILE_TTL", str(7 * 24 * 3600)))  # 易变主题的有效期
+PLAN_LIBRARY_DATA_TTL = int(os.getenv("PLAN_LIBRARY_DATA_TTL", str(7 * 24 * 3600)))  # 资料汇总的有效期（链接更容易失效）
+# 查找记录用于统计各主题的命中率与需求（见 prewarm），超过保留期的记录在预热时清理
+PLAN_LIBRARY_LOOKUP_RETENTION = int(os.getenv("PLAN_LIBRARY_LOOKUP_RETENTION", str(90 * 24 * 3600)))
+PLAN_LIBRARY_TEXT_THRESHOLD = float(os.getenv("PLAN_LIBRARY_TEXT_THRESHOLD", "0.6"))  # 全文检索的词项重合度阈值
+# 向量检索需要可用的 embedding 服务，默认关闭
+PLAN_LIBRARY_VECTOR_ENABLED = os.getenv("PLAN_LIBRARY_VECTOR_ENABLED", "0") == "1"
+PLAN_LIBRARY_VECTOR_DIR = os.getenv("PLAN_LIBRARY_VECTOR_DIR", data_path("plan_library_db"))
+PLAN_LIBRARY_VECTOR_THRESHOLD = float(os.getenv("PLAN_LIBRARY_VECTOR_THRESHOLD", "0.9"))
+# 过短的结果（如出错信息）不入库
+PLAN_LIBRARY_MIN_CHARS = 200
+
+LEVEL_LABELS = {"beginner": "零基础", "intermediate": "有一定基础", "advanced": "进阶提升"}
+# 按顺序匹配，"从零基础到精通"算作零基础
+LEVEL_PATTERNS = [
+    ("beginner", re.compile(r"零基础|小白|新手|初学|初级|入门|没有?[^，。,.！!？?]{0,12}?基础")),
+    ("intermediate", re.compile(r"有[^，。,.！!？?]{0,12}?基础|中级|进阶|提升|熟悉|工作经验|转行")),
+    ("advanced", re.compile(r"高级|专家|精通|深入|源码|架构师")),
+]
+# 用户已有的背景（如"有 Java 基础，想学 Spring Boot"中的 Java）不是本次要学的技术，不计入技术名称；
+# 去掉后没有剩下技术名称时（如"有 Java 基础怎么进阶"）仍按原文解析
+BACKGROUND_PATTERN = re.compile(r"(?:没有|有|具备|学过|懂)[^，。,.！!？?]{0,12}?(?:基础|经验)")
+# 从输入中去掉的水平描述
+LEVEL_WORD_PATTERN = re.compile(r"水平|零基础|小白|新手|初学者?|初级|中级|入门|编程基础|基础|进阶|提升|熟悉|工作经验|高级|专家|精通|深入|源码|架构师|没有|有")
+SCENARIO_PATTERN = re.compile(r"(?:目标是|用于|用来|用在|应用于|为了|以便|方向是?|想从事|转行做?)([^，。,.！!？?、\s]{2,12})")
+DURATION_PATTERN = re.compile(r"[一二两三四五六七八九十半\d]+\s*个?(?:天|周|星期|月|年|小时)")
+# 资料类型：用户点名要的资料形式（书、课程、视频等）不同，资料汇总也不同，按顺序取第一个出现的类型
+# （"视频课程"算作视频）
+RESOURCE_TYPES = [
+    ("视频", r"视频|b站"),
+    ("课程", r"课程|网课|公开课|慕课"),
+    ("书籍", r"书籍|书单|电子书|本书|好书|的书|书(?=[，。,.！!？?、\s]|$)"),
+    ("文档", r"官方文档|文档|手册"),
+    ("项目", r"实战项目|开源项目|练手项目|项目"),
+]
+RESOURCE_TYPE_PATTERNS = [(label, re.compile(pattern)) for label, pattern in RESOURCE_TYPES]
+RESOURCE_PATTERN = re.compile("|".join(pattern for _, pattern in RESOURCE_TYPES))
+# 含"学习""学"二字的技术名称与学科，去掉"学习""想学"等动词时需要保留（如"数学""大学物理"）
+PROTECTED_TERM_PATTERN = re.compile(
+    r"(?:机器|深度|强化|迁移|联邦|无监督|半监督|监督|元|对比|表示|集成|统计)学习|"
+    r"(?:小学|初中|中学|高中|大学)(?:数学|物理|化学|生物|英语|语文)|(?:高等|离散|应用|工程)数学|"
+    r"(?:数|化|医|药|哲|史|文|法|美|力|光|声|热|物理|生物|经济|心理|统计|天文|地理|社会|教育|管理|金融|会计|"
+    r"语言|逻辑|运筹|量子|计算机科|数据科|科)学(?!习)|学前教育|学术"
+)
+FILLER_PATTERN = re.compile(
+    r"学习计划|学习路线图?|学习路径|学习规划|学习方案|路线图|时间表|计划|路线|规划|"
+    r"请|帮我|帮忙|给我|为我|我想学习?|我想|我要|想要|希望|能否|可以|一下|制定|生成|设计|安排|"
+    r"一个|一份|一套|完整|详细|系统地?|全面|怎么学|如何学|(?:想|要|先|再|自)学习?|学习|学好|学会|"
+    r"应该|怎么|如何|开始|掌握|了解|"
+    # 单独的"学"只在紧跟英文技术名、学科占位符或位于句首时才是动词，避免把"数学"变成"数"
+    r"学(?=[\sa-z0-9\x00])|(?:^|(?<=\s))学|"
+    r"先|什么|哪些|需要|建议|方法|指导|转行|想|要|做|我|的|吗|呢|吧|呀|和|与|及|"
+    r"学习资料|资料|资源|教程|推荐|好的|一些|几[本个门套部]|有哪些|汇总|找|"
+    r"[，。,.！!？?、：:；;\s\"“”'‘’（）()【】]"
+)
+KIND_LABELS = {"plan": "学习计划", "data": "学习资料汇总"}
+
+@dataclass
+class PlanRequest:
+    """从用户输入中解析出的计划库索引键与附加要求"""
+    technology: str
+    level: str
+    scenario: str
+    duration: str = ""
+    resource: str = ""  # 资料类型，见 RESOURCE_TYPES
+
+    def terms(self) -> List[str]:
+        return tokenize(f"{self.technology} {self.scenario}")
+
+@dataclass
+class LibraryEntry:
+    """计划库中的一条记录"""
+    key: str
+    kind: str
+    technology: str
+    level: str
+    scenario: str
+    query: str
+    text: str
+    created_at: float
+    expires_at: float
+    source: str
+    match: str = ""   # 本次查找的命中方式：exact/text/vector
+    hits: int = 0
+    resource: str = ""
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).lower().strip()
+
+def parse_plan_request(query: str) -> Optional[PlanRequest]:
+    """
+    解析用户输入中的技术名称、用户水平、应用场景、计划时长与资料类型
+
+    Args:
+        query (str): 用户的学习需求，如"零基础三个月学 Python 用于数据分析"
+
+    Returns:
+        Optional[PlanRequest]: 解析结果，无法识别出技术名称时返回 None
+    """
+    text = _normalize(query)
+    level = next((name for name, pattern in LEVEL_PATTERNS if pattern.search(text)), "beginner")
+    resource = next((label for label, pattern in RESOURCE_TYPE_PATTERNS if pattern.search(text)), "")
+    text = RESOURCE_PATTERN.sub(" ", text)
+    duration_match = DURATION_PATTERN.search(text)
+    scenario_match = SCENARIO_PATTERN.search(text)
+    scenario = _strip_fillers(scenario_match.group(1)) if scenario_match else ""
+    for pattern in (SCENARIO_PATTERN, DURATION_PATTERN):
+        text = pattern.sub(" ", text)
+    technology = (_strip_fillers(LEVEL_WORD_PATTERN.sub(" ", BACKGROUND_PATTERN.sub(" ", text)))
+                  or _strip_fillers(LEVEL_WORD_PATTERN.sub(" ", text)))
+    if not technology:
+        return None
+    return PlanRequest(technology, level, scenario, duration_match.group(0) if duration_match else "", resource)
+
+def _strip_fillers(text: str) -> str:
+    """去掉填充词，"机器学习""数学"等名称先换成占位符，去掉填充词后再换回"""
+    protected = PROTECTED_TERM_PATTERN.findall(text)
+    for i, term in enumerate(protected):
+        text = text.replace(term, f"\x00{i}\x00", 1)
+    text = FILLER_PATTERN.sub("", text)
+    for i, term in enumerate(protected):
+        text = text.replace(f"\x00{i}\x00", term)
+    return text
+
+class PlanLibrary:
+    """
+    持久化的计划库（SQLite），支持精确、全文与向量三种查找方式。
+
+    每条记录带有版本号（子智能体提示词与模型的哈希），版本变化后旧记录不再命中；
+    超过有效期的记录不再命中，重新生成后覆盖。易变主题（见 search_gate）与资料汇总使用更短的有效期。
+    每次查找都记入 plan_library_lookups，供预热任务统计命中率和挖掘未命中的热门主题。
+    """
+    def __init__(self, db_path: str = PLAN_LIBRARY_DB, ttl_seconds: int = PLAN_LIBRARY_TTL,
+                 volatile_ttl_seconds: int = PLAN_LIBRARY_VOLATILE_TTL,
+                 data_ttl_seconds: int = PLAN_LIBRARY_DATA_TTL,
+                 text_threshold: float = PLAN_LIBRARY_TEXT_THRESHOLD,
+                 vector: bool = PLAN_LIBRARY_VECTOR_ENABLED, embedding=None):
+        self.ttl_seconds = ttl_seconds
+        self.volatile_ttl_seconds = volatile_ttl_seconds
+        self.kind_ttl_seconds = {"data": data_ttl_seconds}
+        self.text_threshold = text_threshold
+        self.counts = {"exact": 0, "text": 0, "vector": 0, "misses": 0, "expired": 0, "skipped": 0, "stored": 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS plan_library (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                version TEXT NOT NULL,
+                technology TEXT NOT NULL,
+                level TEXT NOT NULL,
+                scenario TEXT NOT NULL,
+                query TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                source TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                resource TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS idx_plan_library_lookup ON plan_library(kind, version, level, scenario);
+            CREATE VIRTUAL TABLE IF NOT EXISTS plan_library_fts USING fts5(terms, key UNINDEXED);
+            CREATE TABLE IF NOT EXISTS plan_library_lookups (
+                ts REAL NOT NULL,
+                kind TEXT NOT NULL,
+                technology TEXT NOT NULL,
+                level TEXT NOT NULL,
+                scenario TEXT NOT NULL,
+                result TEXT NOT NULL,
+                resource TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS idx_plan_library_lookups_ts ON plan_library_lookups(ts);
+        """)
+        # 早期的库没有资料类型列，补上后旧记录的资料类型为空
+        for table in ("plan_library", "plan_library_lookups"):
+            columns = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if "resource" not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN resource TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+        self.vectorstore = None
+        if vector:
+            # 依赖较重，只在启用向量检索时导入
+            from langchain_chroma import Chroma
+            if embedding is None:
+                from langchain_openai import OpenAIEmbeddings
+                embedding = OpenAIEmbeddings(base_url=EMBEDDING_BASE_URL, model=EMBEDDING_MODEL)
+            self.vectorstore = Chroma(
+                collection_name="plan_library",
+                embedding_function=embedding,
+                persist_directory=PLAN_LIBRARY_VECTOR_DIR,
+                collection_metadata={"hnsw:space": "cosine"},
+            )
+
+    @staticmethod
+    def make_key(kind: str, version: str, request: PlanRequest) -> str:
+        # 没有资料类型时与早期的索引键相同，已有记录仍能命中
+        fields = [kind, version, request.technology, request.level, request.scenario]
+        return json.dumps(fields + [request.resource] if request.resource else fields, ensure_ascii=False)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _row_to_entry(self, row: sqlite3.Row, match: str) -> LibraryEntry:
+        return LibraryEntry(row["key"], row["kind"], row["technology"], row["level"], row["scenario"], row["query"],
+                            row["text"], row["created_at"], row["expires_at"], row["source"], match, row["hits"],
+                            row["resource"])
+
+    def _log_lookup(self, kind: str, request: PlanRequest, result: str):
+        """记录一次查找及其结果（exact/text/vector/miss/expired），调用方需持有锁"""
+        self._conn.execute("""
+            INSERT INTO plan_library_lookups (ts, kind, technology, level, scenario, result, resource)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (time.time(), kind, request.technology, request.level, request.scenario, result, request.resource))
+        self._conn.commit()
+
+    def _find_exact(self, key: str) -> Optional[sqlite3.Row]:
+        return self._conn.execute("SELECT * FROM plan_library WHERE key = ?", (key,)).fetchone()
+
+    def _find_text(self, kind: str, version: str, request: PlanRequest) -> Optional[sqlite3.Row]:
+        """全文检索同类型、同版本、同水平、场景与资料类型的记录，词项重合度达到阈值才算命中"""
+        terms = set(request.terms())
+        if not terms:
+            return None
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        rows = self._conn.execute("""
+            SELECT p.* FROM plan_library_fts f JOIN plan_library p ON p.key = f.key
+            WHERE plan_library_fts MATCH ? AND p.kind = ? AND p.version = ? AND p.level = ? AND p.scenario = ?
+                AND p.resource = ?
+            ORDER BY bm25(plan_library_fts) LIMIT 5
+        """, (match, kind, version, request.level, request.scenario, request.resource)).fetchall()
+        for row in rows:
+            candidate = set(tokenize(f"{row['technology']} {row['scenario']}"))
+            if len(terms & candidate) / len(terms | candidate) >= self.text_threshold:
+                return row
+        return None
+
+    def _find_vector_key(self, kind: str, version: str, request: PlanRequest) -> Optional[str]:
+        """向量检索最相近的记录，返回其索引键。需要调用 embedding 服务，调用方不应持有锁"""
+        if self.vectorstore is None:
+            return None
+        try:
+            results = self.vectorstore.similarity_search_with_relevance_scores(
+                f"{request.technology} {request.scenario}", k=1,
+                filter={"$and": [{"kind": kind}, {"version": version}, {"level": request.level},
+                                 {"scenario": request.scenario}, {"resource": request.resource}]},
+            )
+        except Exception as e:
+            print(f"计划库向量检索失败: {e}")
+            return None
+        if results and results[0][1] >= PLAN_LIBRARY_VECTOR_THRESHOLD:
+            return results[0][0].metadata["key"]
+        return None
+
+    def lookup(self, query: str, kind: str = "plan", version: str = "") -> Optional[LibraryEntry]:
+        """
+        查找与请求匹配且未过期的记录
+
+        Args:
+            query (str): 用户的学习需求
+            kind (str): 记录类型（子智能体简称，如 plan）
+            version (str): 当前的提示词与模型版本
+
+        Returns:
+            Optional[LibraryEntry]: 命中的记录（match 字段为命中方式），未命中时返回 None
+        """
+        request = parse_plan_request(query) if is_cacheable_query(query) else None
+        if request is None:
+            self._count("skipped")
+            return None
+        with self._lock:
+            match, row = "exact", self._find_exact(self.make_key(kind, version, request))
+            if row is None:
+                match, row = "text", self._find_text(kind, version, request)
+        # 向量检索要请求 embedding 服务，放在锁外执行，不阻塞其他线程的查找与写入
+        vector_key = self._find_vector_key(kind, version, request) if row is None else None
+        with self._lock:
+            if vector_key is not None:
+                match, row = "vector", self._find_exact(vector_key)
+            if row is None:
+                self.counts["misses"] += 1
+                self._log_lookup(kind, request, "miss")
+                return None
+            if row["expires_at"] < time.time():
+                self.counts["expired"] += 1
+                self._log_lookup(kind, request, "expired")
+                return None
+            self._conn.execute("UPDATE plan_library SET hits = hits + 1 WHERE key = ?", (row["key"],))
+            self.counts[match] += 1
+            self._log_lookup(kind, request, match)
+            return self._row_to_entry(row, match)
+
+    def peek(self, query: str, kind: str = "plan", version: str = "") -> Optional[LibraryEntry]:
+        """
+        按精确索引键读取记录（包括已过期的），不计入命中统计，供预热任务检查新鲜度
+
+        Returns:
+            Optional[LibraryEntry]: 库中的记录，不存在或请求无法解析时返回 None
+        """
+        request = parse_plan_request(query) if is_cacheable_query(query) else None
+        if request is None:
+            return None
+        with self._lock:
+            row = self._find_exact(self.make_key(kind, version, request))
+        return self._row_to_entry(row, "exact") if row is not None else None
+
+    def lookup_counts(self, since: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        按主题汇总 since 之后的查找次数与命中次数
+
+        Returns:
+            List[Dict[str, Any]]: 每项包含 kind/technology/level/scenario/resource/lookups/hits，按查找次数降序
+        """
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT kind, technology, level, scenario, resource, COUNT(*) AS lookups,
+                       SUM(result NOT IN ('miss', 'expired')) AS hits
+                FROM plan_library_lookups WHERE ts >= ?
+                GROUP BY kind, technology, level, scenario, resource ORDER BY lookups DESC
+            """, (since,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def prune_lookups(self, before: float) -> int:
+        """删除 before 之前的查找记录，返回删除的条数"""
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM plan_library_lookups WHERE ts < ?", (before,)).rowcount
+            self._conn.commit()
+        return deleted
+
+    def store(self, query: str, text: str, kind: str = "plan", version: str = "", source: str = "agent") -> bool:
+        """
+        把新生成的结果写入计划库，已有相同索引键的记录被覆盖
+
+        Returns:
+            bool: 是否写入（时效性请求、依赖上文的请求与过短的结果不入库）
+        """
+        request = parse_plan_request(query) if is_cacheable_query(query) else None
+        if request is None or len(text or "") < PLAN_LIBRARY_MIN_CHARS:
+            return False
+        now = time.time()
+        ttl = self.kind_ttl_seconds.get(kind, self.ttl_seconds)
+        if VOLATILE_TOPIC_PATTERN.search(f"{request.technology} {request.scenario}"):
+            ttl = min(ttl, self.volatile_ttl_seconds)
+        expires_at = now + ttl
+        key = self.make_key(kind, version, request)
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO plan_library
+                    (key, kind, version, technology, level, scenario, query, text, created_at, expires_at, source, hits,
+                     resource)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
+            """, (key, kind, version, request.technology, request.level, request.scenario, query, text, now,
+                  expires_at, source, request.resource))
+            self._conn.execute("DELETE FROM plan_library_fts WHERE key = ?", (key,))
+            self._conn.execute("INSERT INTO plan_library_fts (terms, key) VALUES (?, ?)",
+                               (" ".join(request.terms()), key))
+            self._conn.commit()
+            self.counts["stored"] += 1
+        if self.vectorstore is not None:
+            try:
+                self.vectorstore.add_texts(
+                    [f"{request.technology} {request.scenario}"],
+                    metadatas=[{"key": key, "kind": kind, "version": version, "level": request.level,
+                                "scenario": request.scenario, "resource": request.resource}],
+                    ids=[hashlib.sha256(key.encode("utf-8")).hexdigest()],
+                )
+            except Exception as e:
+                print(f"计划库向量写入失败: {e}")
+        return True
+
+    def adapt(self, entry: LibraryEntry, query: str) -> str:
+        """在库中的结果前加上来源说明，并按本次请求的时长等要求给出调整提示"""
+        request = parse_plan_request(query)
+        created = datetime.fromtimestamp(entry.created_at).strftime("%Y-%m-%d")
+        note = (f"（以下{KIND_LABELS.get(entry.kind, '结果')}取自本地计划库，"
+                f"为「{entry.technology}」{LEVEL_LABELS.get(entry.level, entry.level)}学习者生成于 {created}")
+        if entry.scenario:
+            note += f"，面向{entry.scenario}"
+        if entry.resource:
+            note += f"，资料类型为{entry.resource}"
+        note += "。"
+        if request and request.duration:
+            note += f"您计划用时{request.duration}，可按比例调整各阶段的学习时长。"
+        return f"{note}）\n\n{entry.text}"
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM plan_library").fetchone()[0]
+
+    def clear(self):
+        """清空计划库"""
+        with self._lock:
+            self._conn.execute("DELETE FROM plan_library")
+            self._conn.execute("DELETE FROM plan_library_fts")
+            self._conn.execute("DELETE FROM plan_library_lookups")
+            self._conn.commit()
+        if self.vectorstore is not None:
+            self.vectorstore.reset_collection()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计"""
+        with self._lock:
+            counts = dict(self.counts)
+        hits = counts["exact"] + counts["text"] + counts["vector"]
+        lookups = hits + counts["misses"] + counts["expired"]
+        return {**counts, "hits": hits, "hit_rate": hits / lookups if lookups else 0.0, "entries": len(self)}
+
+_plan_library: Optional[PlanLibrary] = None
+_plan_library_lock = threading.Lock()
+
+def get_plan_library() -> Optional[PlanLibrary]:
+    """获取进程内共享的计划库，PLAN_LIBRARY_ENABLED=0 时返回 None"""
+    global _plan_library
+    if not PLAN_LIBRARY_ENABLED:
+        return None
+    with _plan_library_lock:
+        if _plan_library is None:
+            _plan_library = PlanLibrary()
+        return _plan_library
@@ -0,0 +1,370 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import argparse
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from data_dir import data_path
+from plan_library import PLAN_LIBRARY_DB, PLAN_LIBRARY_LOOKUP_RETENTION, PlanLibrary, PlanRequest, parse_plan_request
+from semantic_cache import is_cacheable_query
+from intent_router import match_intents
+from memory_journal import MEMORY_FILE, MEMORY_JOURNAL_PREFIX, MemoryJournal
+from session_store import SESSION_DB
+
+# 计划库预热任务：在用户到来之前，为热门主题提前运行计划生成与资料搜索两个子智能体，结果写入本地计划库，
+# 用户请求时子智能体工具先查库（见 multi_agents_pro.lookup_library），每个主题当天的第一位用户也不必等待生成。
+# - 主题来自命令行/文件，或从对话记忆中的学习目标与计划库未命中的查找记录中挖掘，按需求量排序取前 N 个
+# - 只生成缺失、已过期或即将过期的记录，并发上限内异步运行
+# - 输出报告：每个主题的新鲜度（生成时间、过期时间、来源）、覆盖率与命中率
+# 适合由 cron 定时运行，例如每天凌晨：
+#   0 4 * * * cd /path/to/learn_boy && python prewarm.py --mine --top 30
+
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", "2"))
+PREWARM_TOP_TOPICS = int(os.getenv("PREWARM_TOP_TOPICS", "20"))
+PREWARM_REFRESH_BEFORE = int(os.getenv("PREWARM_REFRESH_BEFORE", str(24 * 3600)))     # 距过期不足该时长的记录提前刷新
+PREWARM_HIT_RATE_WINDOW = int(os.getenv("PREWARM_HIT_RATE_WINDOW", str(7 * 24 * 3600)))  # 统计命中率的时间窗口
+PREWARM_REPORT = os.getenv("PREWARM_REPORT", data_path("prewarm_report.json"))
+PREWARM_KINDS = ("plan", "data")
+# 超过该长度的"技术名称"多半是整句闲聊，不作为预热主题
+PREWARM_MAX_TOPIC_CHARS = 20
+
+# 学习目标中需要出现学习意图（或计划/资料类关键词，见 intent_router），闲聊类输入不作为主题
+LEARNING_GOAL_PATTERN = re.compile("学|掌握|基础|入门|精通|进阶|转行")
+# 由主题拼出的请求需要能解析回同一个索引键，水平描述只使用 LEVEL_PATTERNS 能识别、且去掉后不留残余的说法
+LEVEL_TEMPLATES = {"beginner": "零基础学习{tech}", "intermediate": "有基础，想进阶学习{tech}", "advanced": "想精通{tech}"}
+KIND_PHRASES = {"plan": "请制定一份学习计划", "data": "请推荐学习资料"}
+STATUS_LABELS = {"fresh": "新鲜", "expiring": "即将过期", "expired": "已过期", "missing": "缺失"}
+
+def topic_from_text(text: str, explicit: bool = False) -> Optional[PlanRequest]:
+    """
+    把一条学习目标或命令行给出的主题解析为计划库索引键
+
+    Args:
+        text (str): 如"我想学习Python"、"零基础 React"
+        explicit (bool): 是否为人工指定的主题（如"Go"），指定的主题不受最短长度等缓存条件限制
+
+    Returns:
+        Optional[PlanRequest]: 解析结果；时效性请求、依赖上文的请求、没有学习意图的输入与过长的结果返回 None
+    """
+    if not explicit:
+        if not is_cacheable_query(text):
+            return None
+        intents = match_intents(text)
+        if not (intents & {"plan", "data", "full"} or (LEARNING_GOAL_PATTERN.search(text) and intents != {"explain"})):
+            return None
+    request = parse_plan_request(text)
+    if request is None or len(request.technology) > PREWARM_MAX_TOPIC_CHARS:
+        return None
+    return request
+
+def make_topic_query(topic: PlanRequest, kind: str) -> str:
+    """由主题拼出交给子智能体的请求，解析后的索引键与主题相同"""
+    query = LEVEL_TEMPLATES.get(topic.level, "学习{tech}").format(tech=topic.technology)
+    if topic.scenario:
+        query += f"，用于{topic.scenario}"
+    if topic.resource:
+        query += f"，推荐{topic.resource}"
+    return f"{query}，{KIND_PHRASES[kind]}"
+
+def topic_key(topic: PlanRequest) -> Tuple[str, str, str, str]:
+    return topic.technology, topic.level, topic.scenario, topic.resource
+
+def iter_learning_goals(memory_files: Iterable[str] = (MEMORY_FILE,),
+                        journal_prefix: Optional[str] = MEMORY_JOURNAL_PREFIX,
+                        session_db: Optional[str] = SESSION_DB) -> Iterator[str]:
+    """
+    读取各种记忆存储中的学习目标（user_profile.learning_goals），不存在的存储直接跳过
+
+    Args:
+        memory_files (Iterable[str]): JSON 格式的对话记忆文件
+        journal_prefix (Optional[str]): 追加式日志存储的路径前缀（见 memory_journal）
+        session_db (Optional[str]): 多用户会话库（见 session_store），每个会话的学习目标都计入
+
+    Yields:
+        str: 学习目标原文
+    """
+    profiles = []
+    for path in memory_files:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                profiles.append(json.load(f).get("user_profile"))
+    if journal_prefix:
+        for compress in (False, True):
+            journal = MemoryJournal(journal_prefix, compress=compress)
+            if journal.exists():
+                profiles.append((journal.load(0) or {}).get("user_profile"))
+                journal.close()
+    if session_db and os.path.exists(session_db):
+        conn = sqlite3.connect(session_db)
+        try:
+            profiles.extend(json.loads(row[0]) for row in conn.execute(
+                "SELECT user_profile FROM sessions WHERE user_profile IS NOT NULL"))
+        finally:
+            conn.close()
+    for profile in profiles:
+        yield from (profile or {}).get("learning_goals") or []
+
+def mine_topics(goals: Iterable[str], library: Optional[PlanLibrary] = None, since: float = 0.0,
+                top: int = PREWARM_TOP_TOPICS) -> List[Tuple[PlanRequest, int]]:
+    """
+    按需求量挖掘热门主题：每条学习目标计 1，计划库中未命中的每次查找计 1
+
+    Returns:
+        List[Tuple[PlanRequest, int]]: 需求量最高的 top 个主题及其需求量
+    """
+    demand: Counter = Counter()
+    topics: Dict[Tuple[str, str, str, str], PlanRequest] = {}
+    for goal in goals:
+        topic = topic_from_text(goal)
+        if topic is not None:
+            topics.setdefault(topic_key(topic), topic)
+            demand[topic_key(topic)] += 1
+    if library is not None:
+        for row in library.lookup_counts(since):
+            misses = row["lookups"] - row["hits"]
+            if misses and len(row["technology"]) <= PREWARM_MAX_TOPIC_CHARS:
+                key = (row["technology"], row["level"], row["scenario"], row["resource"])
+                topics.setdefault(key, PlanRequest(*key[:3], resource=key[3]))
+                demand[key] += misses
+    return [(topics[key], count) for key, count in demand.most_common(top)]
+
+def load_topic_list(topics: Iterable[str]) -> List[Tuple[PlanRequest, int]]:
+    """解析命令行或文件给出的主题列表，无法识别的主题给出提示后跳过，重复的主题只保留一次"""
+    result: Dict[Tuple[str, str, str, str], Tuple[PlanRequest, int]] = {}
+    for text in topics:
+        text = text.strip()
+        if not text or text.startswith("#"):
+            continue
+        topic = topic_from_text(text, explicit=True)
+        if topic is None:
+            print(f"⚠️ 无法识别的主题「{text}」，已跳过")
+            continue
+        result.setdefault(topic_key(topic), (topic, 1))
+    return list(result.values())
+
+def entry_freshness(library: PlanLibrary, topic: PlanRequest, kind: str, version: str,
+                    refresh_before: float = PREWARM_REFRESH_BEFORE) -> Dict[str, Any]:
+    """
+    检查主题在计划库中的记录是否新鲜
+
+    Returns:
+        Dict[str, Any]: status 为 fresh/expiring/expired/missing，存在记录时附带生成与过期时间、来源和命中次数
+    """
+    entry = library.peek(make_topic_query(topic, kind), kind=kind, version=version)
+    if entry is None:
+        return {"status": "missing"}
+    now = time.time()
+    if entry.expires_at < now:
+        status = "expired"
+    elif entry.expires_at - now < refresh_before:
+        status = "expiring"
+    else:
+        status = "fresh"
+    return {
+        "status": status,
+        "created_at": datetime.fromtimestamp(entry.created_at).isoformat(timespec="seconds"),
+        "expires_at": datetime.fromtimestamp(entry.expires_at).isoformat(timespec="seconds"),
+        "age_hours": round((now - entry.created_at) / 3600, 1),
+        "source": entry.source,
+        "hits": entry.hits,
+    }
+
+def coverage(topics: List[Dict[str, Any]], kinds: Iterable[str], stage: str) -> Dict[str, float]:
+    """各类型记录新鲜（fresh 或 expiring）的主题占比，以及按需求量加权的占比"""
+    result = {}
+    total_demand = sum(topic["demand"] for topic in topics) or 1
+    for kind in kinds:
+        covered = [topic for topic in topics if topic["kinds"][kind][stage]["status"] in ("fresh", "expiring")]
+        result[kind] = round(len(covered) / len(topics), 3) if topics else 0.0
+        result[f"{kind}_weighted"] = round(sum(topic["demand"] for topic in covered) / total_demand, 3)
+    return result
+
+def hit_rates(library: PlanLibrary, topics: List[Dict[str, Any]], since: float) -> Dict[str, Any]:
+    """统计时间窗口内各类型的整体命中率，以及预热主题上的命中率"""
+    warmed = {(topic["technology"], topic["level"], topic["scenario"], topic["resource"]) for topic in topics}
+    totals: Dict[str, Dict[str, int]] = {}
+    for row in library.lookup_counts(since):
+        for scope in ("all", "prewarmed"):
+            if scope == "prewarmed" and (row["technology"], row["level"], row["scenario"],
+                                         row["resource"]) not in warmed:
+                continue
+            counts = totals.setdefault(f"{row['kind']}_{scope}", {"lookups": 0, "hits": 0})
+            counts["lookups"] += row["lookups"]
+            counts["hits"] += row["hits"]
+    for counts in totals.values():
+        counts["hit_rate"] = round(counts["hits"] / counts["lookups"], 3) if counts["lookups"] else 0.0
+    return totals
+
+async def prewarm(library: PlanLibrary, topics: List[Tuple[PlanRequest, int]], kinds: Iterable[str] = PREWARM_KINDS,
+                  concurrency: int = PREWARM_CONCURRENCY, refresh_before: float = PREWARM_REFRESH_BEFORE,
+                  force: bool = False, hit_rate_window: float = PREWARM_HIT_RATE_WINDOW) -> Dict[str, Any]:
+    """
+    为主题列表预先生成计划与资料汇总
+
+    Args:
+        library (PlanLibrary): 子智能体工具查询的计划库（需与 get_plan_library() 返回的是同一个）
+        topics (List[Tuple[PlanRequest, int]]): 主题及其需求量
+        kinds (Iterable[str]): 需要预热的子智能体简称
+        concurrency (int): 同时运行的子智能体数上限
+        refresh_before (float): 距过期不足该秒数的记录提前刷新
+        force (bool): 是否无视新鲜度全部重新生成
+        hit_rate_window (float): 统计命中率的时间窗口（秒）
+
+    Returns:
+        Dict[str, Any]: 预热报告
+    """
+    import multi_agents_pro
+    kinds = list(kinds)
+    semaphore = asyncio.Semaphore(concurrency)
+    report_topics = []
+    for topic, demand in topics:
+        report_topics.append({
+            "technology": topic.technology, "level": topic.level, "scenario": topic.scenario,
+            "resource": topic.resource, "demand": demand,
+            "kinds": {kind: {"before": entry_freshness(library, topic, kind, multi_agents_pro.library_version(kind),
+                                                       refresh_before)} for kind in kinds},
+        })
+    latencies, failed = [], 0
+
+    async def warm(topic: PlanRequest, record: Dict[str, Any], kind: str):
+        nonlocal failed
+        query = make_topic_query(topic, kind)
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await multi_agents_pro.arun_sub_agent(kind, query, refresh=True, source="prewarm")
+                record["action"] = "generated"
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                record.update(action="failed", error=f"{type(e).__name__}: {e}")
+                failed += 1
+            record["latency"] = round(time.perf_counter() - start, 3)
+        print(f"{'✅' if record['action'] == 'generated' else '❌'} [{kind}] {topic.technology}"
+              f"（{record['latency']:.2f}s）")
+
+    jobs = []
+    for (topic, _), report_topic in zip(topics, report_topics):
+        for kind in kinds:
+            record = report_topic["kinds"][kind]
+            if force or record["before"]["status"] != "fresh":
+                jobs.append(warm(topic, record, kind))
+            else:
+                record["action"] = "skipped"
+    print(f"🔥 预热 {len(topics)} 个主题，需要生成 {len(jobs)} 条记录，并发上限 {concurrency}")
+    start = time.perf_counter()
+    await asyncio.gather(*jobs)
+    elapsed = time.perf_counter() - start
+
+    for (topic, _), report_topic in zip(topics, report_topics):
+        for kind in kinds:
+            record = report_topic["kinds"][kind]
+            record["after"] = entry_freshness(library, topic, kind, multi_agents_pro.library_version(kind), refresh_before)
+            # 过短的结果（多为出错信息）不会入库
+            if record["action"] == "generated" and record["after"]["status"] != "fresh":
+                record["action"] = "not_stored"
+    now = time.time()
+    pruned = library.prune_lookups(now - PLAN_LIBRARY_LOOKUP_RETENTION)
+    return {
+        "generated_at": datetime.fromtimestamp(now).isoformat(timespec="seconds"),
+        "jobs": {
+            "generated": len(latencies), "failed": failed, "skipped": len(topics) * len(kinds) - len(jobs),
+            "elapsed": round(elapsed, 2),
+            "latency_avg": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        },
+        "coverage_before": coverage(report_topics, kinds, "before"),
+        "coverage_after": coverage(report_topics, kinds, "after"),
+        "hit_rates": hit_rates(library, report_topics, now - hit_rate_window),
+        "hit_rate_window_hours": round(hit_rate_window / 3600, 1),
+        "pruned_lookups": pruned,
+        "topics": report_topics,
+    }
+
+def print_report(report: Dict[str, Any], kinds: Iterable[str]):
+    jobs = report["jobs"]
+    print("\n📊 预热报告")
+    print(f"生成 {jobs['generated']} 条（失败 {jobs['failed']}，已新鲜跳过 {jobs['skipped']}），"
+          f"耗时 {jobs['elapsed']:.2f}s，平均每条 {jobs['latency_avg']:.2f}s")
+    for kind in kinds:
+        before, after = report["coverage_before"], report["coverage_after"]
+        print(f"覆盖率 [{kind}]：{before[kind]:.0%} -> {after[kind]:.0%}"
+              f"（按需求加权 {before[f'{kind}_weighted']:.0%} -> {after[f'{kind}_weighted']:.0%}）")
+    window = report["hit_rate_window_hours"]
+    for name, counts in report["hit_rates"].items():
+        print(f"命中率 [{name}]（最近 {window:g} 小时）：{counts['hits']}/{counts['lookups']} = {counts['hit_rate']:.0%}")
+    for topic in report["topics"]:
+        states = "，".join(f"{kind} {STATUS_LABELS[state['after']['status']]}"
+                          + (f"（过期于 {state['after']['expires_at']}）" if "expires_at" in state["after"] else "")
+                          for kind, state in topic["kinds"].items())
+        scenario = "".join(f"/{topic[field]}" for field in ("scenario", "resource") if topic[field])
+        print(f"  · {topic['technology']}（{topic['level']}{scenario}，需求 {topic['demand']}）：{states}")
+
+async def run_prewarm(args: argparse.Namespace) -> Dict[str, Any]:
+    """按命令行参数收集主题并执行一次预热，报告写入 JSON 文件"""
+    import plan_library
+    library = PlanLibrary(db_path=args.db)
+    # 子智能体工具与预热任务必须使用同一个计划库
+    plan_library._plan_library = library
+    topics = list(args.topics)
+    if args.topics_file:
+        with open(args.topics_file, "r", encoding="utf-8") as f:
+            topics.extend(f)
+    selected = load_topic_list(topics)
+    if args.mine or not selected:
+        since = time.time() - PREWARM_HIT_RATE_WINDOW
+        mined = mine_topics(iter_learning_goals(args.memory, args.journal, args.session_db), library, since, args.top)
+        known = {topic_key(topic) for topic, _ in selected}
+        selected.extend((topic, demand) for topic, demand in mined if topic_key(topic) not in known)
+    if not selected:
+        print("⚠️ 没有可预热的主题：请通过参数或 --topics-file 指定，或先积累对话记忆中的学习目标")
+        return {}
+    report = await prewarm(library, selected, args.kinds, args.concurrency, args.refresh_before * 3600, args.force)
+    print_report(report, args.kinds)
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📝 报告已写入 {args.report}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="为热门主题预先生成学习计划与资料汇总")
+    parser.add_argument("topics", nargs="*", help="需要预热的主题，如 Python、零基础 React、Python 用于数据分析")
+    parser.add_argument("--topics-file", help="主题列表文件，每行一个主题，# 开头的行为注释")
+    parser.add_argument("--mine", action="store_true",
+                        help="从对话记忆的学习目标和计划库未命中的查找中挖掘主题（未指定主题时默认开启）")
+    parser.add_argument("--top", type=int, default=PREWARM_TOP_TOPICS, help="挖掘的主题数上限")
+    parser.add_argument("--memory", nargs="*", default=[MEMORY_FILE], help="JSON 格式的对话记忆文件")
+    parser.add_argument("--journal", default=MEMORY_JOURNAL_PREFIX, help="日志存储的路径前缀，空字符串表示不读取")
+    parser.add_argument("--session-db", default=SESSION_DB, help="多用户会话库，空字符串表示不读取")
+    parser.add_argument("--kinds", nargs="+", choices=PREWARM_KINDS, default=list(PREWARM_KINDS), help="预热的子智能体")
+    parser.add_argument("--concurrency", type=int, default=PREWARM_CONCURRENCY, help="并发上限")
+    parser.add_argument("--refresh-before", type=float, default=PREWARM_REFRESH_BEFORE / 3600,
+                        help="距过期不足该小时数的记录提前刷新")
+    parser.add_argument("--force", action="store_true", help="无视新鲜度全部重新生成")
+    parser.add_argument("--db", default=PLAN_LIBRARY_DB, help="计划库路径")
+    parser.add_argument("--report", default=PREWARM_REPORT, help="报告输出路径（JSON）")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="每隔多少小时重复运行一次（没有 cron 时使用），0 表示只运行一次")
+    parser.add_argument("--fake", type=float, default=None, metavar="LATENCY",
+                        help="使用离线模拟模型，参数为每次模型调用的延迟（秒）")
+    args = parser.parse_args()
+
+    if args.fake is not None:
+        # 模拟模式不访问真实服务，但模块导入时会构造客户端，需要占位的密钥
+        os.environ.setdefault("DEEPSEEK_API_KEY", "fake")
+        os.environ.setdefault("TAVILY_API_KEY", "fake")
+        import multi_agents_pro
+        from fake_models import FakeLearningChatModel, install_fake_master_agents
+        # 模拟回答需达到入库的最短长度
+        install_fake_master_agents(multi_agents_pro, model=FakeLearningChatModel(latency=args.fake, answer_chars=1500))
+    while True:
+        asyncio.run(run_prewarm(args))
+        if args.interval <= 0:
+            break
+        print(f"⏰ {args.interval:g} 小时后再次预热")
+        time.sleep(args.interval * 3600)
+
+if __name__ == "__main__":
+    main()
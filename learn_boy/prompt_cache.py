@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import threading
+from typing import Any, Dict, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+from data_dir import data_path
+
+# DeepSeek 服务端前缀缓存（上下文硬盘缓存）的命中统计：
+# 每次模型调用返回的 prompt_cache_hit_tokens / prompt_cache_miss_tokens 会被记录，
+# 并追加写入 JSONL 日志，便于跨会话分析命中率
+
+PROMPT_CACHE_LOG = os.getenv("PROMPT_CACHE_LOG", data_path("prompt_cache_stats.jsonl"))  # 置空则只在内存中统计
+
+def extract_prompt_cache_usage(message: Optional[BaseMessage], llm_output: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    """
+    从模型回复中提取前缀缓存命中/未命中的 token 数
+
+    Args:
+        message (BaseMessage): 模型回复消息
+        llm_output (Dict[str, Any]): LLMResult.llm_output
+
+    Returns:
+        Optional[Dict[str, int]]: 命中与未命中的 token 数，接口没有返回缓存用量时为 None
+    """
+    token_usage = {}
+    if message is not None:
+        token_usage = message.response_metadata.get("token_usage") or {}
+    if not token_usage and llm_output:
+        token_usage = llm_output.get("token_usage") or {}
+    hit = token_usage.get("prompt_cache_hit_tokens")
+    miss = token_usage.get("prompt_cache_miss_tokens")
+    # 流式输出时原始用量字段不保留，从 usage_metadata 中的 cache_read 推算
+    usage_metadata = getattr(message, "usage_metadata", None)
+    if hit is None and usage_metadata:
+        details = usage_metadata.get("input_token_details") or {}
+        if "cache_read" in details:
+            hit = details["cache_read"]
+            miss = usage_metadata.get("input_tokens", hit) - hit
+    if hit is None:
+        return None
+    return {"prompt_cache_hit_tokens": int(hit), "prompt_cache_miss_tokens": int(miss or 0)}
+
+class PromptCacheStats(BaseCallbackHandler):
+    """挂在聊天模型上的回调，统计每次调用的前缀缓存命中情况"""
+    def __init__(self, log_path: str = PROMPT_CACHE_LOG):
+        self.log_path = log_path
+        self.calls = 0
+        self.unreported = 0  # 接口没有返回缓存用量的调用数
+        self.hit_tokens = 0
+        self.miss_tokens = 0
+        self._nodes: Dict[UUID, str] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        self._nodes[run_id] = (metadata or {}).get("langgraph_node", "")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        node = self._nodes.pop(run_id, "")
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                # 本地回复缓存命中的结果没有真正请求接口，不计入统计
+                if message is not None and message.response_metadata.get("from_llm_cache"):
+                    continue
+                usage = extract_prompt_cache_usage(message, response.llm_output)
+                self._record(node, usage)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._nodes.pop(run_id, None)
+
+    def _record(self, node: str, usage: Optional[Dict[str, int]]):
+        with self._lock:
+            self.calls += 1
+            if usage is None:
+                self.unreported += 1
+                return
+            self.hit_tokens += usage["prompt_cache_hit_tokens"]
+            self.miss_tokens += usage["prompt_cache_miss_tokens"]
+            if self.log_path:
+                record = {"time": time.time(), "pid": os.getpid(), "node": node, **usage}
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+
+    def stats(self) -> Dict[str, Any]:
+        """返回前缀缓存命中统计（按 token 计算命中率）"""
+        prompt_tokens = self.hit_tokens + self.miss_tokens
+        return {
+            "calls": self.calls,
+            "unreported": self.unreported,
+            "hit_tokens": self.hit_tokens,
+            "miss_tokens": self.miss_tokens,
+            "hit_rate": self.hit_tokens / prompt_tokens if prompt_tokens else 0.0,
+        }
+
+def summarize_log(log_path: str = PROMPT_CACHE_LOG) -> Dict[str, Any]:
+    """汇总日志中所有进程/会话的前缀缓存命中率"""
+    hit = miss = calls = 0
+    if os.path.exists(log_path):
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                calls += 1
+                hit += record["prompt_cache_hit_tokens"]
+                miss += record["prompt_cache_miss_tokens"]
+    return {"calls": calls, "hit_tokens": hit, "miss_tokens": miss,
+            "hit_rate": hit / (hit + miss) if hit + miss else 0.0}
+
+_default_stats: Optional[PromptCacheStats] = None
+_default_stats_lock = threading.Lock()
+
+def get_prompt_cache_stats() -> PromptCacheStats:
+    """获取进程内共享的前缀缓存统计回调"""
+    global _default_stats
+    with _default_stats_lock:
+        if _default_stats is None:
+            _default_stats = PromptCacheStats()
+        return _default_stats
+
+if __name__ == "__main__":
+    stats = summarize_log()
+    print(f"📊 前缀缓存：{stats['calls']} 次调用，命中 {stats['hit_tokens']} tokens，"
+          f"未命中 {stats['miss_tokens']} tokens，命中率 {stats['hit_rate']:.0%}")
@@ -0,0 +1,351 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+import httpx
+from metrics import record_queue_time
+
+# 进程级限流：同一服务商的所有调用（无论来自哪个线程/事件循环）共用一个限流器
+# - 令牌桶限制每秒请求数与每分钟 token 数
+# - 并发上限按 AIMD 自适应：成功时缓慢增加，遇到 429 时减半，并让所有调用暂停到 Retry-After 之后
+# - 429 时按指数退避 + 随机抖动重试，避免大量请求同时重试
+
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5"))
+RATE_LIMIT_BASE_BACKOFF = float(os.getenv("RATE_LIMIT_BASE_BACKOFF", "0.5"))  # 首次退避上限（秒）
+RATE_LIMIT_MAX_BACKOFF = float(os.getenv("RATE_LIMIT_MAX_BACKOFF", "30"))
+
+# 各服务商的默认配额，可通过环境变量覆盖；0 表示不限制
+# burst 为请求令牌桶的容量（允许的瞬时突发请求数）。桶启动时是空的，
+# 按 burst=1 时请求被均匀地摊开，避免启动瞬间一次性放出整秒的配额、撞上服务端的滑动窗口
+PROVIDER_LIMITS = {
+    "deepseek": {
+        "requests_per_second": float(os.getenv("DEEPSEEK_RPS", "5")),
+        "burst": float(os.getenv("DEEPSEEK_BURST", "1")),
+        "tokens_per_minute": float(os.getenv("DEEPSEEK_TPM", "1000000")),
+        "max_concurrency": int(os.getenv("DEEPSEEK_MAX_CONCURRENCY", "32")),
+    },
+    "tavily": {
+        "requests_per_second": float(os.getenv("TAVILY_RPS", "1.5")),
+        "burst": float(os.getenv("TAVILY_BURST", "1")),
+        "tokens_per_minute": 0,
+        "max_concurrency": int(os.getenv("TAVILY_MAX_CONCURRENCY", "8")),
+    },
+}
+
+class RateLimitedError(Exception):
+    """重试次数用完后仍被限流"""
+
+class TokenBucket:
+    """
+    令牌桶。reserve 在锁内预订令牌并返回需要等待的时间，
+    允许令牌为负（欠账），调用方按返回的时间等待即可，同步和异步调用都能使用
+    """
+    def __init__(self, rate: float, capacity: float, initial: Optional[float] = None):
+        self.rate = rate          # 每秒补充的令牌数，0 表示不限制
+        self.capacity = capacity
+        self._tokens = capacity if initial is None else initial
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # 单次请求超过桶容量时按容量计，避免永远等不到
+            self._tokens -= min(amount, self.capacity)
+            return max(-self._tokens / self.rate, 0.0)
+
+class AdaptiveConcurrency:
+    """AIMD 并发上限：每次成功增加 1/limit（约每轮加 1），每次限流减半"""
+    def __init__(self, initial: int, max_limit: int, min_limit: int = 1, decrease_cooldown: float = 1.0):
+        self.limit = float(initial)
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.decrease_cooldown = decrease_cooldown  # 同一批并发请求的多个 429 只减半一次
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def try_acquire(self) -> bool:
+        with self._condition:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    async def aacquire(self):
+        # 名额可能被其他线程释放，异步侧以短间隔轮询，不阻塞事件循环
+        delay = 0.005
+        while not self.try_acquire():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def on_success(self):
+        with self._condition:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._condition.notify()
+
+    def on_throttled(self):
+        with self._condition:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.decrease_cooldown:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self._last_decrease = now
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """指数退避 + 全随机抖动；服务端给出 Retry-After 时不早于该时间"""
+    delay = random.uniform(0, min(RATE_LIMIT_MAX_BACKOFF, RATE_LIMIT_BASE_BACKOFF * (2 ** attempt)))
+    return max(delay, retry_after or 0.0)
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """判断异常是否为限流（HTTP 429）"""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "too many requests" in message
+
+class ProviderLimiter:
+    """一个服务商的进程级限流器"""
+    def __init__(self, name: str, requests_per_second: float = 0, tokens_per_minute: float = 0,
+                 max_concurrency: int = 16, max_retries: int = RATE_LIMIT_MAX_RETRIES, burst: float = 1):
+        self.name = name
+        # 请求桶从空桶开始，之后最多攒 burst 个令牌
+        self.requests = TokenBucket(requests_per_second, capacity=max(burst, 1), initial=0)
+        self.tokens = TokenBucket(tokens_per_minute / 60, capacity=tokens_per_minute / 6)  # 允许 10 秒的突发
+        self.concurrency = AdaptiveConcurrency(initial=max(max_concurrency // 4, 1), max_limit=max_concurrency)
+        self.max_retries = max_retries
+        self.calls = 0
+        self.throttled = 0
+        self.wait_time = 0.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _admission_delay(self, estimated_tokens: float) -> float:
+        with self._lock:
+            pause = max(self._paused_until - time.monotonic(), 0.0)
+        delay = max(pause, self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        with self._lock:
+            self.calls += 1
+            self.wait_time += delay
+        return delay
+
+    def _throttled(self, attempt: int, retry_after: Optional[float]) -> float:
+        """记录一次限流，所有调用暂停到退避结束，返回本次需要等待的时间"""
+        self.concurrency.on_throttled()
+        delay = backoff_delay(attempt, retry_after)
+        with self._lock:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    # --- 调用入口 ---
+    def acquire(self, estimated_tokens: float = 0):
+        """占用一个并发名额并等待限流放行（用完后调用 release）"""
+        start = time.perf_counter()
+        # 先占名额再检查暂停与令牌，排队等名额的请求也会遵守限流后的暂停
+        self.concurrency.acquire()
+        delay = self._admission_delay(estimated_tokens)
+        if delay:
+            time.sleep(delay)
+        record_queue_time(f"rate_limit:{self.name}", time.perf_counter() - start)
+
+    async def aacquire(self, estimated_tokens: float = 0):
+        start = time.perf_counter()
+        await self.concurrency.aacquire()
+        delay = self._admission_delay(estimated_tokens)
+        if delay:
+            await asyncio.sleep(delay)
+        record_queue_time(f"rate_limit:{self.name}", time.perf_counter() - start)
+
+    def release(self, throttled: bool = False):
+        self.concurrency.release()
+        if not throttled:
+            self.concurrency.on_success()
+
+    def call(self, func: Callable[..., Any], *args, estimated_tokens: float = 0,
+             is_throttled_result: Callable[[Any], bool] = None, **kwargs) -> Any:
+        """
+        经过限流调用 func，遇到 429（异常或 is_throttled_result 判定的返回值）时退避重试
+
+        Returns:
+            Any: func 的返回值
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(estimated_tokens)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.release(throttled=is_rate_limit_error(e))
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                time.sleep(self._throttled(attempt, None))
+                continue
+            throttled = bool(is_throttled_result and is_throttled_result(result))
+            self.release(throttled=throttled)
+            if not throttled or attempt == self.max_retries:
+                return result
+            time.sleep(self._throttled(attempt, None))
+        raise RateLimitedError(f"{self.name} 请求被限流")
+
+    async def acall(self, func: Callable[..., Awaitable[Any]], *args, estimated_tokens: float = 0,
+                    is_throttled_result: Callable[[Any], bool] = None, **kwargs) -> Any:
+        """call 的异步版本"""
+        for attempt in range(self.max_retries + 1):
+            await self.aacquire(estimated_tokens)
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                self.release(throttled=is_rate_limit_error(e))
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._throttled(attempt, None))
+                continue
+            throttled = bool(is_throttled_result and is_throttled_result(result))
+            self.release(throttled=throttled)
+            if not throttled or attempt == self.max_retries:
+                return result
+            await asyncio.sleep(self._throttled(attempt, None))
+        raise RateLimitedError(f"{self.name} 请求被限流")
+
+    def stats(self) -> Dict[str, Any]:
+        """返回限流统计"""
+        return {
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "wait_time": round(self.wait_time, 2),
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight,
+        }
+
+# --- httpx 传输层：让基于 httpx 的模型客户端（OpenAI 兼容接口）的每个请求都经过限流 ---
+
+def _estimate_request_tokens(request: httpx.Request) -> float:
+    """按请求体估算 token 数（与 context_budget.estimate_tokens 的换算一致）"""
+    from context_budget import estimate_tokens
+    try:
+        return estimate_tokens(request.content.decode("utf-8", errors="ignore"))
+    except httpx.RequestNotRead:
+        return 0
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """流式响应读完/关闭时才释放并发名额"""
+    def __init__(self, stream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """包装 httpx 传输层：请求前限流，429 时退避重试"""
+    def __init__(self, limiter: ProviderLimiter, transport: httpx.BaseTransport):
+        self.limiter = limiter
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        estimated_tokens = _estimate_request_tokens(request)
+        for attempt in range(self.limiter.max_retries + 1):
+            self.limiter.acquire(estimated_tokens)
+            try:
+                response = self.transport.handle_request(request)
+            except Exception:
+                self.limiter.release(throttled=False)
+                raise
+            if response.status_code != 429 or attempt == self.limiter.max_retries:
+                return httpx.Response(
+                    response.status_code, headers=response.headers, extensions=response.extensions,
+                    stream=_ReleasingStream(response.stream, lambda: self.limiter.release(response.status_code == 429)),
+                )
+            response.close()
+            self.limiter.release(throttled=True)
+            time.sleep(self.limiter._throttled(attempt, parse_retry_after(response.headers.get("retry-after"))))
+
+    def close(self):
+        self.transport.close()
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """RateLimitedTransport 的异步版本"""
+    def __init__(self, limiter: ProviderLimiter, transport: httpx.AsyncBaseTransport):
+        self.limiter = limiter
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        estimated_tokens = _estimate_request_tokens(request)
+        for attempt in range(self.limiter.max_retries + 1):
+            await self.limiter.aacquire(estimated_tokens)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except Exception:
+                self.limiter.release(throttled=False)
+                raise
+            if response.status_code != 429 or attempt == self.limiter.max_retries:
+                return httpx.Response(
+                    response.status_code, headers=response.headers, extensions=response.extensions,
+                    stream=_AsyncReleasingStream(response.stream, lambda: self.limiter.release(response.status_code == 429)),
+                )
+            await response.aclose()
+            self.limiter.release(throttled=True)
+            await asyncio.sleep(self.limiter._throttled(attempt, parse_retry_after(response.headers.get("retry-after"))))
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    """获取服务商的进程级限流器（deepseek / tavily）"""
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = ProviderLimiter(provider, **PROVIDER_LIMITS.get(provider, {}))
+        return _limiters[provider]
@@ -0,0 +1,159 @@
+import os
+import json
+import threading
+from typing import Any, Dict, Optional
+from pydantic import Field, PrivateAttr
+from langchain_tavily import TavilySearch
+from lru_store import SQLiteLRUStore
+from data_dir import data_path
+from rate_limiter import get_limiter
+# 时效性判断与查询规范化和搜索闸门共用，时效性查询不走缓存
+from search_gate import TIME_SENSITIVE_KEYWORDS, normalize_query, is_time_sensitive
+from search_compress import SEARCH_COMPRESSION_ENABLED, SEARCH_RESULT_TOKEN_BUDGET, compress_search_result
+
+# 搜索结果缓存的默认配置，可通过环境变量覆盖
+SEARCH_CACHE_DB = os.getenv("SEARCH_CACHE_DB", data_path("search_cache.sqlite3"))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", str(24 * 3600)))       # 缓存有效期（秒）
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "5000"))  # 最多缓存条数，超出按 LRU 淘汰
+
+class SearchCache(SQLiteLRUStore):
+    """基于 SQLite 的搜索结果缓存，支持 TTL 过期与 LRU 淘汰，可被多个线程共享"""
+    def __init__(self, db_path: str = SEARCH_CACHE_DB, ttl_seconds: int = SEARCH_CACHE_TTL,
+                 max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        super().__init__(db_path, "search_cache", ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self.bypassed = 0
+
+    @classmethod
+    def make_key(cls, query: str, params: Dict[str, Any]) -> str:
+        """由规范化后的查询与搜索参数生成缓存键"""
+        payload = json.dumps({"query": normalize_query(query), "params": params},
+                             ensure_ascii=False, sort_keys=True, default=str)
+        return cls.hash_key(payload)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的搜索结果，未命中或已过期时返回 None"""
+        value = super().get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, query: str, value: Dict[str, Any]):
+        """写入搜索结果，超出容量时淘汰最久未访问的条目"""
+        super().set(key, json.dumps(value, ensure_ascii=False, default=str), label=query)
+
+    def record_bypass(self):
+        """记录一次绕过缓存的实时搜索（多个线程可能同时调用，与命中统计共用同一把锁）"""
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计"""
+        stats = super().stats()
+        with self._lock:
+            stats["bypassed"] = self.bypassed
+        return stats
+
+_default_cache: Optional[SearchCache] = None
+_default_cache_lock = threading.Lock()
+
+def is_throttled_search_result(result: Dict[str, Any]) -> bool:
+    """TavilySearch 会把异常转成 {"error": ...} 返回，据此识别被限流的搜索"""
+    return isinstance(result, dict) and "error" in result and "429" in str(result["error"])
+
+def get_search_cache() -> SearchCache:
+    """获取进程内共享的搜索缓存实例"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SearchCache()
+        return _default_cache
+
+class CachedTavilySearch(TavilySearch):
+    """
+    带缓存的 TavilySearch，参数与 TavilySearch 完全相同，可直接替换。
+    相同（规范化后）查询与搜索参数的结果在有效期内直接从缓存返回，时效性查询始终实时搜索。
+    实际发出的搜索请求经过 Tavily 的进程级限流器，被限流时退避重试。
+    返回给智能体之前对结果做抽取式压缩（见 search_compress），缓存中保存的是未压缩的原始结果。
+    """
+    cache: Optional[SearchCache] = Field(default=None, exclude=True)
+    compress: bool = Field(default=SEARCH_COMPRESSION_ENABLED, exclude=True)
+    result_token_budget: int = Field(default=SEARCH_RESULT_TOKEN_BUDGET, exclude=True)
+    # 压缩统计：累计的压缩前/后 token 数，所有调用共享
+    compression_stats: Dict[str, int] = Field(
+        default_factory=lambda: {"searches": 0, "original_tokens": 0, "compressed_tokens": 0}, exclude=True)
+    # 同一个工具实例被多个子智能体线程共享，累加压缩统计时需要加锁
+    _stats_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def _get_cache(self) -> SearchCache:
+        return self.cache or get_search_cache()
+
+    def _cache_params(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """参与缓存键计算的参数：实例化参数 + 本次调用参数"""
+        params = {
+            "max_results": self.max_results,
+            "topic": self.topic,
+            "search_depth": self.search_depth,
+            "time_range": self.time_range,
+            "include_domains": self.include_domains,
+            "exclude_domains": self.exclude_domains,
+            "include_answer": self.include_answer,
+            "include_raw_content": self.include_raw_content,
+            "include_images": self.include_images,
+        }
+        params.update({k: v for k, v in kwargs.items() if v is not None})
+        return params
+
+    def _should_bypass(self, query: str, kwargs: Dict[str, Any]) -> bool:
+        return is_time_sensitive(query) or (kwargs.get("time_range") or self.time_range) == "day"
+
+    def _search(self, query: str, run_manager=None, **kwargs: Any) -> Dict[str, Any]:
+        return get_limiter("tavily").call(super()._run, query, run_manager=run_manager,
+                                          is_throttled_result=is_throttled_search_result, **kwargs)
+
+    async def _asearch(self, query: str, run_manager=None, **kwargs: Any) -> Dict[str, Any]:
+        return await get_limiter("tavily").acall(super()._arun, query, run_manager=run_manager,
+                                                 is_throttled_result=is_throttled_search_result, **kwargs)
+
+    def _postprocess(self, query: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """压缩搜索结果，出错的结果原样返回"""
+        if not self.compress or "error" in result:
+            return result
+        compressed, stats = compress_search_result(query, result, self.result_token_budget)
+        with self._stats_lock:
+            self.compression_stats["searches"] += 1
+            self.compression_stats["original_tokens"] += stats["original_tokens"]
+            self.compression_stats["compressed_tokens"] += stats["compressed_tokens"]
+        return compressed
+
+    def _run(self, query: str, run_manager=None, **kwargs: Any) -> Dict[str, Any]:
+        return self._postprocess(query, self._cached_run(query, run_manager=run_manager, **kwargs))
+
+    async def _arun(self, query: str, run_manager=None, **kwargs: Any) -> Dict[str, Any]:
+        return self._postprocess(query, await self._cached_arun(query, run_manager=run_manager, **kwargs))
+
+    def _cached_run(self, query: str, run_manager=None, **kwargs: Any) -> Dict[str, Any]:
+        cache = self._get_cache()
+        if self._should_bypass(query, kwargs):
+            cache.record_bypass()
+            return self._search(query, run_manager=run_manager, **kwargs)
+        key = cache.make_key(query, self._cache_params(kwargs))
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        result = self._search(query, run_manager=run_manager, **kwargs)
+        # 出错的结果不缓存
+        if "error" not in result:
+            cache.set(key, query, result)
+        return result
+
+    async def _cached_arun(self, query: str, run_manager=None, **kwargs: Any) -> Dict[str, Any]:
+        cache = self._get_cache()
+        if self._should_bypass(query, kwargs):
+            cache.record_bypass()
+            return await self._asearch(query, run_manager=run_manager, **kwargs)
+        key = cache.make_key(query, self._cache_params(kwargs))
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        result = await self._asearch(query, run_manager=run_manager, **kwargs)
+        if "error" not in result:
+            cache.set(key, query, result)
+        return result
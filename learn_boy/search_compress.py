@@ -0,0 +1,128 @@
+import os
+import re
+import math
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+from context_budget import count_tokens
+
+# 搜索结果的抽取式压缩：在 Tavily 结果进入子智能体上下文之前，把各条结果切分为段落，
+# 用 BM25 按与查询的相关度排序，去掉不同结果之间近似重复的段落，只保留预算内得分最高的段落。
+# 工具消息在 ReAct 循环的后续每一步都会被重新发送，压缩后每一步的输入都随之变小。
+# 不依赖分词库：中文按相邻两字切分（bigram），英文与数字按单词切分
+
+SEARCH_COMPRESSION_ENABLED = os.getenv("SEARCH_COMPRESSION_ENABLED", "1") == "1"
+SEARCH_RESULT_TOKEN_BUDGET = int(os.getenv("SEARCH_RESULT_TOKEN_BUDGET", "600"))  # 压缩后全部段落的 token 预算
+PASSAGE_MIN_CHARS = 20           # 以句子为段落，不足该长度的短句与后面的句子合并
+PASSAGE_MAX_CHARS = 200          # 超长的句子按该长度切开
+DUPLICATE_THRESHOLD = 0.6        # 与已选段落的 bigram 重合度（Jaccard）达到该值视为重复
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+SENTENCE_PATTERN = re.compile(r"[^。！？；!?;\n]+[。！？；!?;]?")
+WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9.+#_-]*")
+CJK_PATTERN = re.compile(r"[一-鿿]+")
+
+def tokenize(text: str) -> List[str]:
+    """切分为检索用的词项：英文单词（小写）与中文相邻两字"""
+    text = text.lower()
+    terms = WORD_PATTERN.findall(text)
+    for run in CJK_PATTERN.findall(text):
+        terms.extend(run[i:i + 2] for i in range(max(len(run) - 1, 1)))
+    return terms
+
+def split_passages(text: str, min_chars: int = PASSAGE_MIN_CHARS, max_chars: int = PASSAGE_MAX_CHARS) -> List[str]:
+    """按句切分为段落：短句与后面的句子合并，超长的句子按 max_chars 切开"""
+    passages, current = [], ""
+    for sentence in (s.strip() for s in SENTENCE_PATTERN.findall(text or "")):
+        current += sentence
+        if len(current) >= min_chars:
+            passages.extend(current[i:i + max_chars] for i in range(0, len(current), max_chars))
+            current = ""
+    if current:
+        passages.append(current)
+    return passages
+
+def bm25_scores(query_terms: List[str], documents: List[List[str]]) -> List[float]:
+    """计算每个文档（段落）对查询的 BM25 得分"""
+    if not documents:
+        return []
+    avg_length = sum(len(doc) for doc in documents) / len(documents) or 1.0
+    document_frequency = Counter(term for doc in documents for term in set(doc))
+    scores = []
+    for doc in documents:
+        frequencies = Counter(doc)
+        score = 0.0
+        for term in set(query_terms):
+            tf = frequencies.get(term, 0)
+            if not tf:
+                continue
+            df = document_frequency[term]
+            idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * len(doc) / avg_length))
+        scores.append(score)
+    return scores
+
+def _shingles(text: str) -> set:
+    compact = re.sub(r"\s+", "", text.lower())
+    return {compact[i:i + 2] for i in range(max(len(compact) - 1, 1))}
+
+def _is_duplicate(shingles: set, selected: List[set]) -> bool:
+    return any(len(shingles & other) / (len(shingles | other) or 1) >= DUPLICATE_THRESHOLD for other in selected)
+
+def compress_search_result(query: str, result: Dict[str, Any],
+                           token_budget: int = SEARCH_RESULT_TOKEN_BUDGET) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """
+    压缩 Tavily 搜索结果，保持与原结果相同的格式
+
+    各条结果的标题与链接全部保留（资料搜索智能体需要真实链接），content 只保留被选中的段落，
+    按原文顺序拼接；raw_content 参与段落切分后不再返回。
+
+    Args:
+        query (str): 搜索查询
+        result (Dict[str, Any]): TavilySearch 返回的结果
+        token_budget (int): 全部保留段落的 token 预算
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, int]]: 压缩后的结果，以及压缩前后的 token 数与段落数
+            （统计信息不放进结果中，避免占用模型上下文）
+    """
+    items = result.get("results") or []
+    if not items:
+        return result, {"original_tokens": 0, "compressed_tokens": 0, "passages": 0, "kept_passages": 0}
+    # (结果序号, 段落序号, 段落)
+    passages: List[Tuple[int, int, str]] = []
+    for index, item in enumerate(items):
+        text = "\n".join(filter(None, [item.get("content"), item.get("raw_content")]))
+        passages.extend((index, position, passage) for position, passage in enumerate(split_passages(text)))
+    original_tokens = sum(count_tokens(str(item.get("content") or "")) + count_tokens(str(item.get("raw_content") or ""))
+                          for item in items)
+
+    scores = bm25_scores(tokenize(query), [tokenize(passage) for _, _, passage in passages])
+    ranked = sorted(range(len(passages)), key=lambda i: scores[i], reverse=True)
+    # 与查询毫无关联的段落（多为导航、版权声明等）不保留，除非所有段落都不相关
+    ranked = [i for i in ranked if scores[i] > 0] or ranked
+    chosen, chosen_shingles, used = [], [], 0
+    for i in ranked:
+        passage = passages[i][2]
+        tokens = count_tokens(passage)
+        if used + tokens > token_budget:
+            continue
+        shingles = _shingles(passage)
+        if _is_duplicate(shingles, chosen_shingles):
+            continue
+        chosen.append(i)
+        chosen_shingles.append(shingles)
+        used += tokens
+
+    kept: Dict[int, List[Tuple[int, str]]] = {}
+    for i in chosen:
+        index, position, passage = passages[i]
+        kept.setdefault(index, []).append((position, passage))
+    compressed_items = []
+    for index, item in enumerate(items):
+        compressed = {key: value for key, value in item.items() if key != "raw_content"}
+        compressed["content"] = " … ".join(passage for _, passage in sorted(kept.get(index, [])))
+        compressed_items.append(compressed)
+    stats = {"original_tokens": original_tokens, "compressed_tokens": used,
+             "passages": len(passages), "kept_passages": len(chosen)}
+    return {**result, "results": compressed_items}, stats
@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, List
+from lru_store import SQLiteLRUStore
+from data_dir import data_path
+
+# 联网搜索闸门：在创建子智能体的 ReAct 循环之前，按请求决定是否向它提供搜索工具。
+# 不提供工具时模型直接作答，省去一次"决定搜索"的模型往返、搜索本身的耗时和不断变长的工具消息。
+# 判断顺序：时效性关键词 -> 缓存的历史决定 -> 主题稳定/易变 -> 各子智能体的默认策略
+
+SEARCH_GATE_ENABLED = os.getenv("SEARCH_GATE_ENABLED", "1") == "1"
+SEARCH_GATE_DB = os.getenv("SEARCH_GATE_DB", data_path("search_gate.sqlite3"))
+SEARCH_GATE_TTL = int(os.getenv("SEARCH_GATE_TTL", str(7 * 24 * 3600)))      # 历史决定的有效期（秒）
+SEARCH_GATE_MAX_ENTRIES = int(os.getenv("SEARCH_GATE_MAX_ENTRIES", "5000"))  # 最多缓存条数，超出按 LRU 淘汰
+
+# 时效性关键词（与 learn_agent.needs_internet_search 中的联网关键词一致），命中时必须实时搜索
+TIME_SENSITIVE_KEYWORDS = [
+    "最新", "当前", "目前", "现在", "今天", "实时", "最近",
+    "流行度", "现状"
+]
+# 其他表示需要新信息的说法：年份、版本、发布、排名、价格、就业行情等，
+# 以及具体的版本号（如 "Python 3.13"、"v18"）和新特性类的提问
+FRESHNESS_PATTERN = re.compile(
+    r"20\d{2}\s*年?|今年|新版|版本|发布|更新|排名|排行|趋势|价格|收费|招聘|薪资|就业|政策|考试时间|报名|"
+    r"新特性|新功能|新语法|新增|[a-z]\s*\d+\.\d+|(?<![a-z])v\d+",
+    re.IGNORECASE,
+)
+# 只针对用户给出的内容作答（learn_agent 中的本地关键词），无需联网
+LOCAL_ONLY_KEYWORDS = ["上下文", "以下内容", "这段代码", "这段文字"]
+
+# 英文技术名只匹配完整的单词：中文与字母相邻时 \b 不成立，因此用前后不是字母来界定，
+# 避免 java 匹配 "JavaScript"、git 匹配 "GitHub"、rag 匹配 "storage"
+def _words(*names: str) -> str:
+    return "|".join(rf"(?<![a-z]){name}(?![a-z])" for name in names)
+
+# 易变主题：知识更新快，模型的训练数据容易过时，需要搜索
+VOLATILE_TOPIC_PATTERN = re.compile(
+    r"大模型|" + _words("llm", "gpt", "chatgpt", "deepseek", "claude", "gemini", "aigc", "agent", "langchain",
+                      "langgraph", "llamaindex", "rag", "prompt", "harmonyos", r"next\.?js", "nuxt") + "|"
+    r"智能体|多模态|扩散模型|stable diffusion|提示词工程|向量数据库|云原生|鸿蒙|前端框架|ai\s*工具|框架对比",
+    re.IGNORECASE,
+)
+# 稳定主题：成熟的基础知识，模型凭已有知识即可讲清楚
+STABLE_TOPIC_PATTERN = re.compile(
+    r"数学|高数|微积分|线性代数|概率|统计学|离散数学|数据结构|算法|排序|二叉树|链表|动态规划|递归|"
+    r"操作系统|计算机网络|编译原理|计算机组成|数据库原理|进程|线程|"
+    r"梯度下降|反向传播|神经网络|卷积|激活函数|注意力机制|机器学习|深度学习|"
+    r"c语言|c\+\+|面向对象|设计模式|正则表达式|物理|化学|语法|英语|单词|写作|历史|"
+    + _words("tcp", "http", "sql", "transformer", "python", "java", "git", "linux"),
+    re.IGNORECASE,
+)
+
+# 始终提供搜索工具的子智能体：资料搜索智能体给出的链接必须真实存在，不能凭记忆编造
+ALWAYS_SEARCH_AGENTS = {"data"}
+# 主题既不算稳定也不算易变时的默认策略：学习计划需要推荐资源，保守起见仍然搜索；解释类请求直接作答
+DEFAULT_NEEDS_SEARCH = {"plan": True, "data": True, "explain": False}
+
+def normalize_query(query: str) -> str:
+    """规范化查询：全角转半角、统一小写、合并空白，使写法略有差异的查询命中同一缓存"""
+    query = unicodedata.normalize("NFKC", query).lower()
+    return " ".join(query.split()).strip(" ?？。.!！")
+
+def is_time_sensitive(query: str) -> bool:
+    """判断查询是否具有时效性，时效性查询需要实时搜索"""
+    return any(keyword in query for keyword in TIME_SENSITIVE_KEYWORDS)
+
+@dataclass
+class SearchDecision:
+    """一次闸门判断的结果：是否提供搜索工具，以及做出判断的依据"""
+    needed: bool
+    reason: str   # disabled/always/freshness/local/cached/volatile/stable/default
+
+class SearchGate:
+    """
+    按请求判断子智能体是否需要联网搜索。
+
+    提供了搜索工具的子智能体运行结束后，通过 record_outcome 记录模型是否真的调用了搜索，
+    这一观察作为该请求的历史决定缓存下来（SQLite，带 TTL/LRU），之后相同的请求直接沿用，
+    让关键词规则拿不准的请求逐渐由模型自己的选择来决定。
+    """
+    def __init__(self, db_path: str = SEARCH_GATE_DB, ttl_seconds: int = SEARCH_GATE_TTL,
+                 max_entries: int = SEARCH_GATE_MAX_ENTRIES):
+        self.store = SQLiteLRUStore(db_path, "search_gate", ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(agent: str, query: str) -> str:
+        return SQLiteLRUStore.hash_key(json.dumps([agent, normalize_query(query)], ensure_ascii=False))
+
+    def _count(self, decision: SearchDecision) -> SearchDecision:
+        with self._lock:
+            key = f"{'search' if decision.needed else 'skip'}:{decision.reason}"
+            self.counts[key] = self.counts.get(key, 0) + 1
+        return decision
+
+    def decide(self, agent: str, query: str) -> SearchDecision:
+        """
+        判断本次请求是否向子智能体提供搜索工具
+
+        Args:
+            agent (str): 子智能体简称（plan/data/explain）
+            query (str): 用户的学习需求
+
+        Returns:
+            SearchDecision: 判断结果与依据
+        """
+        if not SEARCH_GATE_ENABLED:
+            return self._count(SearchDecision(True, "disabled"))
+        if agent in ALWAYS_SEARCH_AGENTS:
+            return self._count(SearchDecision(True, "always"))
+        if any(keyword in query for keyword in LOCAL_ONLY_KEYWORDS):
+            return self._count(SearchDecision(False, "local"))
+        if is_time_sensitive(query) or FRESHNESS_PATTERN.search(query):
+            return self._count(SearchDecision(True, "freshness"))
+        cached = self.store.get(self._key(agent, query))
+        if cached is not None:
+            return self._count(SearchDecision(json.loads(cached), "cached"))
+        # 易变主题优先于稳定主题：如"用 Python 开发大模型智能体"仍需要搜索
+        if VOLATILE_TOPIC_PATTERN.search(query):
+            return self._count(SearchDecision(True, "volatile"))
+        if STABLE_TOPIC_PATTERN.search(query):
+            return self._count(SearchDecision(False, "stable"))
+        return self._count(SearchDecision(DEFAULT_NEEDS_SEARCH.get(agent, True), "default"))
+
+    def record_outcome(self, agent: str, query: str, searched: bool):
+        """记录提供了搜索工具时模型是否真的搜索了，作为该请求之后的决定"""
+        if agent in ALWAYS_SEARCH_AGENTS or is_time_sensitive(query) or FRESHNESS_PATTERN.search(query):
+            return
+        self.store.set(self._key(agent, query), json.dumps(searched), label=f"{agent}:{query[:50]}")
+
+    def stats(self) -> Dict[str, Any]:
+        searched = sum(n for key, n in self.counts.items() if key.startswith("search:"))
+        skipped = sum(n for key, n in self.counts.items() if key.startswith("skip:"))
+        return {"searched": searched, "skipped": skipped, "by_reason": dict(self.counts),
+                "cached_decisions": len(self.store)}
+
+def searched_in(messages: List[Any]) -> bool:
+    """智能体的消息列表中是否出现了工具调用结果（即模型调用了搜索）"""
+    return any(getattr(message, "type", None) == "tool" for message in messages)
+
+_search_gate = None
+_search_gate_lock = threading.Lock()
+
+def get_search_gate() -> SearchGate:
+    """获取进程内共享的搜索闸门"""
+    global _search_gate
+    with _search_gate_lock:
+        if _search_gate is None:
+            _search_gate = SearchGate()
+        return _search_gate
+
+def decide_search(agent: str, query: str) -> SearchDecision:
+    """使用共享闸门判断本次请求是否需要联网搜索"""
+    return get_search_gate().decide(agent, query)
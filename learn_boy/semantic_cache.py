@@ -0,0 +1,165 @@
+import os
+import re
+import time
+import uuid
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+from data_dir import data_path
+from search_gate import is_time_sensitive
+
+# 语义缓存的默认配置，可通过环境变量覆盖。需要可用的 embedding 服务，默认关闭
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1"
+SEMANTIC_CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR", data_path("semantic_cache_db"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8"))   # 相似度阈值（0~1），换用 embedding 模型后用 bench_semantic_cache.py --sweep 重新确定
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", str(3 * 24 * 3600)))    # 缓存有效期（秒）
+# embedding 服务配置，与 langchain_rag.ipynb 中的 OpenAIEmbeddings 用法一致
+EMBEDDING_BASE_URL = os.getenv("EMBEDDING_BASE_URL")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+# 依赖上文的追问（如"那第二阶段呢？"），脱离对话历史后答案不再成立，不参与语义缓存
+CONTEXT_DEPENDENT_KEYWORDS = [
+    "这个", "那个", "上面", "刚才", "之前", "继续", "接着", "第二", "第三", "下一", "再详细"
+]
+# 过短的输入（如"好的"、"谢谢"）无需缓存
+MIN_CACHEABLE_QUERY_LENGTH = 4
+# 失败提示（主控或子智能体出错时返回的文本）不能作为答案缓存，否则同类问题会一直命中错误
+FAILED_ANSWER_MARKERS = ["处理请求时出现错误", "调用失败"]
+# 直通模式下子智能体结果的摘要带有句柄（见 multi_agents_pro.make_sub_agent_digest），
+# 只有摘要没有正文的回答在下次命中时句柄早已失效
+RESULT_HANDLE_PATTERN = re.compile(r"句柄 out_[0-9a-f]{12}")
+
+def is_cacheable_query(query: str) -> bool:
+    """判断查询能否使用语义缓存：不能有时效性要求，也不能依赖上文"""
+    if len(query.strip()) < MIN_CACHEABLE_QUERY_LENGTH:
+        return False
+    if is_time_sensitive(query):
+        return False
+    return not any(keyword in query for keyword in CONTEXT_DEPENDENT_KEYWORDS)
+
+def is_cacheable_answer(answer: str) -> bool:
+    """判断回答能否写入语义缓存：不能为空，不能是失败提示，也不能只有直通结果的摘要"""
+    if not answer or not answer.strip():
+        return False
+    if any(marker in answer for marker in FAILED_ANSWER_MARKERS):
+        return False
+    return not RESULT_HANDLE_PATTERN.search(answer)
+
+class SemanticCache:
+    """
+    主控智能体前的语义缓存。
+
+    查询向量化后存入 Chroma；新查询在同一缓存版本下找到相似度超过阈值的近邻时，直接返回其答案。
+    只缓存不依赖上文的查询，学习档案中没有会随对话更新、又会改变这类回答的字段，因此不参与缓存键。
+
+    失效策略：
+    - 条目超过 TTL 后在命中时删除
+    - 缓存版本（如主控提示词、模型名称的哈希）变化后，旧版本条目不再命中
+    - 时效性查询与依赖上文的追问不读也不写缓存，失败提示与只有摘要的回答不写缓存
+    - 可以调用 clear() 手动清空
+    """
+    def __init__(self, embedding=None, persist_directory: str = SEMANTIC_CACHE_DIR,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl_seconds: int = SEMANTIC_CACHE_TTL,
+                 version: str = ""):
+        # 依赖较重，只在启用语义缓存时导入
+        from langchain_chroma import Chroma
+        if embedding is None:
+            from langchain_openai import OpenAIEmbeddings
+            embedding = OpenAIEmbeddings(base_url=EMBEDDING_BASE_URL, model=EMBEDDING_MODEL)
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self.vectorstore = Chroma(
+            collection_name="semantic_cache",
+            embedding_function=embedding,
+            persist_directory=persist_directory,
+            collection_metadata={"hnsw:space": "cosine"},
+        )
+
+    def lookup(self, query: str) -> Optional[str]:
+        """
+        查找语义相近的历史回答
+
+        Args:
+            query (str): 用户输入
+
+        Returns:
+            Optional[str]: 命中时返回缓存的回答，否则返回 None
+        """
+        if not is_cacheable_query(query):
+            with self._lock:
+                self.skipped += 1
+            return None
+        try:
+            results = self.vectorstore.similarity_search_with_relevance_scores(
+                query.strip(), k=1, filter={"version": self.version}
+            )
+        except Exception as e:
+            print(f"语义缓存查询失败: {e}")
+            results = []
+        if results:
+            document, score = results[0]
+            if score >= self.threshold:
+                if time.time() - document.metadata.get("created_at", 0) <= self.ttl_seconds:
+                    with self._lock:
+                        self.hits += 1
+                    return document.metadata["answer"]
+                # 过期条目直接删除
+                self.vectorstore.delete(ids=[document.metadata["cache_id"]])
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def update(self, query: str, answer: str):
+        """把一轮完整回答写入语义缓存"""
+        if not is_cacheable_answer(answer) or not is_cacheable_query(query):
+            return
+        cache_id = str(uuid.uuid4())
+        try:
+            self.vectorstore.add_texts(
+                [query.strip()],
+                metadatas=[{
+                    "cache_id": cache_id,
+                    "query": query,
+                    "version": self.version,
+                    "answer": answer,
+                    "created_at": time.time(),
+                }],
+                ids=[cache_id],
+            )
+        except Exception as e:
+            print(f"语义缓存写入失败: {e}")
+
+    def clear(self):
+        """清空语义缓存"""
+        self.vectorstore.reset_collection()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+def make_cache_version(*parts: str) -> str:
+    """由提示词、模型名称等生成缓存版本号，任意一项变化都会使旧缓存失效"""
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+_caches: Dict[str, SemanticCache] = {}
+_caches_lock = threading.Lock()
+
+def get_semantic_cache(version: str = "") -> Optional[SemanticCache]:
+    """获取进程内共享的语义缓存实例（每个缓存版本一个），SEMANTIC_CACHE_ENABLED=0 时返回 None"""
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    with _caches_lock:
+        if version not in _caches:
+            _caches[version] = SemanticCache(version=version)
+        return _caches[version]
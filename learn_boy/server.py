@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import weakref
+from contextlib import asynccontextmanager
+from typing import Optional
+try:
+    from aiohttp import web
+except ImportError as e:
+    raise ImportError("HTTP 服务依赖 aiohttp，请先安装：pip install aiohttp") from e
+from metrics import TurnMetrics, get_metrics_registry
+
+# 智能学习助手的 HTTP 服务：
+# - POST /chat        {"session_id": "...", "message": "..."}，以 Server-Sent Events 逐段返回回复
+# - GET  /sessions/{session_id}   查看会话的对话历史与学习档案，会话不存在时返回 404
+# - GET  /health      查看并发、排队与会话缓存状态
+# - GET  /metrics     Prometheus 文本格式的耗时、token 与缓存指标（每轮的汇总随 done 事件返回）
+# 每个会话的对话记忆由 multi_agents_pro.get_session_memory 管理；同一会话的请求串行执行，
+# 不同会话并发执行，超过并发上限的请求排队，队列已满或等待超时返回 503。
+# 等待同一会话的上一轮结束也算排队，与等待执行名额共用队列上限和超时
+#
+# 依赖：aiohttp（pip install aiohttp），只有本服务使用，命令行与批量处理不需要安装。
+# 本地试运行：python server.py --fake
+
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_MAX_CONCURRENCY = int(os.getenv("SERVER_MAX_CONCURRENCY", "8"))   # 同时执行的对话轮数上限
+SERVER_MAX_QUEUE = int(os.getenv("SERVER_MAX_QUEUE", "100"))             # 排队等待的请求数上限
+SERVER_QUEUE_TIMEOUT = float(os.getenv("SERVER_QUEUE_TIMEOUT", "30"))    # 排队等待的最长时间（秒）
+
+class ServerBusyError(Exception):
+    """队列已满或排队超时"""
+
+class TurnScheduler:
+    """限制同时执行的对话轮数，超出上限的请求排队等待"""
+    def __init__(self, max_concurrency: int = SERVER_MAX_CONCURRENCY, max_queue: int = SERVER_MAX_QUEUE,
+                 queue_timeout: float = SERVER_QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @asynccontextmanager
+    async def slot(self, session_lock: Optional[asyncio.Lock] = None):
+        """
+        依次取得会话锁（同一会话串行）和一个执行名额，返回排队等待的时间（秒）
+
+        任一步需要等待时计入排队：受 max_queue 限制，两步合计的等待不超过 queue_timeout，
+        否则抛出 ServerBusyError
+        """
+        start = time.perf_counter()
+        deadline = start + self.queue_timeout
+        queued = False
+        held = []
+        try:
+            for lock in filter(None, (session_lock, self._semaphore)):
+                if not lock.locked():
+                    # 空闲时立即取得，不计入排队
+                    await lock.acquire()
+                    held.append(lock)
+                    continue
+                if not queued:
+                    if self.waiting >= self.max_queue:
+                        self.rejected += 1
+                        raise ServerBusyError("排队请求过多")
+                    self.waiting += 1
+                    queued = True
+                try:
+                    await asyncio.wait_for(lock.acquire(), timeout=max(deadline - time.perf_counter(), 0))
+                except asyncio.TimeoutError:
+                    self.rejected += 1
+                    raise ServerBusyError("排队等待超时")
+                held.append(lock)
+        except BaseException:
+            for lock in held:
+                lock.release()
+            raise
+        finally:
+            if queued:
+                self.waiting -= 1
+        self.active += 1
+        try:
+            yield time.perf_counter() - start
+        finally:
+            self.active -= 1
+            self.completed += 1
+            for lock in reversed(held):
+                lock.release()
+
+class QueueStream:
+    """BufferedStreamWriter 的输出目标：把文本片段放入队列，由 SSE 响应发送"""
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+
+    def write(self, text: str):
+        self.queue.put_nowait(text)
+
+    def flush(self):
+        pass
+
+def sse_event(event: str, data: dict) -> bytes:
+    """编码一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+class LearningAssistantServer:
+    def __init__(self, multi_agents_module, scheduler: TurnScheduler = None):
+        self.agents = multi_agents_module
+        self.scheduler = scheduler or TurnScheduler()
+        # 同一会话的请求串行执行；不再使用的会话锁随引用释放自动回收
+        self._session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def _session_lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._session_locks[session_id] = lock
+        return lock
+
+    async def _run_turn(self, conversation_memory, user_input: str, queue: asyncio.Queue,
+                        turn_metrics: TurnMetrics) -> str:
+        """执行一轮对话并更新会话记忆，结束时向队列放入 None"""
+        try:
+            writer = self.agents.BufferedStreamWriter(stream=QueueStream(queue))
+            self.agents.remember_user_message(conversation_memory, user_input)
+            response = await self.agents.arun_master_agent_stream(user_input, conversation_memory, writer, turn_metrics)
+            if response:
+                conversation_memory.add_message("assistant", response)
+            return response
+        finally:
+            queue.put_nowait(None)
+
+    async def handle_chat(self, request: web.Request) -> web.StreamResponse:
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.json_response({"error": "请求体必须是 JSON"}, status=400)
+        user_input = (body.get("message") or "").strip()
+        if not user_input:
+            return web.json_response({"error": "message 不能为空"}, status=400)
+        session_id = body.get("session_id") or uuid.uuid4().hex
+
+        try:
+            async with self.scheduler.slot(self._session_lock(session_id)) as queue_time:
+                conversation_memory = await asyncio.to_thread(self.agents.get_session_memory, session_id)
+                response = web.StreamResponse(headers={
+                    "Content-Type": "text/event-stream",
+                    "Cache-Control": "no-cache",
+                    "X-Accel-Buffering": "no",
+                })
+                await response.prepare(request)
+                await response.write(sse_event("session", {"session_id": session_id, "queue_time": queue_time}))
+
+                start = time.perf_counter()
+                queue: asyncio.Queue = asyncio.Queue()
+                turn_metrics = TurnMetrics()
+                turn_metrics.add_queue_time("server", queue_time)
+                turn = asyncio.create_task(self._run_turn(conversation_memory, user_input, queue, turn_metrics))
+                try:
+                    while (text := await queue.get()) is not None:
+                        await response.write(sse_event("token", {"text": text}))
+                    full_response = await turn
+                except (ConnectionResetError, asyncio.CancelledError):
+                    # 客户端断开连接时停止本轮对话
+                    turn.cancel()
+                    raise
+                await response.write(sse_event("done", {
+                    "response": full_response,
+                    "elapsed": time.perf_counter() - start,
+                    "metrics": turn_metrics.finish(),
+                }))
+                await response.write_eof()
+                return response
+        except ServerBusyError as e:
+            return web.json_response({"error": f"服务繁忙：{e}"}, status=503, headers={"Retry-After": "1"})
+
+    async def handle_session(self, request: web.Request) -> web.Response:
+        session_id = request.match_info["session_id"]
+        # 查看不应新建会话，否则任意 id 的 GET 都会在会话库中留下空会话
+        conversation_memory = await asyncio.to_thread(self.agents.get_session_memory, session_id, False)
+        if conversation_memory is None:
+            return web.json_response({"error": f"会话 {session_id} 不存在"}, status=404)
+        return web.json_response({
+            "conversation_history": conversation_memory.conversation_history,
+            "user_profile": conversation_memory.user_profile,
+        })
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "active": self.scheduler.active,
+            "waiting": self.scheduler.waiting,
+            "completed": self.scheduler.completed,
+            "rejected": self.scheduler.rejected,
+            "max_concurrency": self.scheduler.max_concurrency,
+            "sessions": self.agents.get_session_manager().stats(),
+        })
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=get_metrics_registry().render_prometheus(),
+                            content_type="text/plain", charset="utf-8")
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/chat", self.handle_chat)
+        app.router.add_get("/sessions/{session_id}", self.handle_session)
+        app.router.add_get("/health", self.handle_health)
+        app.router.add_get("/metrics", self.handle_metrics)
+        return app
+
+def main():
+    parser = argparse.ArgumentParser(description="智能学习助手 HTTP/SSE 服务")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--max-concurrency", type=int, default=SERVER_MAX_CONCURRENCY)
+    parser.add_argument("--max-queue", type=int, default=SERVER_MAX_QUEUE)
+    parser.add_argument("--fake", action="store_true", help="使用离线模拟模型，用于本地测试")
+    parser.add_argument("--fake-latency", type=float, default=0.2, help="模拟模型每次调用的延迟（秒）")
+    args = parser.parse_args()
+
+    if args.fake:
+        # 模拟模式不访问真实服务，但模块导入时会构造客户端，需要占位的密钥
+        os.environ.setdefault("DEEPSEEK_API_KEY", "fake")
+        os.environ.setdefault("TAVILY_API_KEY", "fake")
+    import multi_agents_pro
+    if args.fake:
+        from fake_models import install_fake_master_agents
+        install_fake_master_agents(multi_agents_pro, args.fake_latency)
+
+    # 服务端阶段创建调度器，保证信号量绑定到服务的事件循环
+    async def create_app() -> web.Application:
+        scheduler = TurnScheduler(max_concurrency=args.max_concurrency, max_queue=args.max_queue)
+        return LearningAssistantServer(multi_agents_pro, scheduler).make_app()
+
+    print(f"🚀 智能学习助手服务已启动：http://{args.host}:{args.port}（并发上限 {args.max_concurrency}）")
+    web.run_app(create_app(), host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
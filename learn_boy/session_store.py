@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import threading
+from datetime import datetime
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from data_dir import data_path
+
+# 多用户会话存储：
+# - 所有会话的记忆保存在同一个 SQLite 库中，按会话 id 建索引
+# - 写操作先进入内存队列，由后台线程按批写入（一批一个事务），调用方不等待磁盘
+# - SessionManager 只在内存中保留最近活跃的会话（LRU），冷会话按需从 SQLite 读回
+
+SESSION_DB = os.getenv("SESSION_DB", data_path("sessions.sqlite3"))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1000"))          # 内存中最多保留的会话数
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "0.5"))  # 后台批量写入间隔（秒）
+SESSION_BATCH_SIZE = int(os.getenv("SESSION_BATCH_SIZE", "200"))            # 队列达到该长度时立即写入
+SESSION_COMPACT_EVERY = int(os.getenv("SESSION_COMPACT_EVERY", "200"))      # 每个会话追加多少条消息后清理窗口外的旧消息
+
+class SessionStore:
+    """基于 SQLite 的会话存储，写操作在后台批量提交，可被多个线程共享"""
+    def __init__(self, db_path: str = SESSION_DB, flush_interval: float = SESSION_FLUSH_INTERVAL,
+                 batch_size: int = SESSION_BATCH_SIZE):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.batches = 0
+        self.flushed_ops = 0
+        self._pending: List[Tuple[str, str, Any]] = []
+        self._pending_sessions = set()  # 队列中有未写入操作的会话
+        self._pending_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                user_profile TEXT,
+                session_start_time TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                history_summary TEXT,
+                summary_until TEXT
+            )
+        """)
+        # 旧版本创建的库没有滚动摘要的两列，补上
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+        for column in ("history_summary", "summary_until"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE sessions ADD COLUMN {column} TEXT")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                message TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id)")
+        self._conn.commit()
+        self._flusher = threading.Thread(target=self._flush_loop, name="session-store-flusher", daemon=True)
+        self._flusher.start()
+
+    def enqueue(self, op: str, session_id: str, payload: Any):
+        """
+        把写操作放入队列，由后台线程批量写入
+
+        Args:
+            op (str): message（追加消息）、profile（更新档案）、summary（更新滚动摘要）或 reset（用给定状态重写会话）
+            session_id (str): 会话 id
+            payload (Any): 已序列化的数据，入队时序列化，避免写入前被调用方修改
+        """
+        with self._pending_lock:
+            self._pending.append((op, session_id, payload))
+            self._pending_sessions.add(session_id)
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+
+    def _apply(self, op: str, session_id: str, payload: Any, now: float):
+        if op == "message":
+            message_json, timestamp = payload
+            self._conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, user_profile, session_start_time, updated_at) "
+                "VALUES (?, NULL, ?, ?)", (session_id, timestamp, now)
+            )
+            self._conn.execute("INSERT INTO messages (session_id, message) VALUES (?, ?)", (session_id, message_json))
+        elif op == "profile":
+            profile_json, session_start_time = payload
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, user_profile, session_start_time, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET user_profile = excluded.user_profile",
+                (session_id, profile_json, session_start_time, now)
+            )
+        elif op == "summary":
+            history_summary, summary_until, session_start_time = payload
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, user_profile, session_start_time, updated_at, history_summary, "
+                "summary_until) VALUES (?, NULL, ?, ?, ?, ?) ON CONFLICT(session_id) DO UPDATE SET "
+                "history_summary = excluded.history_summary, summary_until = excluded.summary_until",
+                (session_id, session_start_time, now, history_summary, summary_until)
+            )
+        elif op == "reset":
+            profile_json, session_start_time, messages, history_summary, summary_until = payload
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, user_profile, session_start_time, updated_at, "
+                "history_summary, summary_until) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, profile_json, session_start_time, now, history_summary, summary_until)
+            )
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.executemany("INSERT INTO messages (session_id, message) VALUES (?, ?)",
+                                   [(session_id, message_json) for message_json in messages])
+        self._conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (now, session_id))
+
+    def flush(self):
+        """把队列中的写操作按顺序在一个事务中写入"""
+        # 持有数据库锁再取队列，保证并发调用 flush 时各批次按入队顺序提交
+        with self._db_lock:
+            with self._pending_lock:
+                ops, self._pending = self._pending, []
+                self._pending_sessions = set()
+            if not ops:
+                return
+            now = time.time()
+            try:
+                with self._conn:
+                    for op, session_id, payload in ops:
+                        self._apply(op, session_id, payload, now)
+            except Exception:
+                # 事务已回滚，把这批操作放回队首，下次 flush 按原顺序重试，不丢数据
+                with self._pending_lock:
+                    self._pending = ops + self._pending
+                    self._pending_sessions.update(session_id for _, session_id, _ in ops)
+                raise
+            self.batches += 1
+            self.flushed_ops += len(ops)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"会话存储批量写入失败: {e}")
+
+    def load_session(self, session_id: str, max_messages: int) -> Optional[Dict[str, Any]]:
+        """
+        读取会话的学习档案和最近的 max_messages 条消息
+
+        Returns:
+            Optional[Dict[str, Any]]: 与 ConversationMemory.to_dict() 相同结构的数据，会话不存在时返回 None
+        """
+        # 该会话还有排队的写操作时先写入，保证刚被淘汰又马上访问的会话能读到最新数据
+        with self._pending_lock:
+            has_pending = session_id in self._pending_sessions
+        if has_pending:
+            self.flush()
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT user_profile, session_start_time, history_summary, summary_until FROM sessions "
+                "WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT message FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (session_id, max_messages)
+            ).fetchall()
+        user_profile, session_start_time, history_summary, summary_until = row
+        return {
+            "conversation_history": [json.loads(message) for (message,) in reversed(rows)],
+            "user_profile": json.loads(user_profile) if user_profile else None,
+            "session_start_time": session_start_time,
+            "history_summary": history_summary or "",
+            "summary_until": summary_until,
+        }
+
+    def __len__(self) -> int:
+        self.flush()
+        with self._db_lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def pending(self) -> int:
+        with self._pending_lock:
+            return len(self._pending)
+
+    def close(self):
+        """停止后台线程并写入剩余的操作"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._flusher.join()
+        self.flush()
+
+class SessionJournal:
+    """把 SessionStore 中的一个会话适配为 ConversationMemory 的存储（接口与 MemoryJournal 相同）"""
+    def __init__(self, store: SessionStore, session_id: str, compact_every: int = SESSION_COMPACT_EVERY):
+        self.store = store
+        self.session_id = session_id
+        self.compact_every = compact_every
+        self.records_since_compaction = 0
+
+    def append_message(self, message: Dict[str, Any]):
+        self.store.enqueue("message", self.session_id,
+                           (json.dumps(message, ensure_ascii=False), message.get("timestamp", "")))
+        self.records_since_compaction += 1
+
+    def append_profile(self, user_profile: Dict[str, Any]):
+        self.store.enqueue("profile", self.session_id, (json.dumps(user_profile, ensure_ascii=False), datetime.now().isoformat()))
+
+    def append_summary(self, history_summary: str, summary_until: Optional[str]):
+        self.store.enqueue("summary", self.session_id, (history_summary, summary_until, datetime.now().isoformat()))
+
+    def should_compact(self) -> bool:
+        return self.records_since_compaction >= self.compact_every
+
+    def compact(self, memory_data: Dict[str, Any]):
+        """用当前记忆状态重写会话，删除窗口外的旧消息"""
+        messages = [json.dumps(message, ensure_ascii=False) for message in memory_data["conversation_history"]]
+        self.store.enqueue("reset", self.session_id, (
+            json.dumps(memory_data["user_profile"], ensure_ascii=False),
+            memory_data["session_start_time"],
+            messages,
+            memory_data.get("history_summary") or "",
+            memory_data.get("summary_until"),
+        ))
+        self.records_since_compaction = 0
+
+    def load(self, max_messages: int) -> Optional[Dict[str, Any]]:
+        return self.store.load_session(self.session_id, max_messages)
+
+    def close(self):
+        pass
+
+class SessionManager:
+    """
+    按会话 id（用户/线程）管理 ConversationMemory。
+    最近活跃的会话保留在内存中，超出容量时淘汰最久未访问的会话；
+    会话的每次修改都已进入写队列，淘汰时无需额外写盘。
+    同一会话的请求需要由调用方串行处理（ConversationMemory 本身不是线程安全的）。
+    """
+    def __init__(self, memory_factory: Callable[[SessionJournal], Any], store: Optional[SessionStore] = None,
+                 max_sessions: int = SESSION_CACHE_SIZE):
+        self.memory_factory = memory_factory
+        self.store = store or SessionStore()
+        self.max_sessions = max_sessions
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sessions: "OrderedDict[str, Any]" = OrderedDict()
+        # _lock 只保护内存中的会话表；从 SQLite 读取会话时持有该会话自己的加载锁，
+        # 其他会话的 get（包括命中）不必等待，同一会话的并发加载只读一次
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        atexit.register(self.close)
+
+    def _cached(self, session_id: str):
+        """在内存中查找会话，调用方需持有 _lock"""
+        conversation_memory = self._sessions.get(session_id)
+        if conversation_memory is not None:
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+        return conversation_memory
+
+    def get(self, session_id: str, create: bool = True):
+        """获取会话的记忆，不在内存中时从 SQLite 读取；会话不存在时新建，create 为 False 时返回 None"""
+        with self._lock:
+            conversation_memory = self._cached(session_id)
+            if conversation_memory is not None:
+                return conversation_memory
+            load_lock = self._loading.setdefault(session_id, threading.Lock())
+        with load_lock:
+            with self._lock:
+                # 等待期间可能已由其他线程加载完成
+                conversation_memory = self._cached(session_id)
+                if conversation_memory is not None:
+                    return conversation_memory
+                self.misses += 1
+            journal = SessionJournal(self.store, session_id)
+            conversation_memory = self.memory_factory(journal)
+            memory_data = journal.load(conversation_memory.max_history * 2)
+            if memory_data is not None:
+                conversation_memory.restore(memory_data)
+            with self._lock:
+                if memory_data is None and not create:
+                    # 只是查看时不建会话，也不占用缓存
+                    self._loading.pop(session_id, None)
+                    return None
+                self._sessions[session_id] = conversation_memory
+                self._loading.pop(session_id, None)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            return conversation_memory
+
+    def stats(self) -> Dict[str, Any]:
+        """返回会话缓存与批量写入统计"""
+        lookups = self.hits + self.misses
+        return {
+            "cached_sessions": len(self._sessions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "pending_writes": self.store.pending(),
+            "batches": self.store.batches,
+            "flushed_ops": self.store.flushed_ops,
+        }
+
+    def close(self):
+        """写入所有排队的修改"""
+        self.store.close()
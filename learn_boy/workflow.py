@@ -3,6 +3,7 @@ import getpass
 
 from langchain_deepseek import ChatDeepSeek
 from dotenv import load_dotenv
+from model_registry import deepseek_client_kwargs
 
 # 加载.env文件中的环境变量
 load_dotenv()
@@ -12,7 +13,7 @@ llm = ChatDeepSeek(
     temperature=1.3,
     max_tokens=None,
     timeout=None,
-    max_retries=2,
+    **deepseek_client_kwargs(),  # 共享连接池，经过进程级限流，429 由限流器退避重试
     # api_key="...",
     # other params...
 )